@@ -114,6 +114,22 @@ stderr_logfile=/proc/1/fd/1
 stderr_logfile_maxbytes=0
 EOF
 
+# warm behave executor, forks pre-imported behave processes for run_browser
+# used when COMETA_BEHAVE_WARM_EXECUTOR_ENABLED configuration is True
+cat <<EOF > /etc/supervisor/conf.d/behave-executor.conf
+[program:behave-executor]
+environment=PYTHONUNBUFFERED=1
+command=python -m schedules.tasks.behave_executor serve
+directory=/opt/code/behave_django
+stopsignal=TERM
+autostart=true
+autorestart=true
+stdout_logfile=/proc/1/fd/1
+stdout_logfile_maxbytes=0
+stderr_logfile=/proc/1/fd/1
+stderr_logfile_maxbytes=0
+EOF
+
 # start supervisord to spin django-rq workers.
 supervisord -c /etc/supervisor/supervisord.conf
 
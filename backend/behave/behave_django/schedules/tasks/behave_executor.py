@@ -0,0 +1,343 @@
+# Warm Behave executor
+#
+# Long lived process started by supervisord next to the django-rq workers. It imports
+# selenium, cv2, pandas, the cometa_itself tools modules, etc. once and then forks a
+# child for every feature execution requested by run_browser, so each run starts
+# from an already warmed interpreter instead of "bash run_remote_from_django.sh"
+# which pays the full interpreter start and imports before the first step.
+#
+# Usage:
+#   python -m schedules.tasks.behave_executor serve
+#   python -m schedules.tasks.behave_executor benchmark [iterations]
+#
+# Protocol (unix socket, one JSON document per line):
+#   client -> {"action": "run", "env": {...}, "json_path": "..."}
+#   server -> {"pid": <pid of the behave process>}
+#   server -> {"returncode": <int>, "output": "<stdout of behave>"}
+#
+#   client -> {"action": "ping"}
+#   server -> {"pid": <pid>}
+
+import importlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.append("/opt/code/behave_django")
+sys.path.append("/opt/code/cometa_itself/steps")
+
+from utility.common import get_logger
+from utility.configurations import CONFIGURATION_UPDATE_WATCHED_FILE
+
+logger = get_logger()
+
+EXECUTOR_SOCKET_PATH = os.getenv(
+    "BEHAVE_EXECUTOR_SOCKET_PATH", "/tmp/cometa_behave_executor.sock"
+)
+# maximum number of behave processes forked at the same time, further requests wait
+EXECUTOR_MAX_CHILDREN = int(os.getenv("BEHAVE_EXECUTOR_MAX_CHILDREN", 40))
+# seconds to wait while connecting to the executor before falling back to subprocess
+EXECUTOR_CONNECT_TIMEOUT = 3
+BEHAVE_HOME_DIR = "/opt/code"
+
+# Modules imported by environment.py, actions.py and the ee steps before the first
+# step is executed. Step modules themselves (actions.py, *_actions.py) are NOT imported
+# here because behave registers step definitions when it loads them, importing them in
+# the parent would register every step twice in the forked child.
+WARM_MODULES = [
+    "behave.__main__",
+    "behave.runner",
+    "behave.model",
+    "selenium.webdriver",
+    "selenium.webdriver.support.ui",
+    "requests",
+    "numpy",
+    "cv2",
+    "pandas",
+    "openpyxl",
+    "PIL.Image",
+    "bs4",
+    "slugify",
+    "html_diff",
+    "Crypto.Cipher.AES",
+    "jq",
+    "faker",
+    "docker",
+    "kubernetes",
+    "appium.webdriver",
+    "utility.config_handler",
+    "utility.functions",
+    "utility.encryption",
+    "utility.configurations",
+    "modules.ai",
+    "tools.models",
+    "tools.common",
+    "tools.common_functions",
+    "tools.service_manager",
+    "tools.image_processing",
+    "tools.screenshot_workers",
+]
+
+
+def warm_up():
+    """Import every module listed in WARM_MODULES, returns the list of modules that failed"""
+    failed = []
+    for module_name in WARM_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except Exception as exception:
+            logger.warning(f"Unable to pre-import {module_name}: {str(exception)}")
+            failed.append(module_name)
+    return failed
+
+
+def _configuration_tracker_mtime():
+    # the file is touched by django when configurations are updated
+    try:
+        return os.path.getmtime(CONFIGURATION_UPDATE_WATCHED_FILE)
+    except OSError:
+        return None
+
+
+def _send(connection, payload):
+    connection.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+
+
+def execute_feature(env, json_path):
+    """
+    Runs behave in the current (forked) process, does the same as run_remote_from_django.sh
+    Returns the behave exit code and its stdout
+    """
+    with open(json_path) as file:
+        feature_data = file.read()
+    feature_json = json.loads(feature_data)
+
+    os.environ.update(env)
+    # export variables that will be used in environment and actions
+    os.environ["SCREENSHOTS"] = str(feature_json.get("screenshot"))
+    os.environ["COMPARES"] = str(feature_json.get("compare"))
+    os.environ["COMETA_FEATURE_ID"] = str(feature_json.get("feature_id"))
+    os.environ["FEATURE_DATA"] = feature_data
+
+    folder_path = env["FOLDERPATH"]
+    # needed later when doing image comparison
+    os.chdir(folder_path)
+    os.makedirs(os.path.join(folder_path, "steps"), exist_ok=True)
+    # Create symbolic links
+    for source, target in (
+        ("cometa_itself/steps/actions.py", "steps/actions.py"),
+        ("cometa_itself/environment.py", "environment.py"),
+    ):
+        target = os.path.join(folder_path, target)
+        if os.path.lexists(target):
+            os.remove(target)
+        os.symlink(os.path.join(BEHAVE_HOME_DIR, source), target)
+
+    behave_args = [
+        env["FEATURE_FILE"],
+        "--summary", "--junit", "--junit-directory",
+        f"{folder_path}/junit_reports/", "--no-skipped",
+        "--quiet", "--no-multiline", "--format=null",
+    ]
+    # environment.py only loads configurations when behave is called with arguments
+    sys.argv = ["behave"] + behave_args
+
+    with tempfile.TemporaryFile() as output:
+        sys.stdout.flush()
+        stdout_fd = os.dup(1)
+        os.dup2(output.fileno(), 1)
+        try:
+            from behave.__main__ import main as behave_main
+            returncode = behave_main(behave_args)
+        except SystemExit as exit_exception:
+            returncode = exit_exception.code if isinstance(exit_exception.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.stdout.flush()
+            os.dup2(stdout_fd, 1)
+            os.close(stdout_fd)
+        output.seek(0)
+        out = output.read().decode("utf-8", errors="replace")
+
+    return returncode or 0, out
+
+
+class BehaveExecutorHandler(socketserver.StreamRequestHandler):
+
+    # Runs inside the forked child
+    def handle(self):
+        # forked child should behave like a normal process when receiving SIGTERM
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        request = json.loads(self.rfile.readline().decode("utf-8"))
+        _send(self.connection, {"pid": os.getpid()})
+
+        if request.get("action") != "run":
+            return
+
+        returncode, out = execute_feature(request["env"], request["json_path"])
+        _send(self.connection, {"returncode": returncode, "output": out})
+
+
+class BehaveExecutorServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    max_children = EXECUTOR_MAX_CHILDREN
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.configuration_mtime = _configuration_tracker_mtime()
+
+    def service_actions(self):
+        super().service_actions()
+        # Modules imported in the parent read some configurations at import time,
+        # when configurations change exit and let supervisord start a freshly warmed executor
+        if _configuration_tracker_mtime() != self.configuration_mtime:
+            logger.info("Configurations updated, restarting behave executor")
+            raise SystemExit(0)
+
+
+def serve():
+    from utility.configurations import load_configurations
+
+    start = time.time()
+    load_configurations()
+    failed = warm_up()
+    logger.info(
+        f"Behave executor warmed up in {time.time() - start:.2f}s, "
+        f"{len(WARM_MODULES) - len(failed)}/{len(WARM_MODULES)} modules imported"
+    )
+
+    if os.path.exists(EXECUTOR_SOCKET_PATH):
+        os.remove(EXECUTOR_SOCKET_PATH)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with BehaveExecutorServer(EXECUTOR_SOCKET_PATH, BehaveExecutorHandler) as server:
+        logger.info(f"Behave executor listening on {EXECUTOR_SOCKET_PATH}")
+        try:
+            server.serve_forever(poll_interval=1)
+        finally:
+            if os.path.exists(EXECUTOR_SOCKET_PATH):
+                os.remove(EXECUTOR_SOCKET_PATH)
+
+
+class WarmExecution:
+    """
+    Client side of the executor, used by run_browser
+    Raises ConnectionError when the executor is not available, so caller can fall back to subprocess
+    """
+
+    def __init__(self, env, json_path):
+        self.pid = None
+        self.returncode = None
+        self.output = ""
+        self.__connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__connection.settimeout(EXECUTOR_CONNECT_TIMEOUT)
+        try:
+            self.__connection.connect(EXECUTOR_SOCKET_PATH)
+            _send(self.__connection, {"action": "run", "env": env, "json_path": json_path})
+            self.__reader = self.__connection.makefile("r", encoding="utf-8")
+            self.pid = json.loads(self.__reader.readline())["pid"]
+        except (OSError, ValueError, KeyError) as exception:
+            self.__connection.close()
+            raise ConnectionError(f"Behave executor not available: {str(exception)}")
+        # feature execution can take hours, job timeout is handled by rq
+        self.__connection.settimeout(None)
+
+    # same usage as subprocess.Popen, i.e. "with WarmExecution(...) as process:"
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.__connection.close()
+
+    def wait(self):
+        line = self.__reader.readline()
+        self.__connection.close()
+        if not line:
+            # executor child was killed before sending the result
+            self.returncode = 1
+            self.output = "Behave executor process exited without result"
+        else:
+            result = json.loads(line)
+            self.returncode = result["returncode"]
+            self.output = result["output"]
+        return self.returncode
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def ping():
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(EXECUTOR_CONNECT_TIMEOUT)
+    try:
+        connection.connect(EXECUTOR_SOCKET_PATH)
+        _send(connection, {"action": "ping"})
+        return json.loads(connection.makefile("r").readline())["pid"]
+    finally:
+        connection.close()
+
+
+def benchmark(iterations=10):
+    """
+    Compares the time to get an interpreter with all WARM_MODULES imported,
+    cold: new python subprocess importing everything (what run_remote_from_django.sh pays)
+    warm: fork of the running executor (requires "serve" to be running)
+    """
+    import_script = (
+        "import sys, importlib;"
+        "sys.path.append('/opt/code/behave_django');"
+        "sys.path.append('/opt/code/cometa_itself/steps');\n"
+        f"for m in {WARM_MODULES!r}:\n"
+        "    try: importlib.import_module(m)\n"
+        "    except Exception: pass\n"
+    )
+
+    def measure(function):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(name, timings):
+        timings = sorted(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(
+            f"{name:<20} mean: {statistics.mean(timings):9.2f}ms  "
+            f"median: {statistics.median(timings):9.2f}ms  p95: {p95:9.2f}ms"
+        )
+
+    print(f"Startup latency over {iterations} iterations")
+    cold = measure(lambda: subprocess.run([sys.executable, "-c", import_script], check=False))
+    report("cold subprocess", cold)
+    try:
+        warm = measure(ping)
+    except OSError as exception:
+        print(f"warm worker          executor not reachable on {EXECUTOR_SOCKET_PATH}: {exception}")
+        return
+    report("warm worker", warm)
+    print(f"speedup              {statistics.median(cold) / statistics.median(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "serve"
+    if command == "serve":
+        serve()
+    elif command == "benchmark":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10)
+    else:
+        print(f"Unknown command {command}, use serve or benchmark")
+        sys.exit(1)
@@ -13,6 +13,8 @@ sys.path.append("/opt/code/behave_django")
 from utility.common import *
 from utility.config_handler import *
 from utility.common import *
+from utility.configurations import ConfigurationManager
+from schedules.tasks.behave_executor import WarmExecution
 
 # setup logging
 logger = logging.getLogger(__name__)
@@ -97,15 +99,29 @@ def run_browser(env, **kwargs):
         raise Exception(f"Script file does not exist: {settings.RUNTEST_COMMAND_PATH}")
     
     # Start running feature with current browser
-    with subprocess.Popen(["bash", settings.RUNTEST_COMMAND_PATH, json_path], env=all_env, stdout=subprocess.PIPE) as process:
+    # use the warm behave executor if enabled and running, otherwise start a new bash + behave process
+    process = None
+    if ConfigurationManager.get_configuration("COMETA_BEHAVE_WARM_EXECUTOR_ENABLED", "False") == "True":
+        try:
+            process = WarmExecution(all_env, json_path)
+            logger.debug("Feature execution started in the warm behave executor")
+        except ConnectionError as err:
+            logger.warning(f"{str(err)}, falling back to {settings.RUNTEST_COMMAND_PATH}")
+    if process is None:
+        process = subprocess.Popen(["bash", settings.RUNTEST_COMMAND_PATH, json_path], env=all_env, stdout=subprocess.PIPE)
+
+    with process:
         try:
             logger.debug(f"Process id: {process.pid}")
             # wait for the process to finish
             process.wait()
             logger.debug(f"Process Return Code: {process.returncode}")
             if process.returncode > 0:
-                out, _ = process.communicate()
-                out = str(out.decode('utf-8'))
+                if isinstance(process, WarmExecution):
+                    out = process.output
+                else:
+                    out, _ = process.communicate()
+                    out = str(out.decode('utf-8'))
                 logger.error(f"Error ocurred during the feature execution ... please check the output:\n{out}")
                 if 'Parser failure' in out:
                     raise Exception("Parsing error in the feature, please recheck the steps.")
@@ -140,8 +156,12 @@ def run_browser(env, **kwargs):
             # job was timed out, kill the process
             logger.error("Job timed out.")
             logger.exception(err)
-            with subprocess.Popen(f"ps -o pid --ppid {process.pid} --noheaders | xargs kill -15", shell=True) as p2:
-                p2.wait() 
+            if isinstance(process, WarmExecution):
+                # warm executor pid is the behave process itself
+                process.terminate()
+            else:
+                with subprocess.Popen(f"ps -o pid --ppid {process.pid} --noheaders | xargs kill -15", shell=True) as p2:
+                    p2.wait() 
             process.wait()
             job: Job = get_current_job()
             send_stop_job_command(django_rq.get_connection(), job.id)
@@ -15,7 +15,6 @@ import hashlib
 import os, pickle
 from selenium.common.exceptions import InvalidCookieDomainException
 import copy
-from concurrent.futures import ThreadPoolExecutor
 from behave.model_core import Status
 
 sys.path.append("/opt/code/behave_django")
@@ -30,6 +29,11 @@ from utility.encryption import *
 from utility.configurations import ConfigurationManager, load_configurations
 from modules.ai import AI
 from tools.models import Condition
+from tools.event_client import get_event_client
+from tools.screenshot_workers import drain_screenshot_pool
+from tools.common_functions import get_variable_substitution
+from tools.common import load_selector_strategies
+from tools.network_logs import NetworkLogAnalyzer
 # from tools.kubernetes_service import KubernetesServiceManager
 
 LOGGER_FORMAT = "\33[96m[%(asctime)s.%(msecs)03d][%(feature_id)s][%(current_step)s/%(total_steps)s][%(levelname)s][%(filename)s:%(lineno)d](%(funcName)s) -\33[0m %(message)s"
@@ -156,8 +160,10 @@ def error_handling(*_args, **_kwargs):
                             headers={'Host': 'cometa.local'})
 
                     # let the front user know that the feature has been failed
+                    # send pending step events first so error is the last message received by front
+                    get_event_client().flush()
                     logger.debug("Sending a error websocket....")
-                    request = requests.post(f'{get_cometa_socket_url()}/feature/%s/error' % args[0].feature_id, data={
+                    request = get_event_client().session.post(f'{get_cometa_socket_url()}/feature/%s/error' % args[0].feature_id, data={
                         "browser_info": json.dumps(args[0].browser_info),
                         "feature_result_id": os.environ['feature_result_id'],
                         "run_id": os.environ['feature_run'],
@@ -263,6 +269,8 @@ def before_all(context):
     # logger.debug(context.VARIABLES)
     # job parameters if executed using schedule step
     context.PARAMETERS = os.environ["PARAMETERS"]
+    # index variables and job parameters once, used by @done to replace $VAR, ${VAR}, %index and %param in every step
+    get_variable_substitution(context)
     # telegram notification data if executed from telegram
     telegram_env = os.environ.get("telegram_notification", "{}")
     context.telegram_notification = json.loads(telegram_env)
@@ -362,10 +370,15 @@ def before_all(context):
         "run_id": os.environ["feature_run"],
         "datetime": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
     }
-    request = requests.get(f'{get_cometa_socket_url()}/feature/%s/initializing' % str(context.feature_id), data=payload)
+    # keep-alive session and batched websocket events used during the whole execution
+    context.event_client = get_event_client()
+    request = context.event_client.session.get(f'{get_cometa_socket_url()}/feature/%s/initializing' % str(context.feature_id), data=payload)
 
 
     context.LAST_STEP_VARIABLE_AND_VALUE = None
+    # selector types that found each selector in the last executions, tried first by waitSelectorOld
+    context.selector_strategies = load_selector_strategies(context)
+    context.step_selector_strategies = {}
     
     # ################# MOBILE DEVICES RELATED SETINGS ################
     # keeps track of mobile devices driver, so that test can be performed in the multiple mobiles devices
@@ -608,6 +621,7 @@ def before_all(context):
         response =  requests.get(f'{get_cometa_backend_url()}/api/security/vulnerable_headers/', headers={'Host': 'cometa.local'})
         logger.info("vulnerable headers info received")
         context.vulnerability_headers_info = response.json()["results"]
+        context.network_log_analyzer = NetworkLogAnalyzer(context.vulnerability_headers_info)
         logger.info("stored in the context")
 
     options.add_argument('--enable-logging')
@@ -656,7 +670,8 @@ def before_all(context):
     context.tempfiles = [
         execution_data_file,
     ]
-    context.network_responses = []
+    if hasattr(context, "network_log_analyzer"):
+        context.tempfiles.append(context.network_log_analyzer.spill_path)
     context.test_conditions_list: list[Condition] = []
 
     # call update task to create a task with pid.
@@ -719,13 +734,13 @@ def before_all(context):
         "browser": context.browser_info
     }
     # update feature_result with session_id
-    requests.patch(f'{get_cometa_backend_url()}/api/feature_results/', json=data, headers=headers)
+    context.event_client.session.patch(f'{get_cometa_backend_url()}/api/feature_results/', json=data, headers=headers)
 
 
 
     # FIXME Need to understand how Live screen will behave when the browser information is not send to socket
     # send a websocket request about that feature has been started
-    request = requests.get(f'{get_cometa_socket_url()}/feature/%s/started' % context.feature_id, data={
+    request = context.event_client.session.get(f'{get_cometa_socket_url()}/feature/%s/started' % context.feature_id, data={
         "user_id": context.PROXY_USER['user_id'],
         "browser_info": json.dumps(context.browser_info),
         "feature_result_id": os.environ['feature_result_id'],
@@ -810,8 +825,11 @@ def after_all(context):
             except Exception as err:
                 logger.error(f"Unable to stop the mobile session, Mobile details : {mobile['driver']}")
                 logger.error(str(err))
-    # testcase has finished, send websocket about processing data
-    request = requests.get(f'{get_cometa_socket_url()}/feature/%s/processing' % context.feature_id, data={
+    # testcase has finished, wait for the screenshots still being processed,
+    # then send pending step events and websocket about processing data
+    drain_screenshot_pool()
+    context.event_client.flush()
+    request = context.event_client.session.get(f'{get_cometa_socket_url()}/feature/%s/processing' % context.feature_id, data={
         "user_id": context.PROXY_USER['user_id'],
         "browser_info": json.dumps(context.browser_info),
         "feature_result_id": os.environ['feature_result_id'],
@@ -978,7 +996,7 @@ def after_all(context):
     logger.debug(f"Status being sent to backend: {data.get('status', 'Unknown')}")
     
     # send the patch request
-    response = requests.patch(f'{get_cometa_backend_url()}/api/feature_results/', json=data, headers=headers)
+    response = context.event_client.session.patch(f'{get_cometa_backend_url()}/api/feature_results/', json=data, headers=headers)
     logger.debug(f"Backend response status: {response.status_code}")
     if response.status_code != 200:
         logger.error(f"Backend response error: {response.text}")
@@ -986,7 +1004,7 @@ def after_all(context):
     logger.debug("\33[92m" + "FeatureResult ran successfully!" + "\33[0m")
 
     # get the final result for the feature_result
-    request_info = requests.get(f"{get_cometa_backend_url()}/api/feature_results/%s" % os.environ['feature_result_id'],
+    request_info = context.event_client.session.get(f"{get_cometa_backend_url()}/api/feature_results/%s" % os.environ['feature_result_id'],
                                 headers=headers)
     
     # Log the feature result info being sent to WebSocket
@@ -998,7 +1016,9 @@ def after_all(context):
         logger.error(f"Failed to get feature result info: {request_info.status_code} - {request_info.text}")
         feature_result_info = {}
     
-    requests.post(f'{get_cometa_socket_url()}/feature/%s/finished' % context.feature_id, data={
+    # screenshot processing may have queued more step events after the first flush
+    context.event_client.flush()
+    context.event_client.session.post(f'{get_cometa_socket_url()}/feature/%s/finished' % context.feature_id, data={
         "user_id": context.PROXY_USER['user_id'],
         "browser_info": json.dumps(context.browser_info),
         "feature_result_id": os.environ['feature_result_id'],
@@ -1007,31 +1027,19 @@ def after_all(context):
         "datetime": datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
     })
 
-    if hasattr(context, "network_responses") and context.network_logging_enabled:
-        network_response_count = 0
-        vulnerable_response_count = 0
-        logger.debug(
-            "Get count of total network responses and count of vulnerability_headers_count"
-        )
-        # logger.debug(context.network_responses)
-        for response in context.network_responses:
-            # network_response_count counts total network responses received
-            network_response_count += len(response["responses_and_vulnerable_header"])
-            # vulnerable_response_count counts those network responses which contains vulnerability headers
-            vulnerable_response_count += response["vulnerability_headers_count"]
-
+    if hasattr(context, "network_log_analyzer") and context.network_logging_enabled:
+        network_response_count, vulnerable_response_count = context.network_log_analyzer.totals()
         logger.debug(f"Total Network responses {network_response_count}")
         logger.debug(f"Vulnerable Count {vulnerable_response_count}")
 
         logger.info("Sending vulnerability_headers")
+        # request body is built from the responses spilled to disk during the steps
+        body_path = context.network_log_analyzer.upload_body(os.environ['feature_result_id'])
+        context.tempfiles.append(body_path)
         # request to save vulnerable network headers
-        response = requests.post(f"{get_cometa_backend_url()}/api/security/network_headers/", headers=headers,
-                                 data=json.dumps({
-                                     "result_id": os.environ['feature_result_id'],
-                                     "responses": context.network_responses,
-                                     "vulnerable_response_count": vulnerable_response_count,
-                                     "network_response_count": network_response_count
-                                 }))
+        with open(body_path, "rb") as body_file:
+            response = requests.post(f"{get_cometa_backend_url()}/api/security/network_headers/", headers=headers,
+                                     data=body_file)
 
         if response.status_code == 201:
             logger.debug("Vulnerability Headers Saved ")
@@ -1124,6 +1132,7 @@ def before_step(context, step):
     context.STEP_TYPE = 'BROWSER'
     context.LAST_STEP_DB_QUERY_RESULT = None
     context.LAST_STEP_VARIABLE_AND_VALUE = None
+    context.step_selector_strategies = {}
     context.step_exception = None
     
     # Prepare step for healing using HealeniumClient
@@ -1164,7 +1173,7 @@ def before_step(context, step):
 
     # send websocket to front to let front know about the step
     # FIXME Understand why browser_info needs to be send here
-    requests.post(f'{get_cometa_socket_url()}/feature/%s/stepBegin' % context.feature_id, data={
+    context.event_client.send(context.feature_id, "stepBegin", {
         "user_id": context.PROXY_USER["user_id"],
         "feature_result_id": os.environ["feature_result_id"],
         "browser_info": json.dumps(context.browser_info),
@@ -1173,78 +1182,24 @@ def before_step(context, step):
         "step_index": index,
         "datetime": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
         "belongs_to": context.step_data["belongs_to"],
-    })
+    }, context.counters["step_sequence"])
     
    
 
 def find_vulnerable_headers(context, step_index) -> int:
     try:
-        responses_and_vulnerable_header = []
+        # network_log_analyzer is created in before_all for chrome when network logging is enabled
+        if not hasattr(context, "network_log_analyzer"):
+            return 0
         performance_logs = context.browser.get_log("performance")
         logger.debug(f"Performance logs received Count is : {len(performance_logs)}")
-
-        # filter vulnerable_headers from a single response header list and return
-        def filter_vulnerability_headers(headers: dict) -> list:
-            # List of header if they found to be vulnerable
-            vulnerable_header_names = []
-            # vulnerability_headers_info were added to context in before_all method
-            for vulnerable_header_info in context.vulnerability_headers_info:
-                header_name = vulnerable_header_info["header_name"].lower()
-                # Check if header added in the DB exists in response header
-                if header_name in headers.keys():
-                    vulnerable_header_names.append({header_name: headers[header_name]})
-
-            return vulnerable_header_names
-
         # performance_logs is list of network requests and responses url and header information
         logger.debug(f"Response header analysis Started for current Step")
-        vulnerability_headers_count = 0
-        for logs in performance_logs:
-            # message.message is string json covert so parse json
-            information = json.loads(logs["message"])["message"]
-            # Check if log type is Response received to get response headers later time
-            if information["method"] == "Network.responseReceived":
-                # logger.debug(f"Processing network response")
-                # Get response details from the network response object
-                response = information["params"]["response"]
-                # check and filter for vur vulnerability_headers
-                # logger.debug(f"Processing respose headers ")
-                vulnerable_headers = filter_vulnerability_headers(response["headers"])
-                # check if request has some vulnerable_headers then add that to responses_and_vulnerable_header
-                # logger.debug(f"Found vulnerable headers ")
-                if len(vulnerable_headers) > 0:
-                    vulnerability_headers_count += 1
-                # Store all network responses
-                responses_and_vulnerable_header.append(
-                    {
-                        "response": response,
-                        "vulnerable_headers": vulnerable_headers,
-                    }
-                )
-
-        # Check if context contains vulnerability_headers list yes then append to that list
+        vulnerability_headers_count = context.network_log_analyzer.analyze_step(performance_logs, step_index)
         logger.debug(
             f"Response header analysis completed for current Step {step_index}"
         )
-        if hasattr(context, "network_responses"):
-            context.network_responses.append(
-                {
-                    "step_id": step_index,
-                    "responses_and_vulnerable_header": responses_and_vulnerable_header,
-                    "vulnerability_headers_count": vulnerability_headers_count,
-                }
-            )
-        else:
-            # if it does not have attribute vulnerability_headers then initilze list add vulnerability headers
-            context.network_responses = [
-                {
-                    "step_id": step_index,
-                    "responses_and_vulnerable_header": responses_and_vulnerable_header,
-                    "vulnerability_headers_count": vulnerability_headers_count,
-                }
-            ]
         # Return number of vernability headers
-        logger.debug(f"Return header info : {len(context.network_responses)}")
         return vulnerability_headers_count
     except Exception as e:
         logger.exception(e)
@@ -1339,13 +1294,8 @@ def after_step(context, step):
     else:
         logger.debug(f"No healing data for step {index}")
     
-    # Execute the request asynchronously
-    with ThreadPoolExecutor() as executor:
-        executor.submit(
-            requests.post,
-            f'{get_cometa_socket_url()}/feature/%s/stepFinished' % context.feature_id,
-            json=payload
-        )
+    # Queue the event, it is sent in a batch by the event client thread
+    context.event_client.send(context.feature_id, "stepFinished", payload, context.counters["step_sequence"])
     
     logger.debug(f"Sent websocket to front to let front know about the step {step_name}")
     # update countes
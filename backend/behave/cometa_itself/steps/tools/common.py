@@ -26,6 +26,7 @@ from utility.config_handler import *
 from utility.common import *
 from utility.cometa_logger import CometaLogger
 from utility.configurations import ConfigurationManager
+from tools.event_client import get_event_client
 
 # setup logging
 logging.setLoggerClass(CometaLogger)
@@ -244,6 +245,118 @@ def detect_selector_type(selector):
 
 
 
+# Selenium locator strategies that can be resolved by WAIT_FOR_ELEMENTS_SCRIPT inside the browser
+BROWSER_WAIT_STRATEGIES = (
+    By.CSS_SELECTOR, By.ID, By.NAME, By.XPATH, By.LINK_TEXT,
+    By.PARTIAL_LINK_TEXT, By.TAG_NAME, By.CLASS_NAME,
+)
+# seconds a single execute_async_script call waits, must be lower than the driver script timeout (30s)
+BROWSER_WAIT_CHUNK = 20
+
+# Waits inside the browser until one of the locators ([[strategy, selector], ...]) matches at least one element.
+# The waiting function is defined once per page (window.__cometaWaitForElements), checks the locators in order
+# and then re-checks only when the DOM changes (MutationObserver) instead of polling find_elements from behave.
+# Returns {index: <index of the matching locator>, elements: [...]} or null when the timeout (ms) is reached
+WAIT_FOR_ELEMENTS_SCRIPT = """
+var done = arguments[arguments.length - 1];
+if (!window.__cometaWaitForElements) {
+    var toArray = function (nodes) { return Array.prototype.slice.call(nodes); };
+    var linksByText = function (selector, partial) {
+        return toArray(document.getElementsByTagName('a')).filter(function (link) {
+            var text = (link.innerText || link.textContent || '').trim();
+            return partial ? text.indexOf(selector) !== -1 : text === selector;
+        });
+    };
+    var find = function (strategy, selector) {
+        switch (strategy) {
+            case 'css selector': return toArray(document.querySelectorAll(selector));
+            case 'class name': return toArray(document.querySelectorAll('.' + selector));
+            case 'tag name': return toArray(document.getElementsByTagName(selector));
+            case 'name': return toArray(document.getElementsByName(selector));
+            case 'id':
+                var element = document.getElementById(selector);
+                return element ? [element] : [];
+            case 'xpath':
+                var result = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+                var elements = [];
+                for (var i = 0; i < result.snapshotLength; i++) {
+                    if (result.snapshotItem(i).nodeType === Node.ELEMENT_NODE) elements.push(result.snapshotItem(i));
+                }
+                return elements;
+            case 'link text': return linksByText(selector, false);
+            case 'partial link text': return linksByText(selector, true);
+        }
+        return [];
+    };
+    window.__cometaWaitForElements = function (locators, timeout, callback) {
+        var finished = false, scheduled = false, observer = null, timer = null;
+        var finish = function (result) {
+            finished = true;
+            if (observer) observer.disconnect();
+            clearTimeout(timer);
+            callback(result);
+        };
+        var check = function () {
+            scheduled = false;
+            if (finished) return;
+            for (var i = 0; i < locators.length; i++) {
+                var elements = [];
+                // invalid selectors for a strategy are skipped, same as InvalidSelectorException in behave
+                try { elements = find(locators[i][0], locators[i][1]); } catch (error) {}
+                if (elements.length > 0) return finish({index: i, elements: elements});
+            }
+        };
+        check();
+        if (finished) return;
+        observer = new MutationObserver(function () {
+            // mutations usually come in bursts, check once per burst
+            if (!scheduled) { scheduled = true; setTimeout(check, 0); }
+        });
+        observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+        timer = setTimeout(function () { finish(null); }, timeout);
+    };
+}
+window.__cometaWaitForElements(arguments[0], arguments[1], done);
+"""
+
+
+def can_wait_in_browser(context, strategies):
+    """
+    Elements can be awaited inside the browser for web steps using standard selenium strategies,
+    mobile steps and Healenium (which heals selectors in find_elements requests) keep polling
+    """
+    return (
+        context.STEP_TYPE != 'MOBILE'
+        and not getattr(context, 'healenium_enabled', False)
+        and all(strategy in BROWSER_WAIT_STRATEGIES for strategy in strategies)
+    )
+
+
+def wait_for_elements_in_browser(context, locators, max_timeout=None):
+    """
+    Blocks in WAIT_FOR_ELEMENTS_SCRIPT until one of the locators ([[strategy, selector], ...]) matches
+    Returns (index of the matching locator, elements) or None if max_timeout (seconds) was reached
+    """
+    start_time = time.time()
+    while max_timeout is None or time.time() - start_time < max_timeout:
+        wait_time = BROWSER_WAIT_CHUNK
+        if max_timeout is not None:
+            wait_time = min(wait_time, max_timeout - (time.time() - start_time))
+        try:
+            result = context.browser.execute_async_script(WAIT_FOR_ELEMENTS_SCRIPT, locators, int(wait_time * 1000))
+        except TimeoutException:
+            # script timeout, wait again
+            continue
+        except WebDriverException as err:
+            # page navigated while waiting, alert open, document not ready ... wait and inject the script again
+            logger.debug(f"Waiting for elements in the browser failed, will retry: {str(err).splitlines()[0] if str(err) else err}")
+            time.sleep(0.1)
+            continue
+        if result:
+            return result["index"], result["elements"]
+    return None
+
+
 def waitSelector(context, selector_type, selector, max_timeout=None):
     element = waitSelectorNew(context, selector, max_timeout)
     if element:
@@ -294,6 +407,17 @@ def waitSelectorNew(context, selector, max_timeout=None):
     if max_timeout == None:
         max_timeout = context.step_data["timeout"]
     
+    if can_wait_in_browser(context, [selector_type]):
+        logger.debug(f"Waiting in the browser for element with selector_type '{selector_type}', selector '{selector}' max_timeout : {max_timeout}")
+        # raised by the step timeout if the element never shows up
+        context.step_exception = CometaElementNotFoundError(f"Element not found for selector: {selector}")
+        result = wait_for_elements_in_browser(context, [[selector_type, selector]], max(max_timeout - (time.time() - start_time), 0))
+        if result is None:
+            raise context.step_exception
+        # find_element was used for ID and NAME, only the first element is returned
+        elements = result[1][:1] if selector_type in [By.ID, By.NAME] else result[1]
+        return elements
+
     if selector_type in [By.ID, By.NAME]:
         method = device_driver.find_element
     else:
@@ -329,6 +453,30 @@ def waitSelectorNew(context, selector, max_timeout=None):
     raise context.step_exception
 
 
+def load_selector_strategies(context):
+    """
+    Loads the selector types that found each selector in the last executions of the feature
+    {"<belongs_to feature id>": {"<selector>": "<selector type>"}}, empty if they can not be loaded
+    """
+    try:
+        response = get_event_client().session.get(
+            f"{get_cometa_backend_url()}/selector_strategies/{context.feature_id}/",
+            headers={"Host": "cometa.local"},
+        )
+        selector_strategies = response.json().get("selector_strategies", {})
+        logger.debug(f"Loaded selector types for {sum(len(strategies) for strategies in selector_strategies.values())} selectors")
+        return selector_strategies
+    except Exception as err:
+        logger.debug(f"Unable to load selector types of the last executions: {str(err)}")
+        return {}
+
+
+def remember_selector_strategy(context, selector, selector_type):
+    """Saves the selector type that found the element, saved with the step result and used by the next lookups"""
+    context.step_selector_strategies[selector] = selector_type
+    context.selector_strategies.setdefault(str(context.step_data["belongs_to"]), {})[selector] = selector_type
+
+
 # ---
 # Wrapper function to wait until an element, selector, id, etc is present
 # ... if first try for defined selector is not found
@@ -365,42 +513,69 @@ def waitSelectorOld(context, selector_type, selector, max_timeout=None):
         selector = selectorWords.join(" ")
     counter = 0
     # Switch selector type
-    device = 'mobile["driver"]' if context.STEP_TYPE == 'MOBILE' else 'browser'
-        
-    types = {
-        "css": f"context.{device}.find_elements(By.CSS_SELECTOR, selector)",
-        "id": f"context.{device}.find_element(By.ID, selector)",
-        "link_text": f"context.{device}.find_elements(By.LINK_TEXT, selector)",
-        "xpath": f"context.{device}.find_elements(By.XPATH, selector)",
-        "name": f"context.{device}.find_element(By.NAME, selector)",
-        "tag_name": f"context.{device}.find_elements(By.TAG_NAME, selector)",
-        "class": f"context.{device}.find_elements(By.CLASS_NAME, selector)",
+    device_driver = context.mobile["driver"] if context.STEP_TYPE == 'MOBILE' else context.browser
+
+    # selector type -> (selenium strategy, value used with the strategy), single element strategies return a WebElement
+    strategies = {
+        "css": (By.CSS_SELECTOR, selector),
+        "id": (By.ID, selector),
+        "link_text": (By.LINK_TEXT, selector),
+        "xpath": (By.XPATH, selector),
+        "name": (By.NAME, selector),
+        "tag_name": (By.TAG_NAME, selector),
+        "class": (By.CLASS_NAME, selector),
     }
+    single_element_types = ["id", "name"]
     
     if context.STEP_TYPE == 'MOBILE':     
         # FIXME Not By.ACCESSIBILITY_ID have some issue, need to investigate and fix 
-        types["accessibility_id"] = f"context.mobile['driver'].find_element(By.ACCESSIBILITY_ID, selector)"
+        strategies["accessibility_id"] = (By.ACCESSIBILITY_ID, selector)
         value = f'//*[contains(@text,"{selector}")]'
-        types["partial_text"] = f"context.mobile['driver'].find_element(By.XPATH, '{value}')"
+        strategies["partial_text"] = (By.XPATH, value)
+        single_element_types += ["accessibility_id", "partial_text"]
         logger.debug(f"partial_text Selector Value : {value}")
-        
-    # place selector_type on the top
-    selector_type_value = types.pop(selector_type, "css")
-    # new types variables
+
+    # place the selector type that found this selector last time on the top, then selector_type and then the rest of the types
+    preferred_types = [
+        getattr(context, "selector_strategies", {}).get(str(context.step_data["belongs_to"]), {}).get(selector),
+        selector_type,
+    ]
+    selector_types = []
+    for selec_type in preferred_types + list(strategies):
+        if selec_type in strategies and selec_type not in selector_types:
+            selector_types.append(selec_type)
+    logger.debug(f"Selector types order: {selector_types}")
+
+    if can_wait_in_browser(context, [strategies[selec_type][0] for selec_type in selector_types]):
+        logger.debug("Waiting in the browser for any of the selector types")
+        # all the selector types are checked in a single browser side call
+        result = wait_for_elements_in_browser(
+            context, [list(strategies[selec_type]) for selec_type in selector_types], max_timeout
+        )
+        if result is None:
+            raise CometaMaxTimeoutReachedException(
+                f"Programmed to find the element in {max_timeout} seconds, max timeout reached."
+            )
+        index, elements = result
+        remember_selector_strategy(context, selector, selector_types[index])
+        return elements[0] if selector_types[index] in single_element_types else elements
+
     types_new = {}
-    # add the selector_type value first and then the rest of the values
-    types_new[selector_type] = selector_type_value
-    types_new.update(types)
+    for selec_type in selector_types:
+        strategy, value = strategies[selec_type]
+        find = device_driver.find_element if selec_type in single_element_types else device_driver.find_elements
+        types_new[selec_type] = lambda find=find, strategy=strategy, value=value: find(strategy, value)
     logger.debug("Starting loop")
     # Loop until maxtries is reached and then exit with exception
     while time.time() - start_time < max_timeout if max_timeout is not None else True:
         for selec_type in list(types_new.keys()):
             try:
-                elements = eval(types_new.get(selec_type, "css"))
+                elements = types_new[selec_type]()
                 # Check if it returned at least 1 element
                 if isinstance(elements, WebElement) or len(elements) > 0:
                     # Check for healing after successful element find
                     _handle_healing_check(context, selec_type, selector, start_time)
+                    remember_selector_strategy(context, selector, selec_type)
                     return elements
             except CustomError as err:
                 logger.error(
@@ -492,7 +667,8 @@ def load_parameters(parameters):
 
 def send_step_details(context, text):
     logger.debug('Sending websocket with detailed step ... [%s] ' % text)
-    requests.post(f'{get_cometa_socket_url()}/feature/%s/stepDetail' % context.feature_id, data={
+    # queued and sent in batches, see tools/event_client.py
+    get_event_client().send(context.feature_id, 'stepDetail', {
         "user_id": context.PROXY_USER['user_id'],
         'browser_info': json.dumps(context.browser_info),
         "run_id": os.environ['feature_run'],
@@ -500,9 +676,9 @@ def send_step_details(context, text):
         'datetime': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
         'belongs_to': context.step_data['belongs_to'],
         'info': text
-    })
+    }, context.counters['step_sequence'])
 
-def send_step_screen_shot_details(feature_id, feature_result_id, user_id, browser_info, counters_index, step_data_belongs_to, websocket_screen_shot_details):
+def send_step_screen_shot_details(feature_id, feature_result_id, user_id, browser_info, counters_index, step_data_belongs_to, websocket_screen_shot_details, step_execution_sequence=0):
     logger.debug('Sending websocket with screenshot details ... [%s] ' % websocket_screen_shot_details)
     
     data_to_send = {
@@ -517,9 +693,7 @@ def send_step_screen_shot_details(feature_id, feature_result_id, user_id, browse
     }
     logger.debug(f"Sending data {data_to_send}")
     
-    response = requests.post(f'{get_cometa_socket_url()}/feature/%s/stepDetail' % feature_id, data=data_to_send)
-    
-    logger.debug(f"response : {response} {response.text}")
+    get_event_client().send(feature_id, 'stepDetail', data_to_send, step_execution_sequence)
 
 
 def get_element_using_common_selector_and_click(context, selector_value, selector_type="css", start_time=None):
@@ -8,7 +8,6 @@ import sys
 import os, glob
 import os.path
 import shutil
-import subprocess
 import shlex
 import requests
 import json
@@ -20,12 +19,10 @@ import logging
 import traceback
 import urllib.parse
 import random
-from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 
 # import PIL
-from subprocess import call, run
 from selenium.common.exceptions import WebDriverException, NoAlertPresentException, ElementNotInteractableException, TimeoutException, StaleElementReferenceException
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -43,7 +40,6 @@ from tools.cognos import *
 from tools.common import *
 from tools.exceptions import *
 from tools.variables import *
-from slugify import slugify
 from html_diff import diff
 from bs4 import BeautifulSoup
 
@@ -57,9 +53,12 @@ from pathlib import Path
 from tools import expected_conditions as CEC
 import sys
 
-from utility.functions import toWebP, toWebP_from_data
 from utility.encryption import *
 from tools.models import check_if_step_should_execute, get_step_status
+from tools.event_client import get_event_client
+from tools.variable_substitution import VariableSubstitution
+from tools.screenshot_workers import get_screenshot_pool
+from tools.image_processing import baseline_cache, decode_image, encode_webp, write_file, image_signature, compare_images, compare_with_baseline, add_timestamp
 
 # setup logging
 logger = logging.getLogger("FeatureExecution")
@@ -107,17 +106,6 @@ SCREENSHOT_PREFIX = ConfigurationManager.get_configuration(
     "COMETA_SCREENSHOT_PREFIX", ""
 )
 
-# initialize a thread‐pool for background HTTP posts
-_executor = ThreadPoolExecutor(max_workers=4)
-
-def _async_post(url, headers=None, json=None):
-    def _task():
-        try:
-            logger.debug(f"Async POST to {url} with headers: {headers}")
-            requests.post(url, headers=headers, json=json)
-        except Exception as e:
-            logger.error(f"Async POST to {url} failed: {e}")
-    _executor.submit(_task)
 
 
 def parse_json_object(raw_value, context_label):
@@ -285,20 +273,14 @@ def get_screenshot_bytes_from_screen(context):
 
 
 def getVariable(context, variable_name):
-    # get the variables from the context
-    env_variables = json.loads(context.VARIABLES)
-    # check if variable_name is in the env_variables
-    index = [
-        i for i, _ in enumerate(env_variables) if _["variable_name"] == variable_name
-    ]
-
-    if len(index) == 0:
+    # get the variable from the variables index
+    variable = get_variable_substitution(context).get(variable_name)
+
+    if variable is None:
         raise CustomError("No variable found with name: %s" % variable_name)
 
     # get variable value from the variables
-    variable_value = env_variables[index[0]]["variable_value"]
-
-    return variable_value
+    return variable["variable_value"]
 
 # use this method to add any information to step result, to help user understand what happened
 def add_step_execution_notes(context, message):
@@ -337,18 +319,16 @@ def addStepVariableToContext(context, variable, save_to_step_report=False):
 
 # variables added using this method will not be saved in the database
 def addTestRuntimeVariable(context, variable_name, variable_value, save_to_step_report=False):
-    # get the variables from the context
-    env_variables = json.loads(context.VARIABLES)
-    # check if variable_name is in the env_variables
-    index = [
-        i for i, _ in enumerate(env_variables) if _["variable_name"] == variable_name
-    ]
-
-    if len(index) > 0:  # update the variable
-        index = index[0]
+    # get the variables index of the execution
+    variable_substitution = get_variable_substitution(context)
+    # check if variable_name is in the variables
+    variable = variable_substitution.get(variable_name)
+
+    if variable is not None:  # update the variable
         logger.debug("Patching existing variable")
-        env_variables[index]["variable_value"] = variable_value
-        addStepVariableToContext(context, env_variables[index], save_to_step_report)
+        variable["variable_value"] = variable_value
+        variable_substitution.set_variable(variable)
+        addStepVariableToContext(context, variable, save_to_step_report)
 
     else:
         logger.debug("Adding new variable")
@@ -357,31 +337,29 @@ def addTestRuntimeVariable(context, variable_name, variable_value, save_to_step_
             "variable_value": variable_value,
             "encrypted": False,
         }
-        env_variables.append(new_variable)
+        variable_substitution.set_variable(new_variable)
         addStepVariableToContext(context, new_variable, save_to_step_report)
 
-    context.VARIABLES = json.dumps(env_variables)
+    context.VARIABLES = variable_substitution.dumps()
 
 
 def addVariable(context, variable_name, result, encrypted=False, save_to_step_report=False):
-    # get the variables from the context
-    env_variables = json.loads(context.VARIABLES)
-    # check if variable_name is in the env_variables
-    index = [
-        i for i, _ in enumerate(env_variables) if _["variable_name"] == variable_name
-    ]
-
-    if len(index) > 0:  # update the variable
-        index = index[0]
+    # get the variables index of the execution
+    variable_substitution = get_variable_substitution(context)
+    # check if variable_name is in the variables
+    variable = variable_substitution.get(variable_name)
+
+    if variable is not None:  # update the variable
         logger.debug("Patching existing variable")
-        env_variables[index]["variable_value"] = result
-        env_variables[index]["encrypted"] = encrypted
-        env_variables[index]["updated_by"] = context.PROXY_USER["user_id"]
-        addStepVariableToContext(context,env_variables[index], save_to_step_report)
+        variable["variable_value"] = result
+        variable["encrypted"] = encrypted
+        variable["updated_by"] = context.PROXY_USER["user_id"]
+        variable_substitution.set_variable(variable)
+        addStepVariableToContext(context, variable, save_to_step_report)
         # do not update if scope is data-driven
         if (
-            "scope" in env_variables[index]
-            and env_variables[index]["scope"] == "data-driven"
+            "scope" in variable
+            and variable["scope"] == "data-driven"
         ):
             logger.info(
                 "Will not send request to update the variable in co.meta since we are in 'data-driven' scope."
@@ -390,13 +368,13 @@ def addVariable(context, variable_name, result, encrypted=False, save_to_step_re
             # make the request to cometa_django and add the environment variable
             response = requests.patch(               
                 f"{get_cometa_backend_url()}/api/variables/"
-                + str(env_variables[index]["id"]) 
+                + str(variable["id"]) 
                 + "/",
                 headers={"Host": "cometa.local"},
-                json=env_variables[index],
+                json=variable,
             )
             if response.status_code == 200:
-                env_variables[index] = response.json()["data"]
+                variable_substitution.set_variable(response.json()["data"])
     else:  # create new variable
         logger.debug("Creating variable")
         # create data to send to django
@@ -426,7 +404,7 @@ def addVariable(context, variable_name, result, encrypted=False, save_to_step_re
         )
 
         if response.status_code == 201:
-            env_variables.append(response.json()["data"])
+            variable_substitution.set_variable(response.json()["data"])
 
     # send a request to websockets about the environment variables update
     requests.post(
@@ -437,7 +415,7 @@ def addVariable(context, variable_name, result, encrypted=False, save_to_step_re
         },
     )
     # update variables inside context
-    context.VARIABLES = json.dumps(env_variables)
+    context.VARIABLES = variable_substitution.dumps()
 
 
 # check if encrypted
@@ -453,6 +431,18 @@ def returnDecrypted(value):
     return value
 
 
+def get_variable_substitution(context):
+    """
+    Returns the variables index of the execution (created in before_all), reloading it
+    if context.VARIABLES or context.PARAMETERS were replaced by a step
+    """
+    if not hasattr(context, "variable_substitution"):
+        context.variable_substitution = VariableSubstitution(context.VARIABLES, context.PARAMETERS, returnDecrypted)
+    else:
+        context.variable_substitution.sync(context.VARIABLES, context.PARAMETERS)
+    return context.variable_substitution
+
+
 def dynamicDateGenerator(content: str):
     # date pattern to look for
     pattern = r"#today;?(?P<format>[^;\n]+)?;?(?P<expression>(?:days|weeks|hours|minutes|seconds)=)?(?P<operation>-|\+)?(?P<amount>[0-9]+)?\b"  # looks for ;format & ;daysDelta which are optional
@@ -555,10 +545,8 @@ def done(*_args, **_kwargs):
 
             # args[0] = context
 
-            # get EnvironmentVariables
-            env_variables = json.loads(args[0].VARIABLES)
-            # job parameters
-            job_parameters = json.loads(args[0].PARAMETERS)
+            # compiled index of the environment variables and job parameters
+            variable_substitution = get_variable_substitution(args[0])
 
             # message that will be saved in database once the code has been executed!
             save_message = _args[0].format(**kwargs)
@@ -582,99 +570,25 @@ def done(*_args, **_kwargs):
                 # replace variables in kwargs
                 # Got here the parameter list
                 
+                # Replace variables which are present in between of values provided in the step parameter
+                # i.e. if value is [@resource-id="undefined.item_$year-$month"]
+                # then $year and $month will be replaced with the value of the variable
+                # $VAR, ${VAR}, %index and %job_parameter are replaced in a single pass, see VariableSubstitution
                 for parameter in kwargs:
                     parameter_value = kwargs[parameter]
                     if not parameter_value:
                         continue
-
-                    # Match $VAR, ${VAR}, and %index only
-                    found_vars = re.findall(r'(\$[a-zA-Z_][a-zA-Z0-9_]*|\$\{[a-zA-Z_][a-zA-Z0-9_]*\}|%index)', parameter_value)
-                    if args[0].text:
-                        found_vars_in_text = re.findall(r'(\$[a-zA-Z_][a-zA-Z0-9_]*|\$\{[a-zA-Z_][a-zA-Z0-9_]*\}|%index)', args[0].text)
-                        logger.debug(f"args[0].text {args[0].text}")
-                        found_vars.extend(found_vars_in_text)
-                    # logger.debug(f"Found variables for {parameter_value} value {found_vars}")
-                    # Replace variables which are present in between of values provided in the step parameter
-                    # i.e. if value is [@resource-id="undefined.item_$year-$month"]
-                    # then $year and $month will be replaced with the value of the variable
-                    for raw_var in found_vars:
-                        # logger.debug(f"Iterating for {raw_var}")
-                        if raw_var.startswith('%'):
-                            # Handle only %index
-                            if raw_var != '%index':
-                                continue
-                            variable_name = 'index'
-                        else:
-                            # Clean $VAR and ${VAR}
-                            variable_name = raw_var.strip('${}$')
-
-                        # # Find the variable in the env_variables list
-                        # logger.debug(f"Trying to find value for variable {variable_name}")
-                        # logger.debug(f"env_variables {env_variables}")
-                        index = [
-                            i for i, _ in enumerate(env_variables)
-                            if _["variable_name"] == variable_name
-                        ]
-                        if not index:
-                          #   logger.debug(f"Variable not found {variable_name}")
-                            continue  # Variable not found
-
-                        env_var = env_variables[index[0]]
-                        # logger.debug(f"found variable {env_var}")
-
-                        decrypted_value = returnDecrypted(str(env_var["variable_value"]))
-
-                        # Regex pattern: match both $VAR and ${VAR}, or just %index
-                        if raw_var.startswith('%'):
-                            pattern = r'%index'
-                        else:
-                            pattern = r"\${?%s(?:}|\b)" % re.escape(variable_name)
-
-                        # Replace in args[0].text if not inside a loop
-                        if args[0].text and "Loop" not in save_message:
-                            # Escape backslashes for regex safety, but preserve unicode sequences (\uXXXX)
-                            # Then use lambda to avoid re.sub interpreting escape sequences
-                            safe_value = re.sub(r'\\(?!u[0-9a-fA-F]{4})', r'\\\\', decrypted_value)
-                            args[0].text = re.sub(pattern, lambda m: safe_value, args[0].text)
-
-                        # Replace in kwargs[parameter]
-                        if re.search(pattern, parameter_value):
-                            # Escape backslashes for regex safety, but preserve unicode sequences (\uXXXX)
-                            # Then use lambda to avoid re.sub interpreting escape sequences
-                            safe_value = re.sub(r'\\(?!u[0-9a-fA-F]{4})', r'\\\\', decrypted_value)
-                            kwargs[parameter] = re.sub(pattern, lambda m: safe_value, parameter_value)
-                        parameter_value = parameter_value.replace(("$%s" % variable_name), returnDecrypted(env_var["variable_value"]))
-
-                    # Assign back parameter_value value to kwargs[parameter] which will be passed in the step parameter
-                    kwargs[parameter] = parameter_value
-                            
-                    # replace job parameters
-                    for (
-                        parameter_key
-                    ) in (
-                        job_parameters.keys()
-                    ):  # we do not want to replace all the parameters inside the loop sub-steps
-                        if args[0].text and "Loop" not in save_message:
-                            # Escape backslashes for regex safety, but preserve unicode sequences (\uXXXX)
-                            # Then use lambda to avoid re.sub interpreting escape sequences
-                            param_value = returnDecrypted(str(job_parameters[parameter_key]))
-                            safe_param_value = re.sub(r'\\(?!u[0-9a-fA-F]{4})', r'\\\\', param_value)
-                            args[0].text = re.sub(
-                                r"%%%s\b" % parameter_key,
-                                lambda m: safe_param_value,
-                                args[0].text,
-                            )
-                        if re.search(r"%%%s\b" % parameter_key, kwargs[parameter]):
-                            kwargs[parameter] = kwargs[parameter].replace(
-                                ("%%%s" % parameter_key),
-                                str(job_parameters[parameter_key]),
-                            )
+                    kwargs[parameter] = variable_substitution.substitute(parameter_value)
                     # decrypt the value incase it was not a varaible
                     kwargs[parameter] = returnDecrypted(kwargs[parameter])
 
                     # update using dynamic date
                     kwargs[parameter] = dynamicDateGenerator(kwargs[parameter])
 
+                # we do not want to replace the variables inside the loop sub-steps
+                if args[0].text and "Loop" not in save_message:
+                    args[0].text = variable_substitution.substitute(args[0].text, in_text=True)
+
                 # update dates inside the text
                 args[0].text = dynamicDateGenerator(args[0].text)
 
@@ -842,7 +756,8 @@ def saveToDatabase(
         "healing_data": getattr(context, 'healing_data', {}),
         "database_query_result": context.LAST_STEP_DB_QUERY_RESULT,
         "current_step_variables_value": context.LAST_STEP_VARIABLE_AND_VALUE,
-        "step_execution_sequence": context.counters['step_sequence']
+        "step_execution_sequence": context.counters['step_sequence'],
+        "selector_strategies": getattr(context, "step_selector_strategies", {}),
     }
     
     #     logger.debug("Updating the values after processing the screenshot")
@@ -873,15 +788,8 @@ def saveToDatabase(
     log_file.write("\n")
     logger.debug("Saving data to feature_result")
     try:
-        _async_post(
-            f"{get_cometa_backend_url()}/api/feature_results/"
-            + str(feature_id)
-            + "/step_results/"
-            + str(feature_result_id)
-            + "/",
-            headers={"Host": "cometa.local"},
-            json=data,
-        )
+        # step results are saved in batches, relative_execution_time is calculated by django
+        get_event_client().save_step_result(feature_result_id, data)
         logger.debug(f"feature_result backend request completed")
         context.step_result = json.dumps({"success": success})
         logger.debug(f"Step Result Context: {context.step_result}")
@@ -1010,106 +918,109 @@ def _async_process_screen_shot(
     # current_step_device_driver
 ):
     
-    def _task():
-        try:
-            backend_screenshot_data = {}
-            websocket_screenshot_data = {}
-        
-            # time.sleep(0.1)
-            logger.debug("Converting %s to webP" % final_screenshot_file)
-            # Convert screenshot to WebP
-            toWebP_from_data(screenshot_data, final_screenshot_file)
-            logger.debug("Converting screenshot done")
-        
-            if compare:
-                logger.debug("Starting the image comparison")
-                
-                compare_image = os.path.join(screenshots_step_path, screenshot_file).replace(".png", ".webp")
-                style_image = os.path.join(templates_path, f"{screenshot_prefix}template_{index_counter}.webp")
-                style_image_copy_to_show = os.path.join(screenshots_step_path, f"{screenshot_prefix}style.webp")
-                diff_image = os.path.join(screenshots_step_path, f"{screenshot_prefix}difference.png")
+    def _task(timings):
+        backend_screenshot_data = {}
+        websocket_screenshot_data = {}
+
+        # Decode the screenshot once, comparison, timestamp and WebP encoding work on the decoded image
+        with timings.measure("convert"):
+            current_image = decode_image(screenshot_data)
+        if current_image is None:
+            raise CustomError("Unable to decode screenshot")
+        compare_image = os.path.join(screenshots_step_path, screenshot_file).replace(".png", ".webp")
+
+        if compare:
+            logger.debug("Starting the image comparison")
+            
+            style_image = os.path.join(templates_path, f"{screenshot_prefix}template_{index_counter}.webp")
+            style_image_copy_to_show = os.path.join(screenshots_step_path, f"{screenshot_prefix}style.webp")
+            diff_image = os.path.join(screenshots_step_path, f"{screenshot_prefix}difference.webp")
 
+            with timings.measure("compare"):
                 migrateOldStyles(feature_id, index_counter, browser_hash, screenshots_root, style_image)  # You may need to modify this helper too
 
-                if not os.path.isfile(style_image):
-                    logger.debug(f"StyleImage not found, copying {compare_image} to {style_image}")
-                    shutil.copy2(compare_image, style_image)
+                current_signature = image_signature(current_image)
+                baseline = baseline_cache.get(style_image)
+                if baseline is None:
+                    logger.debug(f"StyleImage not found, saving current screenshot as {style_image}")
+                    baseline = baseline_cache.save(style_image, current_image, current_signature)
 
                 if not os.path.isfile(style_image_copy_to_show):
                     logger.debug(f"StyleImageToShow not found - copying {style_image} to {style_image_copy_to_show}")
                     shutil.copy2(style_image, style_image_copy_to_show)
 
                 logger.debug("Comparing image")
-                pixel_diff = highlight_pixel_differences(compare_image, style_image, diff_image)
-
-                if pixel_diff is None:
-                    raise CustomError("Compare tool returned NoneType")
-
-                toWebP(diff_image)
+                pixel_diff, highlighted, diff_map = compare_with_baseline(current_image, baseline, current_signature)
+                if highlighted is None:
+                    # Identical to the template, nothing to highlight so no difference image is saved
+                    logger.debug("Screenshot is identical to the template, skipping difference image")
+                    diff_image = None
+                else:
+                    write_file(diff_image, encode_webp(highlighted))
+                logger.debug(f"Pixel difference: {pixel_diff}, changed tiles: {len(diff_map['tiles'])}, phash distance: {diff_map['phash_distance']}")
                 backend_screenshot_data["pixel_diff"] = pixel_diff
-                # pixel_diff_counter += pixel_diff
-            else:
-                # This when code executed and there is no baseline 
-                compare_image = os.path.join(screenshots_step_path, screenshot_file).replace(".png", ".webp")
-                style_image = style_image_copy_to_show = diff_image = None
-
-            db_current_screenshot = (
-                removePrefix(compare_image, screenshots_root).replace(".png", ".webp")
-                if compare_image else ""
-            )
-            
-            logger.debug(f"DB_CURRENT_SCREENSHOT {db_current_screenshot}")
+                # saved in the step result so the front can point out the changed regions
+                backend_screenshot_data["diff_map"] = diff_map
+            # pixel_diff_counter += pixel_diff
+        else:
+            # This when code executed and there is no baseline 
+            style_image = style_image_copy_to_show = diff_image = None
+
+        # Timestamp is only added to the screenshot shown in the step result, templates are saved without it
+        with timings.measure("timestamp"):
+            stamped_image = add_timestamp(current_image)
+        logger.debug("Converting %s to webP" % compare_image)
+        with timings.measure("convert"):
+            write_file(compare_image, encode_webp(stamped_image))
+        logger.debug("Converting screenshot done")
+
+        db_current_screenshot = (
+            removePrefix(compare_image, screenshots_root).replace(".png", ".webp")
+            if compare_image else ""
+        )
+        
+        logger.debug(f"DB_CURRENT_SCREENSHOT {db_current_screenshot}")
+        
+        if db_current_screenshot:
+            backend_screenshot_data["screenshot_current"] = db_current_screenshot
             
-            if db_current_screenshot:
-                backend_screenshot_data["screenshot_current"] = db_current_screenshot
-                
-                # FIXME Need to check how to avoid this
-                websocket_screenshot_data['current'] = db_current_screenshot
+            # FIXME Need to check how to avoid this
+            websocket_screenshot_data['current'] = db_current_screenshot
 
-                if style_image_copy_to_show:
-                    backend_screenshot_data["screenshot_style"] = (
-                        removePrefix(style_image_copy_to_show, screenshots_root).replace(".png", ".webp")
-                    )
-
-                if diff_image:
-                    backend_screenshot_data["screenshot_difference"] = (
-                        removePrefix(diff_image, screenshots_root).replace(".png", ".webp")
-                    )
-                    websocket_screenshot_data['difference'] = backend_screenshot_data["screenshot_difference"]
+            if style_image_copy_to_show:
+                backend_screenshot_data["screenshot_style"] = (
+                    removePrefix(style_image_copy_to_show, screenshots_root).replace(".png", ".webp")
+                )
 
-                if style_image:
-                    backend_screenshot_data["screenshot_template"] = (
-                        removePrefix(style_image, screenshots_root)
-                    )
-                    websocket_screenshot_data['template'] = backend_screenshot_data["screenshot_template"]
+            if diff_image:
+                backend_screenshot_data["screenshot_difference"] = (
+                    removePrefix(diff_image, screenshots_root).replace(".png", ".webp")
+                )
+                websocket_screenshot_data['difference'] = backend_screenshot_data["screenshot_difference"]
 
-                addTimestampToImage(db_current_screenshot, path=screenshots_root)
+            if style_image:
+                backend_screenshot_data["screenshot_template"] = (
+                    removePrefix(style_image, screenshots_root)
+                )
+                websocket_screenshot_data['template'] = backend_screenshot_data["screenshot_template"]
 
-                logger.debug(f"Sending screenshot details to the backend {backend_screenshot_data}")
+            logger.debug(f"Sending screenshot details to the backend {backend_screenshot_data}")
 
-                send_step_screen_shot_details(feature_id, feature_result_id, user_id, browser_info, index_counter, step_data_belongs_to, websocket_screenshot_data)
+            with timings.measure("upload"):
+                send_step_screen_shot_details(feature_id, feature_result_id, user_id, browser_info, index_counter, step_data_belongs_to, websocket_screenshot_data, step_execution_sequence)
                 
-                requests.post(
+                # step result must be saved before its screenshots can be updated
+                get_event_client().flush_step_results()
+                get_event_client().session.post(
                     f"{get_cometa_backend_url()}/steps/{feature_result_id}/{step_execution_sequence}/update/",
                     headers={"Host": "cometa.local"},
                     json=backend_screenshot_data,
                 )
-                
-        except Exception as e:
-            logger.exception(f"screenshot processing failed",e)
-    
-    _executor.submit(_task)
-
-    # return backend_screenshot_data, websocket_screenshot_data
 
-# add timestamp to the image using the imagemagic cli
-def addTimestampToImage(image, path=None):
-    logger.debug(f"Adding timestamp to: {path}/{image}")
-    cmd = f"convert {path}/{image} -pointsize 20 -font DejaVu-Sans-Mono -fill 'RGBA(255,255,255,1.0)' -box 'RGBA(0,0,0,0.7)' -gravity SouthEast -annotate +20+20 \"$(date)\" {path}/{image}"
-    status = subprocess.call(cmd, shell=True, env={})
-    if status != 0:
-        logger.error("Something happend during the timestamp watermark.")
+    # blocks the step when too many screenshots are waiting to be processed
+    get_screenshot_pool().submit(_task)
 
+    # return backend_screenshot_data, websocket_screenshot_data
 
 # Automatically checks if there's still old styles and moves them to current path
 # Due to change in new images structure we have to check if the old style image is still there,
@@ -1216,121 +1127,35 @@ def highlight_pixel_differences(image1_path, image2_path, output_path):
     img1 = cv2.imread(image1_path)
     img2 = cv2.imread(image2_path)
 
-    # Resize if needed
     if img1 is None:
         logger.error(f"{image1_path} is None, skipping comparison")
         return 0
     if img2 is None:
         logger.error(f"{image2_path} is None, skipping comparison")
         return 0
-    
-    if img1.shape != img2.shape:
-        img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
-
-    # Compute absolute pixel differences
-    diff = cv2.absdiff(img1, img2)
-
-    # Convert the diff to grayscale
-    gray_diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
 
-    # Threshold to detect actual changes
-    _, mask = cv2.threshold(gray_diff, 30, 255, cv2.THRESH_BINARY)
-
-    # Count the number of different pixels
-    diff_pixel_count = cv2.countNonZero(mask)
-    print(f"Number of different pixels: {diff_pixel_count}")
-
-    # Create a copy of the first image for visualization
-    highlighted = img1.copy()
-
-    # Apply red color where there are differences
-    highlighted[mask == 255] = [0, 0, 255]  # Red color (BGR)
+    diff_pixel_count, highlighted = compare_images(img1, img2)
+    logger.debug(f"Number of different pixels: {diff_pixel_count}")
 
     # Save the highlighted output
     cv2.imwrite(output_path, highlighted)
-    print(f"Highlighted difference image saved as: {output_path}")
+    logger.debug(f"Highlighted difference image saved as: {output_path}")
 
     return diff_pixel_count
 
 
 def compareImage(context):
+    """
+    Compares context.COMPARE_IMAGE with context.STYLE_IMAGE and saves the highlighted differences in context.DIFF_IMAGE
+    Used to call ImageMagick compare and wait for the metric file, now uses the same in process comparison as the screenshots
+    """
     try:
-        """
-        see https://stackoverflow.com/questions/25198558/matching-image-to-images-collection
-        magick compare -verbose screenshots/images/style-guide/search-result/search-result/chrome~ref.png screenshots/style-guide/search-result/search-result/chrome.png diff.png
-        """
-     
-        # Retrieve image vars from context
-        actimg = context.COMPARE_IMAGE
-        styleimg = context.STYLE_IMAGE
-        diff = context.DIFF_IMAGE
-        # Get current directory path
-        pwd = os.getcwd()
-        feature_data = json.loads(os.environ["FEATURE_DATA"])
-        metricFile = "%s/metrics/%s_%s_%s.metric" % (
-            pwd,
-            slugify(feature_data["feature_name"]),
-            str(context.feature_id),
-            context.browser_hash,
-        )
-        with open(metricFile, "w+") as metric:
-            # Run compare command
-            cmd = "/usr/bin/compare -fuzz 10%% -channel all -metric AE  %s %s %s" % (
-                actimg,
-                styleimg,
-                diff,
-            )
-            logger.debug("Before executing command: %s" % cmd)
-            # FIXME: without this print throws error on arguments length too long.
-            logger.debug("Command length: %d" % len(cmd))
-            status = subprocess.call(
-                cmd, stdout=metric, stderr=metric, shell=True, env={}
-            )
-            # Status codes for ImageMagick Compare: (https://www.imagemagick.org/discourse-server/viewtopic.php?t=22451&start=15)
-            #   0 = Success
-            #   1 = Found different sized images but ImageMagick was able to make a difference metric and create the diff image
-            #   2 = Dissimilarity Threshold value too high, ImageMagick wasn't able to do the job
-            if status == 1:
-                logger.info("Compared images with low dissimilarity threshold value")
-            if status == 2:
-                logger.info(
-                    "Unable to compare images, showing empty image with custom text"
-                )
-                subprocess.call(
-                    '/usr/bin/convert -size 2400x1200 xc:White -gravity Center -font /usr/share/fonts/truetype/dejavu/DejaVuSans.ttf -weight 700 -pointsize 50 -annotate 0 "Resolution of the images is different,\nplease delete the template image or check the browser resolution in testplan." '
-                    + diff,
-                    shell=True,
-                )
-                # Return very high pixel difference
-                return 111968
-        # Parse Diff number
-        lines = waitMetric(metricFile)
-        return int(lines[0])
-        for line in lines:
-            if "all" in line:
-                reg = re.compile("all: (.*) ?(?:.*)?")
-                match = reg.search(line)
-                diff = match.group(1)
-                return str(float(diff))
+        return highlight_pixel_differences(context.COMPARE_IMAGE, context.STYLE_IMAGE, context.DIFF_IMAGE)
     except Exception as e:
         logger.error(str(e))
         traceback.print_exc()
 
 
-# @timeout("Unable to retrieve compare metric content in <seconds> seconds.")
-def waitMetric(metricFile):
-    """
-    Waits for the given metric file to contain some content and returns the lines array
-    """
-    while True:
-        with open(metricFile, "r") as metric:
-            lines = metric.readlines()
-            if len(lines) > 0:
-                return [x.strip() for x in lines]
-        time.sleep(1)
-    return []
-
-
 def clear_html_page_source(page_source):
     # parse html content
     soup = BeautifulSoup(page_source, "html.parser")
@@ -0,0 +1,169 @@
+import threading
+import logging
+import queue
+import time
+import sys
+
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.append("/opt/code/behave_django")
+
+from utility.config_handler import get_cometa_socket_url, get_cometa_backend_url
+
+# setup logging
+logger = logging.getLogger("FeatureExecution")
+
+# maximum number of events sent to the websocket server in a single request
+EVENT_BATCH_SIZE = 50
+# seconds the sender thread waits for more events before sending an incomplete batch
+EVENT_BATCH_INTERVAL = 0.2
+# seconds to wait for pending events when flushing, i.e. in after_all
+EVENT_FLUSH_TIMEOUT = 30
+# maximum number of step results saved in a single request to django
+STEP_RESULT_BATCH_SIZE = 25
+# seconds the sender thread waits for more step results before sending an incomplete batch
+STEP_RESULT_BATCH_INTERVAL = 0.5
+
+
+class BatchSender:
+    """
+    Queues items and sends them in batches from a background thread using send_batch(batch)
+    flush() waits until every queued item has been sent
+    """
+
+    def __init__(self, name, send_batch, batch_size, batch_interval):
+        self.name = name
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.__items = queue.Queue()
+        # number of items queued and not sent yet, used by flush
+        self.__pending = 0
+        self.__pending_condition = threading.Condition()
+        self.__sender = threading.Thread(target=self.__send_batches, name=name, daemon=True)
+        self.__sender.start()
+
+    def put(self, item):
+        with self.__pending_condition:
+            self.__pending += 1
+        self.__items.put(item)
+
+    def flush(self, timeout=EVENT_FLUSH_TIMEOUT):
+        """Waits until all queued items have been sent, returns False if timeout was reached"""
+        with self.__pending_condition:
+            sent = self.__pending_condition.wait_for(lambda: self.__pending == 0, timeout=timeout)
+        if not sent:
+            logger.warning(f"{self.name}: {self.__pending} items still pending after {timeout} seconds")
+        return sent
+
+    def __collect_batch(self):
+        batch = [self.__items.get()]
+        deadline = time.time() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.__items.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # sort is stable, items of the same step keep the order in which they were queued
+        batch.sort(key=lambda item: item["sequence"])
+        return batch
+
+    def __send_batches(self):
+        while True:
+            batch = self.__collect_batch()
+            try:
+                self.send_batch(batch)
+            except Exception as exception:
+                logger.error(f"{self.name}: unable to send batch of {len(batch)} items: {str(exception)}")
+            finally:
+                with self.__pending_condition:
+                    self.__pending -= len(batch)
+                    self.__pending_condition.notify_all()
+
+
+class EventClient:
+    """
+    Per execution client used for all behave -> websocket / backend traffic
+
+    * session: keep-alive requests session, reuses the TCP connections to django and the websocket server
+    * send(): queues websocket events (stepBegin, stepDetail, stepFinished) which are sent in batches
+      to /events/batch by a background thread, so step execution does not wait for the websocket server
+    * save_step_result(): queues step results which are saved in batches using /step_results/<id>/bulk/
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.__events = BatchSender("EventClientSender", self.__send_events, EVENT_BATCH_SIZE, EVENT_BATCH_INTERVAL)
+        self.__step_results = BatchSender("StepResultSender", self.__save_step_results, STEP_RESULT_BATCH_SIZE, STEP_RESULT_BATCH_INTERVAL)
+
+    def send(self, feature_id, event, data, sequence=0):
+        """
+        Queue a websocket event, event is the endpoint name in the websocket server (i.e. stepFinished)
+        sequence is the step_execution_sequence the event belongs to, events in a batch are ordered by it
+        """
+        self.__events.put({"feature_id": feature_id, "event": event, "sequence": sequence, "data": data})
+
+    def save_step_result(self, feature_result_id, data):
+        """
+        Queue a step result to be saved in django, relative_execution_time is calculated by django
+        data must contain the step_execution_sequence
+        """
+        self.__step_results.put({"feature_result_id": feature_result_id, "sequence": data.get("step_execution_sequence", 0), "data": data})
+
+    def flush_step_results(self, timeout=EVENT_FLUSH_TIMEOUT):
+        """Waits until all queued step results are saved, i.e. before updating a step result"""
+        return self.__step_results.flush(timeout)
+
+    def flush(self, timeout=EVENT_FLUSH_TIMEOUT):
+        """Waits until all queued step results and events have been sent, returns False if timeout was reached"""
+        step_results_saved = self.__step_results.flush(timeout)
+        events_sent = self.__events.flush(timeout)
+        return step_results_saved and events_sent
+
+    def __send_events(self, batch):
+        response = self.session.post(
+            f"{get_cometa_socket_url()}/events/batch",
+            json={"events": batch},
+        )
+        if response.status_code != 200:
+            logger.error(f"Websocket batch of {len(batch)} events failed: {response.status_code} {response.text}")
+        elif response.json().get("failed"):
+            logger.error(f"Some websocket events were not processed: {response.json()['failed']}")
+
+    def __save_step_results(self, batch):
+        # behave runs one feature result per process, but group anyway to never mix them
+        feature_results = {}
+        for item in batch:
+            feature_results.setdefault(item["feature_result_id"], []).append(item["data"])
+        for feature_result_id, step_results in feature_results.items():
+            response = self.session.post(
+                f"{get_cometa_backend_url()}/step_results/{feature_result_id}/bulk/",
+                headers={"Host": "cometa.local"},
+                json={"step_results": step_results},
+            )
+            if response.status_code != 201:
+                logger.error(f"Saving {len(step_results)} step results failed: {response.status_code} {response.text}")
+            elif response.json().get("failed"):
+                # rows are saved one by one when the batch is rejected, only the invalid ones are lost
+                logger.error(f"Some step results were not saved: {response.json()['failed']}")
+
+
+_event_client = None
+_event_client_lock = threading.Lock()
+
+
+def get_event_client():
+    """Returns the event client of the current execution, behave runs one feature per process"""
+    global _event_client
+    with _event_client_lock:
+        if _event_client is None:
+            _event_client = EventClient()
+    return _event_client
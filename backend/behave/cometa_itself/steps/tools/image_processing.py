@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# setup logging
+logger = logging.getLogger("FeatureExecution")
+
+# quality used for the screenshots shown in the step results, same as toWebP
+WEBP_QUALITY = 70
+# cv2 encodes WebP lossless when quality is above 100
+WEBP_LOSSLESS_QUALITY = 101
+# grayscale difference from which a pixel is considered different
+PIXEL_DIFF_THRESHOLD = 30
+# number of decoded templates kept in memory
+BASELINE_CACHE_SIZE = 32
+# size in pixels of the tiles compared independently, only tiles with a different checksum are diffed
+TILE_SIZE = 128
+
+
+# -----------
+# In memory screenshot pipeline, the PNG returned by the driver is decoded once,
+# compared with the decoded template, stamped and encoded to WebP once,
+# without calling ImageMagick (convert / compare) for every screenshot
+# -----------
+
+def decode_image(image_data):
+    """Decodes PNG/WebP bytes into a BGR array, returns None if data is not an image"""
+    image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        logger.error("Unable to decode image data")
+    return image
+
+
+def encode_webp(image, quality=WEBP_QUALITY):
+    """Encodes a BGR array to WebP bytes"""
+    success, encoded = cv2.imencode(".webp", image, [cv2.IMWRITE_WEBP_QUALITY, quality])
+    if not success:
+        raise Exception("Unable to encode image to WebP")
+    return encoded.tobytes()
+
+
+def write_file(path, data):
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def is_lossy_webp(image_data):
+    # RIFF <size> WEBP VP8L ... is lossless, "VP8 " and extended "VP8X" are saved lossy by PIL
+    return image_data[8:12] == b"WEBP" and image_data[12:16] != b"VP8L"
+
+
+def perceptual_hash(image):
+    """64 bit difference hash of the image, similar images have hashes with a small hamming distance"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return "%016x" % int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def hash_distance(hash1, hash2):
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count("1")
+
+
+def tile_checksums(image, tile_size=TILE_SIZE):
+    """Checksum of every tile of the image, row by row"""
+    height, width = image.shape[:2]
+    return [
+        [
+            zlib.crc32(np.ascontiguousarray(image[y:y + tile_size, x:x + tile_size]).data)
+            for x in range(0, width, tile_size)
+        ]
+        for y in range(0, height, tile_size)
+    ]
+
+
+def image_signature(image):
+    return {
+        "shape": list(image.shape[:2]),
+        "tile_size": TILE_SIZE,
+        "phash": perceptual_hash(image),
+        "tiles": tile_checksums(image),
+    }
+
+
+def signature_path(template_path):
+    # template_{index}.webp -> template_{index}.json
+    return os.path.splitext(template_path)[0] + ".json"
+
+
+class BaselineCache:
+    """
+    Keeps decoded templates in memory, entries are invalidated when the template file changes
+    Templates are stored lossless, old templates were stored with WEBP_QUALITY and are
+    compared against the current screenshot encoded with the same quality
+
+    Next to every template a signature file (template_{index}.json) keeps its perceptual hash
+    and tile checksums, it is created on the first comparison for templates that do not have it
+    """
+
+    def __init__(self, size=BASELINE_CACHE_SIZE):
+        self.size = size
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __file_version(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path):
+        """Returns the template as {"image", "lossless", "signature"} or None if it does not exist"""
+        try:
+            version = self.__file_version(path)
+        except FileNotFoundError:
+            return None
+        with self.__lock:
+            entry = self.__entries.get(path)
+            if entry and entry["version"] == version:
+                self.__entries.move_to_end(path)
+                return entry
+
+        with open(path, "rb") as file:
+            image_data = file.read()
+        image = decode_image(image_data)
+        if image is None:
+            return None
+        # old styles migrated by migrateOldStyles are PNG files
+        lossless = not is_lossy_webp(image_data)
+        signature = self.__load_signature(path, version)
+        if signature is None:
+            signature = self.__save_signature(path, version, image)
+        return self.__store(path, version, image, lossless, signature)
+
+    def save(self, path, image, signature=None):
+        """Saves image as template, encoded once and kept decoded in memory"""
+        write_file(path, encode_webp(image, WEBP_LOSSLESS_QUALITY))
+        version = self.__file_version(path)
+        signature = self.__save_signature(path, version, image, signature)
+        return self.__store(path, version, image, True, signature)
+
+    @staticmethod
+    def __load_signature(path, version):
+        try:
+            with open(signature_path(path)) as file:
+                signature = json.load(file)
+        except (OSError, ValueError):
+            return None
+        # template was replaced after the signature was saved
+        if signature.get("template_version") != list(version) or signature.get("tile_size") != TILE_SIZE:
+            return None
+        return signature
+
+    @staticmethod
+    def __save_signature(path, version, image, signature=None):
+        signature = dict(signature or image_signature(image), template_version=list(version))
+        try:
+            with open(signature_path(path), "w") as file:
+                json.dump(signature, file)
+        except OSError as exception:
+            logger.warning(f"Unable to save template signature for {path}: {str(exception)}")
+        return signature
+
+    def __store(self, path, version, image, lossless, signature):
+        entry = {"version": version, "image": image, "lossless": lossless, "signature": signature}
+        with self.__lock:
+            self.__entries[path] = entry
+            self.__entries.move_to_end(path)
+            while len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+        return entry
+
+
+baseline_cache = BaselineCache()
+
+
+def difference_mask(current, baseline):
+    """Returns the number of different pixels and the mask of the different pixels of two images with the same size"""
+    # Compute absolute pixel differences and threshold to detect actual changes
+    gray_diff = cv2.cvtColor(cv2.absdiff(current, baseline), cv2.COLOR_BGR2GRAY)
+    _, mask = cv2.threshold(gray_diff, PIXEL_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
+    return cv2.countNonZero(mask), mask
+
+
+def compare_images(current, baseline):
+    """
+    Compares two BGR arrays, returns the number of different pixels and
+    the current image with the different pixels highlighted in red
+    """
+    if current.shape != baseline.shape:
+        baseline = cv2.resize(baseline, (current.shape[1], current.shape[0]))
+
+    diff_pixel_count, mask = difference_mask(current, baseline)
+    highlighted = current.copy()
+    # Apply red color where there are differences
+    highlighted[mask == 255] = [0, 0, 255]  # Red color (BGR)
+    return diff_pixel_count, highlighted
+
+
+def compare_with_baseline(current, baseline, current_signature=None):
+    """
+    Compares the current image with a template returned by BaselineCache, only the tiles
+    whose checksum differs from the template signature are diffed
+    Returns the number of different pixels, the highlighted image (None when both are identical)
+    and the diff map {"phash_distance", "tile_size", "tiles": [{"row", "column", "pixel_diff"}, ...]}
+    """
+    signature = baseline["signature"]
+    # lossy templates are compared with the current image encoded the same way,
+    # otherwise WebP compression artifacts are counted as differences
+    if not baseline["lossless"]:
+        current = decode_image(encode_webp(current))
+        current_signature = None
+    current_signature = current_signature or image_signature(current)
+
+    diff_map = {
+        "phash_distance": hash_distance(current_signature["phash"], signature["phash"]),
+        "tile_size": TILE_SIZE,
+        "tiles": [],
+    }
+    # different resolution, tiles can not be matched
+    if current_signature["shape"] != signature["shape"]:
+        diff_pixel_count, highlighted = compare_images(current, baseline["image"])
+        return diff_pixel_count, highlighted, diff_map
+
+    changed_tiles = [
+        (row, column)
+        for row, checksums in enumerate(current_signature["tiles"])
+        for column, checksum in enumerate(checksums)
+        if checksum != signature["tiles"][row][column]
+    ]
+    if not changed_tiles:
+        return 0, None, diff_map
+
+    diff_pixel_count, highlighted = 0, current.copy()
+    for row, column in changed_tiles:
+        y, x = row * TILE_SIZE, column * TILE_SIZE
+        tile_diff, mask = difference_mask(current[y:y + TILE_SIZE, x:x + TILE_SIZE], baseline["image"][y:y + TILE_SIZE, x:x + TILE_SIZE])
+        if tile_diff:
+            highlighted[y:y + TILE_SIZE, x:x + TILE_SIZE][mask == 255] = [0, 0, 255]  # Red color (BGR)
+            diff_pixel_count += tile_diff
+            diff_map["tiles"].append({"row": row, "column": column, "pixel_diff": tile_diff})
+    # tiles changed below the threshold
+    if not diff_pixel_count:
+        return 0, None, diff_map
+    return diff_pixel_count, highlighted, diff_map
+
+
+def add_timestamp(image, timestamp=None):
+    """Returns a copy of the image with the timestamp in the bottom right corner, same look as the old convert -annotate"""
+    image = image.copy()
+    timestamp = timestamp or time.strftime("%a %b %d %H:%M:%S %Z %Y")
+    font, font_scale, thickness, padding, margin = cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1, 4, 20
+    (text_width, text_height), baseline = cv2.getTextSize(timestamp, font, font_scale, thickness)
+
+    height, width = image.shape[:2]
+    right, bottom = width - margin, height - margin
+    left = max(right - text_width - 2 * padding, 0)
+    top = max(bottom - text_height - baseline - 2 * padding, 0)
+    if right <= left or bottom <= top:
+        return image
+
+    # semi transparent black box behind the text
+    box = image[top:bottom, left:right]
+    image[top:bottom, left:right] = (box * 0.3).astype(np.uint8)
+    cv2.putText(image, timestamp, (left + padding, bottom - padding - baseline), font, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+    return image
@@ -0,0 +1,110 @@
+import os
+import json
+import logging
+import tempfile
+
+# setup logging
+logger = logging.getLogger("FeatureExecution")
+
+# only these performance log entries are parsed, the rest are skipped without json.loads
+RESPONSE_RECEIVED_METHOD = "Network.responseReceived"
+
+
+class NetworkLogAnalyzer:
+    """
+    Analyzes the chrome performance logs after every step looking for vulnerable response headers
+
+    * header names from /api/security/vulnerable_headers/ are lowercased once into a set
+    * log entries are filtered on the raw message, only Network.responseReceived entries are parsed
+    * full responses of every step are appended to a JSONL spill file, only the counts of every step
+      are kept in memory
+    * upload_body() streams the spill file into the body expected by /api/security/network_headers/
+    """
+
+    def __init__(self, vulnerability_headers_info, spill_path=None):
+        self.header_names = frozenset(
+            header_info["header_name"].lower() for header_info in vulnerability_headers_info
+        )
+        if spill_path is None:
+            spill_file, spill_path = tempfile.mkstemp(prefix="network_responses_", suffix=".jsonl")
+            os.close(spill_file)
+        self.spill_path = spill_path
+        # [{"step_id", "network_response_count", "vulnerability_headers_count"}, ...]
+        self.summaries = []
+
+    def filter_vulnerability_headers(self, headers: dict) -> list:
+        """Returns [{header_name: value}, ...] for every response header configured as vulnerable"""
+        return [
+            {header_name.lower(): value}
+            for header_name, value in headers.items()
+            if header_name.lower() in self.header_names
+        ]
+
+    def analyze_step(self, performance_logs, step_index) -> int:
+        """Spills the responses of the step to disk and returns the number of responses with vulnerable headers"""
+        responses_and_vulnerable_header = []
+        vulnerability_headers_count = 0
+        for logs in performance_logs:
+            message = logs["message"]
+            # cheap check on the raw string, most entries are requests, timings, data received ...
+            if RESPONSE_RECEIVED_METHOD not in message:
+                continue
+            information = json.loads(message)["message"]
+            if information["method"] != RESPONSE_RECEIVED_METHOD:
+                continue
+            response = information["params"]["response"]
+            vulnerable_headers = self.filter_vulnerability_headers(response["headers"])
+            if vulnerable_headers:
+                vulnerability_headers_count += 1
+            responses_and_vulnerable_header.append(
+                {
+                    "response": response,
+                    "vulnerable_headers": vulnerable_headers,
+                }
+            )
+
+        with open(self.spill_path, "a") as spill_file:
+            spill_file.write(
+                json.dumps(
+                    {
+                        "step_id": step_index,
+                        "responses_and_vulnerable_header": responses_and_vulnerable_header,
+                        "vulnerability_headers_count": vulnerability_headers_count,
+                    }
+                )
+                + "\n"
+            )
+        self.summaries.append(
+            {
+                "step_id": step_index,
+                "network_response_count": len(responses_and_vulnerable_header),
+                "vulnerability_headers_count": vulnerability_headers_count,
+            }
+        )
+        return vulnerability_headers_count
+
+    def totals(self):
+        """Returns the total number of network responses and of responses with vulnerable headers"""
+        network_response_count = sum(summary["network_response_count"] for summary in self.summaries)
+        vulnerable_response_count = sum(summary["vulnerability_headers_count"] for summary in self.summaries)
+        return network_response_count, vulnerable_response_count
+
+    def upload_body(self, result_id):
+        """
+        Writes the /api/security/network_headers/ request body to a file next to the spill file and returns its path,
+        the responses are copied line by line so they are never loaded in memory at once
+        """
+        network_response_count, vulnerable_response_count = self.totals()
+        body_path = self.spill_path + ".body.json"
+        with open(body_path, "w") as body_file:
+            body_file.write(
+                '{"result_id": %s, "vulnerable_response_count": %d, "network_response_count": %d, "responses": ['
+                % (json.dumps(result_id), vulnerable_response_count, network_response_count)
+            )
+            with open(self.spill_path) as spill_file:
+                for position, line in enumerate(spill_file):
+                    if position:
+                        body_file.write(",")
+                    body_file.write(line.rstrip("\n"))
+            body_file.write("]}")
+        return body_path
@@ -0,0 +1,151 @@
+import sys
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+sys.path.append("/opt/code/behave_django")
+
+from utility.configurations import ConfigurationManager
+
+# setup logging
+logger = logging.getLogger("FeatureExecution")
+
+# stages measured for every screenshot, see _async_process_screen_shot
+SCREENSHOT_STAGES = ("convert", "compare", "timestamp", "upload")
+# log when submit had to wait for a free slot in the queue longer than this (seconds)
+BACKPRESSURE_LOG_THRESHOLD = 0.05
+
+
+class ScreenshotTimings:
+    """Timings of a single screenshot task, filled using: with timings.measure("compare"): ..."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0) + (time.perf_counter() - start) * 1000
+
+
+class ScreenshotWorkerPool:
+    """
+    Fixed number of threads processing screenshots from a bounded queue
+
+    * submit() blocks the step loop when the queue is full, so screenshots can not pile up in memory
+    * every task receives a ScreenshotTimings, stage timings are aggregated in metrics()
+    * drain() waits until all submitted screenshots are processed, used in after_all
+    """
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.__tasks = queue.Queue(maxsize=queue_size)
+        self.__pending = 0
+        self.__pending_condition = threading.Condition()
+        self.__metrics_lock = threading.Lock()
+        self.__metrics = {
+            "tasks": 0,
+            "failed": 0,
+            "queue_wait": 0,
+            "backpressure_wait": 0,
+            "stages": {stage: {"total": 0, "max": 0} for stage in SCREENSHOT_STAGES},
+        }
+        for index in range(workers):
+            threading.Thread(target=self.__work, name=f"ScreenshotWorker-{index}", daemon=True).start()
+
+    def submit(self, task):
+        """Queue task(timings), waits for a free slot when the queue is full"""
+        with self.__pending_condition:
+            self.__pending += 1
+        start = time.perf_counter()
+        self.__tasks.put((task, time.perf_counter()))
+        waited = time.perf_counter() - start
+        if waited > BACKPRESSURE_LOG_THRESHOLD:
+            logger.debug(f"Screenshot queue full, step waited {waited * 1000:.0f}ms to queue the screenshot")
+            with self.__metrics_lock:
+                self.__metrics["backpressure_wait"] += waited * 1000
+
+    def drain(self, timeout):
+        """Waits until every submitted screenshot is processed, returns False if timeout was reached"""
+        with self.__pending_condition:
+            drained = self.__pending_condition.wait_for(lambda: self.__pending == 0, timeout=timeout)
+        if not drained:
+            logger.warning(f"{self.__pending} screenshots still being processed after {timeout} seconds")
+        return drained
+
+    def metrics(self):
+        """Number of tasks and total / average / max milliseconds spent in every stage"""
+        with self.__metrics_lock:
+            tasks = self.__metrics["tasks"]
+            return {
+                "tasks": tasks,
+                "failed": self.__metrics["failed"],
+                "avg_queue_wait": round(self.__metrics["queue_wait"] / tasks, 2) if tasks else 0,
+                "backpressure_wait": round(self.__metrics["backpressure_wait"], 2),
+                "stages": {
+                    stage: {
+                        "total": round(values["total"], 2),
+                        "avg": round(values["total"] / tasks, 2) if tasks else 0,
+                        "max": round(values["max"], 2),
+                    }
+                    for stage, values in self.__metrics["stages"].items()
+                },
+            }
+
+    def __work(self):
+        while True:
+            task, queued_at = self.__tasks.get()
+            queue_wait = (time.perf_counter() - queued_at) * 1000
+            timings = ScreenshotTimings()
+            failed = False
+            try:
+                task(timings)
+            except Exception as exception:
+                failed = True
+                logger.exception(f"Screenshot processing failed: {str(exception)}")
+            finally:
+                self.__record(timings, queue_wait, failed)
+                with self.__pending_condition:
+                    self.__pending -= 1
+                    self.__pending_condition.notify_all()
+
+    def __record(self, timings, queue_wait, failed):
+        with self.__metrics_lock:
+            self.__metrics["tasks"] += 1
+            self.__metrics["failed"] += int(failed)
+            self.__metrics["queue_wait"] += queue_wait
+            for stage, milliseconds in timings.stages.items():
+                values = self.__metrics["stages"].setdefault(stage, {"total": 0, "max": 0})
+                values["total"] += milliseconds
+                values["max"] = max(values["max"], milliseconds)
+
+
+_screenshot_pool = None
+_screenshot_pool_lock = threading.Lock()
+
+
+def get_screenshot_pool():
+    """Returns the screenshot pool of the current execution, created on the first screenshot"""
+    global _screenshot_pool
+    with _screenshot_pool_lock:
+        if _screenshot_pool is None:
+            workers = int(ConfigurationManager.get_configuration("COMETA_SCREENSHOT_WORKERS", 4))
+            queue_size = int(ConfigurationManager.get_configuration("COMETA_SCREENSHOT_QUEUE_SIZE", 8))
+            _screenshot_pool = ScreenshotWorkerPool(max(workers, 1), max(queue_size, 1))
+    return _screenshot_pool
+
+
+def drain_screenshot_pool():
+    """Waits for the pending screenshots and logs the pool metrics, does nothing if no screenshot was taken"""
+    if _screenshot_pool is None:
+        return True
+    timeout = int(ConfigurationManager.get_configuration("COMETA_SCREENSHOT_DRAIN_TIMEOUT", 120))
+    start = time.time()
+    drained = _screenshot_pool.drain(timeout)
+    logger.info(f"Screenshots drained in {time.time() - start:.2f}s, metrics: {_screenshot_pool.metrics()}")
+    return drained
@@ -0,0 +1,121 @@
+import re
+import json
+import logging
+
+# setup logging
+logger = logging.getLogger("FeatureExecution")
+
+# Single tokenizer for everything the @done decorator replaces in step parameters and text
+#   ${VAR} and $VAR -> environment / runtime variables
+#   %index          -> "index" variable set by loops, job parameter "index" otherwise
+#   %param          -> job parameters (schedule step / data driven)
+TOKEN_PATTERN = re.compile(
+    r"\$\{(?P<braced>[a-zA-Z_][a-zA-Z0-9_]*)\}"
+    r"|\$(?P<variable>[a-zA-Z_][a-zA-Z0-9_]*)\b"
+    r"|%(?P<parameter>[a-zA-Z0-9_]+)\b"
+)
+# backslashes are escaped when values are replaced in the step text (usually JSON), except unicode sequences
+BACKSLASH_PATTERN = re.compile(r"\\(?!u[0-9a-fA-F]{4})")
+
+
+class VariableSubstitution:
+    """
+    Per execution index of the feature variables and job parameters
+
+    context.VARIABLES and context.PARAMETERS stay JSON strings for the steps reading them,
+    this class parses them once, keeps variables indexed by name, caches decrypted values
+    and is updated incrementally by addVariable / addTestRuntimeVariable
+    """
+
+    def __init__(self, variables_json, parameters_json, decrypt):
+        self.decrypt = decrypt
+        self.load_variables(variables_json)
+        self.load_parameters(parameters_json)
+
+    def load_variables(self, variables_json):
+        self.variables_json = variables_json
+        self.variables = json.loads(variables_json)
+        # name -> position in self.variables, first variable wins as in the old linear search
+        self.__positions = {}
+        for position, variable in enumerate(self.variables):
+            self.__positions.setdefault(variable["variable_name"], position)
+        # name -> (raw value, decrypted value)
+        self.__decrypted = {}
+
+    def load_parameters(self, parameters_json):
+        self.parameters_json = parameters_json
+        self.parameters = json.loads(parameters_json)
+        self.__decrypted_parameters = {}
+
+    def sync(self, variables_json, parameters_json):
+        """Reloads variables or parameters replaced without using this class, i.e. context.PARAMETERS = json.dumps(...)"""
+        if variables_json is not self.variables_json:
+            logger.debug("Variables changed outside of the variable index, reloading")
+            self.load_variables(variables_json)
+        if parameters_json is not self.parameters_json:
+            self.load_parameters(parameters_json)
+
+    def get(self, variable_name):
+        """Returns the variable dict or None"""
+        position = self.__positions.get(variable_name)
+        return None if position is None else self.variables[position]
+
+    def set_variable(self, variable):
+        """Adds the variable or replaces the existing one with the same name"""
+        variable_name = variable["variable_name"]
+        position = self.__positions.get(variable_name)
+        if position is None:
+            self.__positions[variable_name] = len(self.variables)
+            self.variables.append(variable)
+        else:
+            self.variables[position] = variable
+        self.__decrypted.pop(variable_name, None)
+
+    def dumps(self):
+        """Serializes the variables, the returned string must be assigned to context.VARIABLES"""
+        self.variables_json = json.dumps(self.variables)
+        return self.variables_json
+
+    def decrypted_value(self, variable_name):
+        variable = self.get(variable_name)
+        if variable is None:
+            return None
+        raw_value = str(variable["variable_value"])
+        cached = self.__decrypted.get(variable_name)
+        # value can be changed in place by addTestRuntimeVariable / addVariable
+        if cached is None or cached[0] != raw_value:
+            cached = (raw_value, self.decrypt(raw_value))
+            self.__decrypted[variable_name] = cached
+        return cached[1]
+
+    def decrypted_parameter(self, parameter_key):
+        if parameter_key not in self.__decrypted_parameters:
+            self.__decrypted_parameters[parameter_key] = self.decrypt(str(self.parameters[parameter_key]))
+        return self.__decrypted_parameters[parameter_key]
+
+    def substitute(self, value, in_text=False):
+        """
+        Replaces every known token in value, unknown tokens are left as they are
+        in_text: value is the step text, parameters are decrypted and backslashes escaped
+        """
+        if not value or ("$" not in value and "%" not in value):
+            return value
+
+        def replace(match):
+            if match.group("parameter") is not None:
+                name = match.group("parameter")
+                if name == "index" and self.get("index") is not None:
+                    replacement = self.decrypted_value("index")
+                elif name in self.parameters:
+                    replacement = self.decrypted_parameter(name) if in_text else str(self.parameters[name])
+                else:
+                    return match.group(0)
+            else:
+                replacement = self.decrypted_value(match.group("braced") or match.group("variable"))
+                if replacement is None:
+                    return match.group(0)
+            if in_text:
+                replacement = BACKSLASH_PATTERN.sub(r"\\\\", replacement)
+            return replacement
+
+        return TOKEN_PATTERN.sub(replace, value)
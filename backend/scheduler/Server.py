@@ -1,22 +1,26 @@
 import os
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import threading
 import time
-from utils.common import logger
+from utils.common import logger, SCHEDULER_MAX_WORKERS
 from utils.crontab_runner import get_schedules, update_jobs
 
 
 class RequestHandler(BaseHTTPRequestHandler):
 
     def do_GET(self):
-        """Handle GET requests by updating scheduled tasks."""
-        logger.info("Processing get request..")
+        """
+        Handle GET requests by updating scheduled tasks, sent by the backend every time a schedule
+        changes (?schedule_id=<id>), only the changed jobs are updated.
+        """
+        logger.info(f"Processing get request {self.path}..")
         self.send_response(200)
         self.end_headers()
         jobs = get_schedules()
-        update_jobs(scheduler, jobs, called_by="HTTP request")
+        update_jobs(scheduler, jobs, called_by=f"HTTP request {self.path}")
         self.wfile.write(b"Updated crontab\n")
 
 def run_server():
@@ -27,7 +31,8 @@ def run_server():
     httpd.serve_forever()
 
 # Setup the scheduler
-scheduler = BackgroundScheduler()
+# the default executor runs 10 jobs at the same time, jobs firing at the same minute waited for each other
+scheduler = BackgroundScheduler(executors={'default': ThreadPoolExecutor(SCHEDULER_MAX_WORKERS)})
 scheduler.start()
 
 # Create tmp directory if it doesn't exist
@@ -20,6 +20,9 @@ streamLogger.setFormatter(formatter)
 # add the stream handle to logger
 logger.addHandler(streamLogger)
 
+# threads executing the jobs, jobs firing at the same time wait for a free thread
+SCHEDULER_MAX_WORKERS = int(os.getenv('SCHEDULER_MAX_WORKERS', '50'))
+
 DJANGO_SERVER_URL = os.getenv('DJANGO_SERVER_URL', 'django')
 DJANGO_SERVER_PORT = os.getenv('DJANGO_SERVER_PORT', '8000')
 
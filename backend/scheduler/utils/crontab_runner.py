@@ -1,32 +1,114 @@
 import subprocess
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.jobstores.base import JobLookupError
 import os
-from utils.common import get_django_server_url, logger, JOB_LIST_FILE_PATH
+import re
+import hashlib
+import threading
+from utils.common import get_django_server_url, logger, JOB_LIST_FILE_PATH, SCHEDULER_MAX_WORKERS
 from utils.curl_processor import parse_curl_command
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from requests.exceptions import ConnectionError
 import traceback
 
+# id of the job fetching the schedules every minute, the backend also notifies every change (see Server.py)
+UPDATE_JOBS_JOB_ID = "update_jobs"
+# schedule id in the crontab line, from the comment and the request body of the command
+JOB_ID_PATTERNS = (re.compile(r'JobID:\s*(\d+)'), re.compile(r'"jobId":\s*(\d+)'))
+
+# job id -> fingerprint of the job definition of the schedule
+job_fingerprints = {}
+# jobs are updated by the HTTP server and by the minute poll
+jobs_lock = threading.Lock()
+
+# session shared by every job, connections to Django are reused when many jobs fire at the same time
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_connections=10, pool_maxsize=SCHEDULER_MAX_WORKERS))
+http_session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=SCHEDULER_MAX_WORKERS))
+
 def get_schedules():
+    """Fetches scheduled tasks from a Django API, returns None if they could not be fetched."""
     try:
-        """Fetches scheduled tasks from a Django API and updates them in the scheduler."""
         url = f"{get_django_server_url()}/api/schedule/"
-        response = requests.get(url)
+        response = requests.get(url, timeout=30)
     except (requests.exceptions.HTTPError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
         logger.error(f"Connection error while making HTTP request to Django server at {url}, maybe the server is starting up")
-        return []
+        return None
     except Exception as e:
         logger.error(f"Failed to fetch schedules, {e}")
         traceback.print_exc()
-        return []
+        return None
 
     if response.status_code == 200:
-        schedules = response.json().get('schedules', [])
-        return schedules
+        content = response.json()
+        if 'jobs' in content:
+            return content['jobs']
+        # Django without structured jobs, crontab lines are converted
+        return [get_crontab_line_job(job_info) for job_info in content.get('schedules', []) if "curl" in job_info]
     else:
         logger.error(f"Failed to fetch schedules: {response.text}")
-        return []
+        return None
+
+
+def get_crontab_line_job(job_info: str) -> dict:
+    """Job of a crontab line, the command is parsed every time the job fires"""
+    job_id = None
+    for pattern in JOB_ID_PATTERNS:
+        match = pattern.search(job_info)
+        if match:
+            job_id = match.group(1)
+            break
+    # Since command is in string format take the * * * * * and command into different variables
+    schedule_time_and_command = job_info.split("curl", 1)
+    return {
+        # line without schedule id, changing it removes the job and adds a new one
+        "id": job_id or get_fingerprint(job_info),
+        "schedule": schedule_time_and_command[0].strip(),
+        "command": f'curl {schedule_time_and_command[1]}',
+    }
+
+
+def get_fingerprint(value) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True)
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def send_job_request(job: dict):
+    """Sends the request of a structured job, see Schedule.get_job in Django"""
+    if job.get("file_id") is not None:
+        logger.info(f"[CRON SCHEDULER] Executing SCHEDULED DATA-DRIVEN test - File ID: {job['file_id']}, URL: {job['url']}")
+    elif job.get("feature_id") is not None:
+        logger.info(f"[CRON SCHEDULER] Executing SCHEDULED FEATURE test - Feature ID: {job['feature_id']}, URL: {job['url']}")
+    else:
+        logger.info(f"[CRON SCHEDULER] Executing SCHEDULED request - URL: {job['url']}")
+
+    try:
+        response = http_session.request(method=job["method"], url=job["url"], json=job.get("body"),
+                                        headers=job.get("headers", {}))
+        logger.info(
+            f"[CRON SCHEDULER] HTTP response - URL: {job['url']}, Status: {response.status_code}, Body: {response.text}"
+        )
+        if response.status_code != 200:
+            logger.error(f"[CRON SCHEDULER] Failed to execute scheduled task {job['id']} - Status: {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        logger.exception(f"[CRON SCHEDULER] Error while making HTTP request of scheduled task {job['id']}", exc_info=e)
+
+
+def compile_job(job: dict):
+    """
+    Returns the function executed every time the job fires, jobs are validated once when they are added.
+    Raises ValueError if the job can not be executed.
+    """
+    if job.get("command"):
+        command = job["command"]
+        return lambda: run_command(command)
+    if not job.get("url") or not job.get("method"):
+        raise ValueError("job without url or method")
+    job = dict(job, method=job["method"].upper())
+    return lambda: send_job_request(job)
 
 
 def run_command(command: str):
@@ -60,7 +142,7 @@ def run_command(command: str):
                 logger.info(
                     f"[CRON SCHEDULER] Sending HTTP request to {parsed_info['url']}, Request Method : {parsed_info.get('method')}, Request body : {request_body}"
                 )
-                response = requests.request(
+                response = http_session.request(
                     method=parsed_info.get("method"),
                     json=request_body,
                     url=parsed_info.get("url"),
@@ -90,24 +172,54 @@ def run_command(command: str):
         logger.exception(f"Exception when running command {command}", exc_info=e)
 
 def update_jobs(scheduler, jobs, called_by="Scheduler"):
-    """Updates the scheduler with new jobs from fetched schedules."""
-    # Clear existing jobs
-    scheduler.remove_all_jobs()
-    logger.info(f"Updating jobs, Called by {called_by}")
-
-    # Add new jobs from fetched schedules
-    os.makedirs(os.path.dirname(JOB_LIST_FILE_PATH), exist_ok=True)
-    job_file = open(JOB_LIST_FILE_PATH, "w")
-    for job_info in jobs:
-        job_file.writelines(job_info+"\n")
-        schedule_time_and_command = job_info.split("curl")
-        if len(schedule_time_and_command) > 1:
-            # Since command is in string format take the * * * * * and command into different variables
-            cron_schedule = schedule_time_and_command[0]
-            job_command = f'curl {schedule_time_and_command[1]}'
-            scheduler.add_job(run_command, CronTrigger.from_crontab(cron_schedule), args=[job_command],
+    """
+    Updates the scheduler with the fetched jobs, only the jobs of the schedules added, changed or
+    removed since the last update are touched, the other jobs keep their next run time.
+    """
+    with jobs_lock:
+        # Add auto update job to the scheduler
+        if scheduler.get_job(UPDATE_JOBS_JOB_ID) is None:
+            scheduler.add_job(lambda: update_jobs(scheduler, get_schedules(), called_by="Minute poll"), 'interval',
+                              minutes=1, misfire_grace_time=10, id=UPDATE_JOBS_JOB_ID)
+
+        # schedules could not be fetched, current jobs are kept until the next update
+        if jobs is None:
+            logger.warning(f"Schedules not available, keeping {len(job_fingerprints)} jobs, Called by {called_by}")
+            return
+
+        fetched_jobs = {f"schedule_{job['id']}": job for job in jobs}
+
+        removed = [job_id for job_id in job_fingerprints if job_id not in fetched_jobs]
+        for job_id in removed:
+            try:
+                scheduler.remove_job(job_id)
+            except JobLookupError:
+                pass
+            del job_fingerprints[job_id]
+
+        added = changed = 0
+        for job_id, job in fetched_jobs.items():
+            fingerprint = get_fingerprint(job)
+            if job_fingerprints.get(job_id) == fingerprint:
+                continue
+            try:
+                trigger = CronTrigger.from_crontab(job["schedule"])
+                execute = compile_job(job)
+            except ValueError as e:
+                logger.error(f"Invalid job {job_id} ({job}): {e}")
+                continue
+            # replaces the job of a changed schedule
+            scheduler.add_job(execute, trigger, id=job_id, name=job_id, replace_existing=True,
                               max_instances=100)
+            if job_id in job_fingerprints:
+                changed += 1
+            else:
+                added += 1
+            job_fingerprints[job_id] = fingerprint
+
+        logger.info(f"Updated jobs, {added} added, {changed} changed, {len(removed)} removed, {len(job_fingerprints)} scheduled, Called by {called_by}")
 
-    # Add auto update job to the scheduler
-    scheduler.add_job(lambda: update_jobs(scheduler, get_schedules()), 'interval', minutes=1, misfire_grace_time=10 )
-    job_file.close()
+        if added or changed or removed:
+            os.makedirs(os.path.dirname(JOB_LIST_FILE_PATH), exist_ok=True)
+            with open(JOB_LIST_FILE_PATH, "w") as job_file:
+                job_file.writelines(json.dumps(job) + "\n" for job in jobs)
@@ -1,11 +1,11 @@
 import re
 
-def parse_curl_command(curl_command):
-    # Regex to extract URL, HTTP method, and data
-    url_pattern = re.compile(r'-X\s+(\w+)\s+(\S+)')
-    data_pattern = re.compile(r"--data\s+'(\{.*?\})'")
-    header_pattern = re.compile(r'-H\s+"([^"]+)"')
+# Regex to extract URL, HTTP method, and data, compiled once
+url_pattern = re.compile(r'-X\s+(\w+)\s+(\S+)')
+data_pattern = re.compile(r"--data\s+'(\{.*?\})'")
+header_pattern = re.compile(r'-H\s+"([^"]+)"')
 
+def parse_curl_command(curl_command):
     # Find method and URL
     method_url_match = url_pattern.search(curl_command)
     method, url = method_url_match.groups() if method_url_match else ("", "")
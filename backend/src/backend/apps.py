@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BackendConfig(AppConfig):
     name = 'backend'
+
+    def ready(self):
+        """Import signals when app is ready"""
+        from . import signals
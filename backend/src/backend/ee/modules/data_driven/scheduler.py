@@ -0,0 +1,203 @@
+# ###
+# Sponsored by Mercedes-Benz AG, Stuttgart
+# ###
+
+from backend.models import (
+    Cloud,
+    Feature,
+    Feature_result,
+)
+from backend.views import logger
+from backend.utility.configurations import ConfigurationManager
+from .models import DataDriven_Runs
+from collections import deque, Counter
+from django.db.models import Count
+from django.utils import timezone
+import datetime
+import threading
+
+# feature results running for longer are considered lost, same as the timeout of dataDrivenExecution
+MAX_EXECUTION_TIMEOUT = 7500
+
+
+class DataDrivenRunState:
+    """Rows of a data driven run waiting to be executed"""
+
+    def __init__(self, request, rows, ddr, parallel_limit, execute_row):
+        self.request = request
+        self.pending = deque(rows)
+        self.ddr = ddr
+        self.parallel_limit = parallel_limit
+        self.execute_row = execute_row
+        self.active = 0
+        self.stopped = False
+        self.finished = threading.Event()
+        # feature_id / feature_name -> {cloud: browsers}
+        self.costs = {}
+
+    def row_cost(self, row):
+        """Returns the browsers that will be started for the row, grouped by cloud"""
+        data = row.data
+        # co_browser replaces the browsers of the feature with a single local browser, see runFeature
+        if 'co_browser' in data:
+            return Counter({'local': 1})
+        key = data.get('feature_id') or data.get('feature_name')
+        if key not in self.costs:
+            feature = Feature.objects.filter(pk=data['feature_id']).first() if str(data.get('feature_id', '')).isnumeric() else None
+            if feature is None:
+                feature = Feature.objects.filter(feature_name=data.get('feature_name')).first()
+            self.costs[key] = get_browsers_cost(feature.browsers if feature else [])
+        return self.costs[key]
+
+
+def get_browsers_cost(browsers):
+    cost = Counter()
+    clouds = {cloud.name: cloud for cloud in Cloud.objects.filter(name__in=[get_browser_cloud(browser) for browser in browsers])}
+    for browser in browsers:
+        cloud_name = get_browser_cloud(browser)
+        cloud = clouds.get(cloud_name)
+        concurrency = 1
+        # same concurrency used by runFeature
+        if cloud and cloud.concurrency:
+            concurrency = min(browser.get('concurrency', 1), cloud.max_concurrency)
+        cost[cloud_name] += concurrency
+    return cost
+
+
+def get_browser_cloud(browser):
+    # see getFeatureBrowsers, outdated favourited browsers do not have the cloud
+    if 'cloud' not in browser and browser.get("os", "").lower() == "generic":
+        return "local"
+    return browser.get('cloud', 'browserstack')
+
+
+def get_cloud_capacity():
+    """Returns the maximum number of browsers running at the same time in every cloud with a limit"""
+    capacity = {
+        cloud.name: cloud.max_concurrency
+        for cloud in Cloud.objects.filter(active=True, max_concurrency__gt=0)
+    }
+    # local browsers are limited by the containers the server can run
+    capacity['local'] = int(ConfigurationManager.get_configuration("COMETA_TEST_CONTAINER_MAXIMUM_RUNNING", "10"))
+    return capacity
+
+
+def get_running_browsers():
+    """Returns the number of browsers running in every cloud, including features started outside of data driven runs"""
+    running_since = timezone.now() - datetime.timedelta(seconds=MAX_EXECUTION_TIMEOUT)
+    running = Feature_result.objects.filter(running=True, result_date__gte=running_since) \
+        .values('browser__cloud').annotate(total=Count('feature_result_id'))
+    return Counter({item['browser__cloud'] or 'browserstack': item['total'] for item in running})
+
+
+class DataDrivenScheduler:
+    """
+    Process wide scheduler of the rows of every running data driven run
+
+    Rows are started when the clouds used by their feature have capacity (Cloud.max_concurrency,
+    COMETA_TEST_CONTAINER_MAXIMUM_RUNNING for local browsers), counting every running feature result.
+    Runs take turns, one row of every run is started per round, and each run keeps its own parallel limit
+    (rows with co_execute_parallel).
+    """
+
+    # capacity is checked again after this many seconds if no row finished, i.e. features of other workers finished
+    POLL_INTERVAL = 5
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._runs = []
+        self._thread = None
+        # browsers of the rows being started, not yet counted as running feature results
+        self._starting = Counter()
+
+    def run(self, request, rows, ddr, parallel_limit, execute_row):
+        """Executes execute_row(request, row, ddr, on_started) for every row and waits until all of them finished"""
+        state = DataDrivenRunState(request, rows, ddr, max(parallel_limit, 1), execute_row)
+        with self._condition:
+            self._runs.append(state)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._schedule, name="data-driven-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+        state.finished.wait()
+
+    def _schedule(self):
+        while True:
+            with self._condition:
+                try:
+                    self._start_rows()
+                except Exception as exception:
+                    logger.exception(exception)
+                self._condition.wait(timeout=self.POLL_INTERVAL)
+
+    def _start_rows(self):
+        if not self._runs:
+            return
+        self._update_stopped_runs()
+        capacity = get_cloud_capacity()
+        usage = get_running_browsers() + self._starting
+        started = True
+        while started:
+            started = False
+            # one row of every run per round
+            for state in list(self._runs):
+                if state.stopped or not state.pending or state.active >= state.parallel_limit:
+                    continue
+                row = state.pending[0]
+                cost = state.row_cost(row)
+                if not self._fits(cost, usage, capacity):
+                    continue
+                state.pending.popleft()
+                state.active += 1
+                usage += cost
+                self._starting += cost
+                threading.Thread(target=self._execute, args=(state, row, cost), daemon=True).start()
+                started = True
+
+    def _update_stopped_runs(self):
+        stopped_run_ids = set(DataDriven_Runs.objects.filter(
+            run_id__in=[state.ddr.run_id for state in self._runs], running=False
+        ).values_list('run_id', flat=True))
+        for state in list(self._runs):
+            if state.ddr.run_id in stopped_run_ids and not state.stopped:
+                logger.debug(f"Data driven run {state.ddr.run_id} stopped, {len(state.pending)} rows will not be executed")
+                state.stopped = True
+                state.pending.clear()
+            self._finish_if_done(state)
+
+    def _fits(self, cost, usage, capacity):
+        for cloud, browsers in cost.items():
+            limit = capacity.get(cloud)
+            # a row needing more browsers than the cloud allows is started once nothing else runs in the cloud
+            if limit is not None and usage[cloud] > 0 and usage[cloud] + browsers > limit:
+                return False
+        return True
+
+    def _finish_if_done(self, state):
+        if state.active == 0 and not state.pending and state in self._runs:
+            self._runs.remove(state)
+            state.finished.set()
+
+    def _execute(self, state, row, cost):
+        starting = [True]
+
+        def on_started():
+            # feature results exist from now on and are counted by get_running_browsers
+            with self._condition:
+                if starting[0]:
+                    starting[0] = False
+                    self._starting -= cost
+
+        try:
+            state.execute_row(state.request, row, state.ddr, on_started)
+        except Exception as exception:
+            logger.exception(exception)
+        finally:
+            on_started()
+            with self._condition:
+                state.active -= 1
+                self._finish_if_done(state)
+                self._condition.notify_all()
+
+
+data_driven_scheduler = DataDrivenScheduler()
@@ -19,12 +19,6 @@ from backend.views import (
     runFeature,
     logger
 )
-from concurrent.futures import (
-    ThreadPoolExecutor,
-    as_completed,
-    TimeoutError,
-    ThreadPoolExecutor
-)
 from backend.utility.decorators import (
     require_permissions,
     require_subscription
@@ -37,6 +31,8 @@ from django.http import JsonResponse
 from backend.utility.uploadFile import getFileContent
 from .models import DataDriven_Runs
 from .serializers import DataDrivenRunsSerializer
+from .scheduler import data_driven_scheduler, MAX_EXECUTION_TIMEOUT
+from backend.utility.feature_result_events import feature_result_listener, publish_feature_results_finished
 import time, json
 from django.views.decorators.http import require_http_methods
 import requests, traceback
@@ -371,7 +367,7 @@ class DataDrivenFileViewset(viewsets.ModelViewSet):
                         # Parse data for the specific sheet and save it
                         temp_data = getFileContent(file, sheet_name=sheet_name)
                         file_data = temp_data
-                        logger.info(f"Successfully parsed {len(temp_data)} rows for sheet '{sheet_name}'")
+                        logger.info(f"Successfully parsed {temp_data.count()} rows for sheet '{sheet_name}'")
                     except Exception as err:
                         return JsonResponse({
                             "success": False,
@@ -649,7 +645,30 @@ class DataDrivenFileViewset(viewsets.ModelViewSet):
                 "error": str(err)
             }, status=200)
 
-def dataDrivenExecution(request, row, ddr: DataDriven_Runs):
+def wait_for_feature_results(feature_result_ids, ddr: DataDriven_Runs, timeout=MAX_EXECUTION_TIMEOUT):
+    """
+    Waits until the feature results are finished, the ddr is stopped or the timeout is reached,
+    the thread wakes up when a feature result is notified as finished (see feature_result_events.py)
+    """
+    start = time.time()
+    running = set(feature_result_ids)
+    with feature_result_listener.watch(feature_result_ids) as watch:
+        while True:
+            found = dict(Feature_result.objects.filter(pk__in=running).values_list('feature_result_id', 'running'))
+            missing = running - set(found)
+            if missing:
+                raise Exception(f'Feature Result with id {missing.pop()} probably failed.')
+            running = {feature_result_id for feature_result_id, is_running in found.items() if is_running}
+            if not running or (time.time() - start) >= timeout:
+                return
+            ddr.refresh_from_db()  # Refresh data from DB if it DDT was stopped in between
+            if not ddr.running:
+                return
+            logger.debug(f"Feature Results {running} are still running, will wait for them.")
+            watch.wait()
+
+
+def dataDrivenExecution(request, row, ddr: DataDriven_Runs, on_started=None):
     data = row.data
     feature_id = data.get('feature_id', None)
     feature_name = data.get('feature_name', None)
@@ -676,6 +695,9 @@ def dataDrivenExecution(request, row, ddr: DataDriven_Runs):
     if not ddr.running:
         return
     result = runFeature(request, feature.feature_id, additional_variables=additional_variables)
+    # feature results are created, the scheduler counts them as running browsers
+    if on_started:
+        on_started()
     
     if not result['success']:
         raise Exception("Feature execution failed: %s" % result['error'])
@@ -684,22 +706,9 @@ def dataDrivenExecution(request, row, ddr: DataDriven_Runs):
     logger.debug(f"Executions started with data driven run id {ddr.run_id} ")
     ddr.feature_results.add(*feature_result_ids)
 
-    MAX_EXECUTION_TIMEOUT=7500
-    start = time.time()
+    wait_for_feature_results(feature_result_ids, ddr)
 
-    for feature_result_id in feature_result_ids:
-        while True:
-            try:
-                fr = Feature_result.objects.get(pk=feature_result_id)
-                ddr.refresh_from_db()  # Refresh data from DB if it DDT was stopped in between  
-                if fr.running and (time.time() - start) < MAX_EXECUTION_TIMEOUT and ddr.running:
-                    logger.debug(f"Feature Result {fr.feature_result_id} is still running, will wait for it.")
-                    time.sleep(10)
-                else:
-                    break
-            except Feature_result.DoesNotExist:
-                raise Exception(f'Feature Result with id {feature_result_id} probably failed.')
-            
+    for fr in Feature_result.objects.filter(pk__in=feature_result_ids).order_by('feature_result_id'):
         # add feature result data to the ddr
         if fr:
             ddr.total += fr.total
@@ -751,28 +760,9 @@ def startDataDrivenRun(request, rows: list[FileData], ddr: DataDriven_Runs, lock
     max_workers = count_of_parallel_tests if count_of_parallel_tests > 0 else 1
 
     try:
-        # This executes one row data at a time with selected browsers 
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            
-            for row in rows:
-                futures.append(executor.submit(dataDrivenExecution, request, row, ddr))
-            
-            for future in as_completed(futures):
-                try:
-                    ddr.refresh_from_db()
-                    logger.debug(f"Checking on ddr status {ddr}")
-                    if not ddr.running:
-                        executor.shutdown(wait=False,cancel_futures=True)
-                        break
-
-                except (TimeoutError, ThreadPoolExecutor) as exception:
-                    logger.exception(exception)
-
-                try:
-                    logger.info(future.result())
-                except Exception as err:
-                    logger.exception(err)
+        # Rows are started when the browser clouds have capacity, shared with the other data driven runs
+        # stops starting rows when the ddr is stopped
+        data_driven_scheduler.run(request, rows, ddr, max_workers, dataDrivenExecution)
 
     except Exception as exception:
         logger.exception(exception)
@@ -1060,6 +1050,7 @@ def stop_data_driven_test(request, *args, **kwargs):
         for task in tasks:
             task.feature_result_id.running = False
             task.feature_result_id.save()
+            publish_feature_results_finished(task.feature_result_id.feature_result_id)
             response = requests.get(f'{get_cometa_behave_url()}/kill_task/' + str(task.pid) + "/")
             logger.debug(f"Killing Task with id {task.task_id}")
             task.delete()
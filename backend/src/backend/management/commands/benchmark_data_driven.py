@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from backend.models import Feature, Feature_result
+from backend.ee.modules.data_driven.models import DataDriven_Runs
+from backend.ee.modules.data_driven.views import wait_for_feature_results
+from backend.utility.feature_result_events import publish_feature_results_finished
+import random
+import threading
+import time
+
+
+class QueryCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def wait_polling(feature_result_ids, ddr, poll_interval):
+    # waiting loop of dataDrivenExecution before feature results were notified
+    for feature_result_id in feature_result_ids:
+        while True:
+            fr = Feature_result.objects.get(pk=feature_result_id)
+            ddr.refresh_from_db()
+            if fr.running and ddr.running:
+                time.sleep(poll_interval)
+            else:
+                break
+
+
+class Command(BaseCommand):
+    help = 'Measures queries and wall time of the data driven rows waiting for their feature results, polling and notified'
+
+    """
+    Run benchmark: python /opt/code/manage.py benchmark_data_driven
+    Run with more rows: python /opt/code/manage.py benchmark_data_driven --rows 500 --parallel 50
+    Feature results are finished by a thread simulating behave, created rows are deleted at the end.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200, help='Number of rows of the synthetic data driven run.')
+        parser.add_argument('--parallel', type=int, default=20, help='Rows executed at the same time.')
+        parser.add_argument('--min-duration', type=float, default=1, help='Minimum seconds a feature result runs.')
+        parser.add_argument('--max-duration', type=float, default=5, help='Maximum seconds a feature result runs.')
+        parser.add_argument('--poll-interval', type=float, default=10, help='Seconds between checks when polling.')
+
+    def handle(self, *args, **options):
+        feature = Feature.objects.first()
+        if feature is None:
+            raise CommandError('At least one feature is needed to create the feature results.')
+        random.seed(options['rows'])
+        durations = [random.uniform(options['min_duration'], options['max_duration']) for _ in range(options['rows'])]
+
+        for name, wait in (
+            ('polling', lambda ids, ddr: wait_polling(ids, ddr, options['poll_interval'])),
+            ('notified', wait_for_feature_results),
+        ):
+            queries, elapsed = self.run_benchmark(feature, durations, options['parallel'], wait)
+            self.stdout.write(f"{name}: {len(durations)} rows, {queries} queries, {elapsed:.2f}s")
+
+    def run_benchmark(self, feature, durations, parallel, wait):
+        counter = QueryCounter()
+        ddr = DataDriven_Runs.objects.create(running=True, status='Benchmark')
+        feature_result_ids = []
+
+        def finish(feature_result_id):
+            # what behave does at the end of the execution (PATCH /api/feature_results/)
+            Feature_result.objects.filter(pk=feature_result_id).update(running=False, total=1, ok=1)
+            publish_feature_results_finished(feature_result_id)
+            connection.close()
+
+        def execute_row(duration):
+            with connection.execute_wrapper(counter):
+                feature_result = Feature_result(feature_id=feature, result_date=timezone.now(), running=True)
+                feature_result.save()
+                feature_result_ids.append(feature_result.feature_result_id)
+                threading.Timer(duration, finish, args=(feature_result.feature_result_id,)).start()
+                wait([feature_result.feature_result_id], ddr)
+            connection.close()
+
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                for future in [executor.submit(execute_row, duration) for duration in durations]:
+                    future.result()
+            return counter.count, time.perf_counter() - start
+        finally:
+            Feature_result.all_objects.filter(pk__in=feature_result_ids).delete()
+            DataDriven_Runs.all_objects.filter(pk=ddr.pk).delete()
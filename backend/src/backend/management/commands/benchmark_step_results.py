@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from backend.models import Feature, Step_result
+from backend.views import serialize_step_results, get_step_result_neighbours
+import time
+
+
+class RollbackBenchmark(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measures queries and time needed to list and navigate the step results of a large feature result, nothing is saved'
+
+    """
+    Run benchmark: python /opt/code/manage.py benchmark_step_results
+    Run with more steps: python /opt/code/manage.py benchmark_step_results --steps 5000 --page-size 500
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--steps',
+            type=int,
+            default=2000,
+            help='Number of step results of the benchmarked feature result.',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=200,
+            help='Number of step results serialized per page, same as the API default.',
+        )
+
+    def measure(self, name, function):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            result = function()
+            elapsed = (time.perf_counter() - start) * 1000
+        self.stdout.write(f"  {name}: {len(queries.captured_queries)} queries, {elapsed:.2f}ms")
+        return result
+
+    def handle(self, *args, **options):
+        steps, page_size = options['steps'], options['page_size']
+        # Step_result.feature_result_id is not a foreign key, an unused id is enough
+        feature_result_id = (Step_result.objects.aggregate(last=Max('feature_result_id'))['last'] or 0) + 1
+        feature_ids = list(Feature.objects.values_list('feature_id', flat=True)[:5]) or [0]
+
+        try:
+            with transaction.atomic():
+                Step_result.objects.bulk_create([
+                    Step_result(
+                        feature_result_id=feature_result_id,
+                        step_execution_sequence=sequence,
+                        step_name=f'Benchmark step {sequence}',
+                        execution_time=10,
+                        relative_execution_time=10 * sequence,
+                        success=True,
+                        belongs_to=feature_ids[sequence % len(feature_ids)],
+                    )
+                    for sequence in range(1, steps + 1)
+                ], batch_size=500)
+                self.stdout.write(f"Benchmarking feature result with {steps} step results, page size {page_size}")
+
+                queryset = Step_result.objects.filter(feature_result_id=feature_result_id).order_by('step_execution_sequence')
+                self.measure('first page', lambda: serialize_step_results(list(queryset[:page_size]), feature_result_id, 0))
+                self.measure('last page', lambda: serialize_step_results(list(queryset[max(steps - page_size, 0):]), feature_result_id, max(steps - page_size, 0)))
+
+                middle = queryset[steps // 2]
+                previous, next = self.measure('step detail navigation', lambda: get_step_result_neighbours(middle))
+                self.stdout.write(f"  step {middle.step_result_id}: previous {previous}, next {next}")
+                raise RollbackBenchmark()
+        except RollbackBenchmark:
+            self.stdout.write(self.style.SUCCESS("Benchmark finished, step results removed"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from backend.utility.run_dispatch_queue import get_dispatch_metrics
+
+
+class Command(BaseCommand):
+    help = 'Shows the feature runs waiting in the run dispatch queue and the dispatch latency'
+
+    """
+    Run: python /opt/code/manage.py run_dispatch_status
+    """
+
+    def handle(self, *args, **options):
+        metrics = get_dispatch_metrics()
+        dispatched = int(metrics.get("dispatched", 0))
+        latency_total = float(metrics.get("latency_total_seconds", 0))
+        self.stdout.write(f"Queued: {metrics['queued']}, processing: {metrics['processing']}, waiting to retry: {metrics['delayed']}")
+        self.stdout.write(f"Dispatched: {dispatched}, retried: {metrics.get('retried', 0)}, failed: {metrics.get('failed', 0)}")
+        if dispatched:
+            self.stdout.write(f"Average latency: {latency_total / dispatched:.3f}s, last latency: {float(metrics.get('last_latency_seconds', 0)):.3f}s")
@@ -9,6 +9,7 @@ from django.shortcuts import redirect
 from backend.utility.configurations import ConfigurationManager
 import urllib3
 from backend.utility.config_handler import get_config
+from backend.utility.principal_cache import get_cached_principal
 from django.utils import timezone
 logger = getLogger()
 
@@ -98,8 +99,11 @@ class AuthenticationMiddleware:
         if user == None or sessionid != mod_auth_openidc_session:
             return False # need login
 
-        # update any information that was updated on user
-        request.session['user'] = OIDCAccountLoginSerializer(OIDCAccount.objects.get(user_id=user['user_id']), many=False).data
+        # update any information that was updated on user, serialized again only when the user or related data changed
+        request.session['user'] = get_cached_principal(
+            user['user_id'],
+            lambda: OIDCAccountLoginSerializer(OIDCAccount.objects.get(user_id=user['user_id']), many=False).data
+        )
         return True # no need for login
 
     def get_dummy_user(self):
@@ -4,7 +4,7 @@ import datetime
 from django.contrib.postgres.fields import ArrayField
 from django.forms.models import model_to_dict
 from pathlib import Path
-import json, os, re, requests, time
+import json, os, re, time
 from pprint import pprint
 import glob
 from django.conf import settings
@@ -22,6 +22,11 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 from .utility.config_handler import *
+from .utility.folder_tree import invalidate_department_trees
+from .utility.feature_steps_cache import get_expanded_steps, save_expanded_steps, invalidate_feature_steps, get_feature_steps_version
+from .utility.feature_files_cache import (
+    get_feature_files_key, save_feature_files_closure, link_cached_feature_files, store_feature_files
+)
  
 # GLOBAL VARIABLES
 
@@ -149,109 +154,99 @@ def backup_feature_info(feature):
 
     
 
-def recursiveSubSteps(steps, feature_trace, analyzed_features, parent_department_id=None, recursive_step_level=0):
-    # logger.debug(f"Analyzed feature length  {len(analyzed_features)} feature Trace > {feature_trace}")
-    updatedSteps = steps.copy()
-    index = 0
+def findSubFeature(featureNameOrId, parent_department_id, analyzed_features):
+    # sub features are searched in the department of the feature running them
+    key = (parent_department_id, featureNameOrId)
+    subFeature = analyzed_features['features'].get(key)
+    if subFeature is None:
+        try:
+            if featureNameOrId.isnumeric():
+                subFeature = Feature.objects.get(feature_id=featureNameOrId, department_id=parent_department_id)
+            else:
+                subFeature = Feature.objects.filter(feature_name=featureNameOrId, department_id=parent_department_id)
+                if len(subFeature) == 0:
+                    raise Exception('Unable to find feature with specified name "%s"' % str(featureNameOrId))
+                elif len(subFeature) > 1:
+                    raise Exception(f'Multiple features found with specified name "{featureNameOrId}"')
+                subFeature = subFeature[0]
+        except Feature.DoesNotExist as exception:
+            raise Exception('Unable to find feature with specified id: "%s"' % str(featureNameOrId))
+        analyzed_features['features'][key] = subFeature
+    return subFeature
+
+
+def expandSubFeatureSteps(subFeature, feature_trace, analyzed_features, recursive_step_level=0):
+    """
+    Returns {"steps", "closure", "versions"}, the enabled steps of the feature with every "Run feature with id/name"
+    replaced by the steps of the sub feature, the ids of every feature used and their versions,
+    the expansion is cached (see feature_steps_cache.py)
+    """
+    expanded = analyzed_features['expanded'].get(subFeature.feature_id) or get_expanded_steps(subFeature.feature_id)
+    # a cached expansion using a feature of the trace is a loop, expand it again to raise the error with the trace
+    if expanded is not None and set(feature_trace).isdisjoint(expanded['closure']):
+        analyzed_features['expanded'][subFeature.feature_id] = expanded
+        return expanded
+
+    # the version is read before the steps, a feature saved meanwhile makes the cached expansion outdated
+    versions = {subFeature.feature_id: get_feature_steps_version(subFeature.feature_id)}
+    # add the current feature id to the trace
+    feature_trace.append(subFeature.feature_id)
+    # get all the steps from the feature, only those enabled steps
+    subFeatureStepsQuery = Step.objects.filter(feature_id=subFeature.feature_id).filter(models.Q(step_type='normal') | models.Q(step_type="subfeature")).filter(enabled=True)
+    subFeatureSteps = list(subFeatureStepsQuery.values())
+    # set the belongs_to of the steps if not set
+    if any(not subStep['belongs_to'] for subStep in subFeatureSteps):
+        logger.debug(f"LEVEL {recursive_step_level} Updating the belongs_to of the steps in recursiveSubSteps")
+        subFeatureStepsQuery.filter(models.Q(belongs_to__isnull=True) | models.Q(belongs_to=0)).update(belongs_to=subFeature.feature_id)
+        for subStep in subFeatureSteps:
+            if not subStep['belongs_to']:
+                subStep['belongs_to'] = subFeature.feature_id
+    # continue_on_failure of the feature is applied to all the steps, including the steps of its sub features
+    if subFeature.continue_on_failure:
+        for subStep in subFeatureSteps:
+            subStep['continue_on_failure'] = True
+    subSteps, analyzed_features = recursiveSubSteps(subFeatureSteps, feature_trace, analyzed_features, subFeature.department_id, recursive_step_level+1, versions)
+    # remove current feature id trace from the general trace
+    del feature_trace[-1]
+
+    expanded = {'steps': subSteps, 'closure': sorted(versions), 'versions': versions}
+    save_expanded_steps(subFeature.feature_id, subSteps, versions)
+    analyzed_features['expanded'][subFeature.feature_id] = expanded
+    return expanded
+
+
+def recursiveSubSteps(steps, feature_trace, analyzed_features, parent_department_id=None, recursive_step_level=0, versions=None):
+    """
+    Replaces the "Run feature with id/name" steps with the steps of the sub features
+    analyzed_features: {"features": {(department_id, name or id): Feature}, "expanded": {feature_id: {"steps", "closure", "versions"}}}
+                       shared between the calls done while saving a feature
+    versions: dict updated with {feature_id: version} of the sub features used
+    """
+    updatedSteps = []
     for step in steps:
-        updateIndex = 1
         subFeatureExecution = re.search(r'^.*Run feature with (?:name|id) "(.*)"', step['step_content'])
-        if subFeatureExecution:
-            featureNameOrId = subFeatureExecution.group(1)
-            # get subfeature
-            # logger.debug(f"LEVEL {recursive_step_level} Processing Feature {featureNameOrId} recursively")
-            is_feature_analyzed = False
-            subFeature = None
-            subFeatureSteps = None
-            # logger.debug("Checking analyzed_features")
-            for feature_and_steps in analyzed_features:
-                feature = feature_and_steps.get("feature")
-                # logger.debug(f"Checking {featureNameOrId}, Current feature is {feature.feature_id} name {feature.feature_name}")
-                if str(feature.feature_id)==featureNameOrId or feature.feature_name==featureNameOrId:
-                    # logger.debug("Feature found in the 'analyzed_features', Will skip the DB ")
-                    is_feature_analyzed = True
-                    subFeature = feature
-                    subFeatureSteps = feature_and_steps.get("steps")
-                    break
-            # When feature is not found in analyzed_features
-            if not is_feature_analyzed:
-                # logger.debug("Feature is not analyzed. Searching feature in the DB")
-                try:
-                    if featureNameOrId.isnumeric():
-                        subFeature = Feature.objects.get(feature_id=featureNameOrId, department_id=parent_department_id) 
-                    else:
-                        subFeature = Feature.objects.filter(feature_name=featureNameOrId, department_id=parent_department_id)
-                        if len(subFeature) == 0:
-                            raise Exception('Unable to find feature with specified name "%s"' % str(featureNameOrId))
-                        elif len(subFeature) > 1:
-                            raise Exception(f'Multiple features found with specified name "{featureNameOrId}"')
-                        subFeature = subFeature[0]
-
-                except Feature.DoesNotExist as exception:
-                    raise Exception('Unable to find feature with specified id: "%s"' % str(featureNameOrId))
-             
-
-
-            if is_feature_analyzed or subFeature:
-                # If feature not found in the "analyzed_features" and then take it from DB feature
-                # if not is_feature_analyzed:
-                #     subFeature = subFeature[0]
-                # check if we would get caught in infinite loop
-                if subFeature.feature_id not in feature_trace:
-                    # add the current feature id to the trace
-                    feature_trace.append(subFeature.feature_id)
-                    # get all the steps from the feature, only those enabled steps
-
-                    if not is_feature_analyzed:
-                        # logger.debug("Feature steps are not analyzed. Searching related step in the DB")
-                        # Get all the steps from the feature, only those enabled steps
-                        subFeatureSteps = Step.objects.filter(feature_id=subFeature.feature_id).filter(models.Q(step_type='normal') | models.Q(step_type="subfeature")).filter(enabled=True)
-                        # loop over all substeps and set the belongs_to if not set 
-                        # do only if feature step was not found in the analyzed_features, If found it means it was done earlier 
-                        # logger.debug("Updating step belongs_to")
-                        for subStep in subFeatureSteps:
-                            if subStep.belongs_to == None or not subStep.belongs_to:
-                                subStep.belongs_to = subFeature.feature_id
-                                logger.debug(f"LEVEL {recursive_step_level} Saving the step to update the belongs_to in recursiveSubSteps")
-                                subStep.save()
-                        analyzed_features.append({'feature': subFeature, 'steps': subFeatureSteps })
-
-                    # get values from substeps and convert it to list
-                    subFeatureSteps = list(subFeatureSteps.values())
-                    # check and modify continue_on_failure on sub steps if is set in the "Run feature" parent step or in the feature
-                    # logger.debug("Analyzing continue on failure")
-                    if step['continue_on_failure'] or subFeature.continue_on_failure:
-                        logger.debug("Setting continue_on_failure to True")
-                        for idx, val in enumerate(subFeatureSteps):
-                            subFeatureSteps[idx]['continue_on_failure'] = True
-                    # check if substeps contain other subfeatures
-                    # logger.debug(f"LEVEL {recursive_step_level} Processing recursive steps for feature -> {featureNameOrId}")
-                    # Add current feature and step analyzed_features to reduce the query for same feature in recursion                        
-                    # logger.debug(f"Sending to recursion analyzed feature length  {len(analyzed_features)} ")
-                    subSteps, analyzed_features = recursiveSubSteps(subFeatureSteps, feature_trace, analyzed_features, subFeature.department_id, recursive_step_level+1)
-                    # check if subSteps returned False
-                    if isinstance(subSteps, bool) and not subSteps:
-                        return False
-                    # else delete the current index
-                    del updatedSteps[index]
-                    # add substeps at position of the current index
-                    updatedSteps[index:0] = subSteps
-                    # set the number by what amount the index should get updated by
-                    updateIndex = len(subSteps)
-                    # remove current feature id trace from the general trace
-                    del feature_trace[-1]
-                else:
-                    # add the current feature id to the trace
-                    feature_trace.append(subFeature.feature_id)
-                    # raise an exception with error
-                    raise Exception('Infinite loop found. Trace: %s' % " ➔ ".join([str(x) for x in feature_trace]))
-            else:
-                # raise an exception with error
-                raise Exception('Unable to find feature with specified name or id: %s' % str(featureNameOrId))
-                # del updatedSteps[index]
-        # updated the index
-        index += updateIndex
-        # logger.debug(f"Return analyzed feature length  {len(analyzed_features)} ")
+        if not subFeatureExecution:
+            updatedSteps.append(step)
+            continue
+        subFeature = findSubFeature(subFeatureExecution.group(1), parent_department_id, analyzed_features)
+        # check if we would get caught in infinite loop
+        if subFeature.feature_id in feature_trace:
+            # add the current feature id to the trace
+            feature_trace.append(subFeature.feature_id)
+            # raise an exception with error
+            raise Exception('Infinite loop found. Trace: %s' % " ➔ ".join([str(x) for x in feature_trace]))
+
+        expanded = expandSubFeatureSteps(subFeature, feature_trace, analyzed_features, recursive_step_level)
+        if versions is not None:
+            versions.update(expanded['versions'])
+        # steps are copied, the caller modifies them and the expansion is reused
+        subSteps = [dict(subStep) for subStep in expanded['steps']]
+        # check and modify continue_on_failure on sub steps if is set in the "Run feature" parent step
+        if step['continue_on_failure']:
+            for subStep in subSteps:
+                subStep['continue_on_failure'] = True
+        # add substeps at position of the current step
+        updatedSteps.extend(subSteps)
     return updatedSteps, analyzed_features
 
 # adds step to the featureFile
@@ -338,7 +333,11 @@ def create_feature_file(feature, steps, featureFilePathWithName, save_steps=True
             featureFile.write('\tScenario: First')
             logger.debug(f"Checking steps : Steps Length {len(steps)}")
             count = 1
-            analyzed_features = []
+            analyzed_features = {'features': {}, 'expanded': {}}
+            # ids of the features used to generate the file
+            closure = {feature.feature_id}
+            # versions of the sub features used
+            sub_feature_versions = {}
             for step in steps:
                 # Comment this debugging
                 # logger.debug(f"{count} Checking Step {step}")
@@ -363,10 +362,10 @@ def create_feature_file(feature, steps, featureFilePathWithName, save_steps=True
                     if subFeature:
                         try:
                             recursive_step_level = 0
-                            logger.debug(f"Sending feature length  {len(analyzed_features)} ")
+                            logger.debug(f"Sending feature length  {len(analyzed_features['features'])} ")
                             # get recursive steps from the sub feature
-                            subSteps, analyzed_features = recursiveSubSteps([step], [feature.feature_id], analyzed_features, feature.department_id, recursive_step_level)
-                            logger.debug(f"Analyzed feature length  {len(analyzed_features)} ")
+                            subSteps, analyzed_features = recursiveSubSteps([step], [feature.feature_id], analyzed_features, feature.department_id, recursive_step_level, sub_feature_versions)
+                            logger.debug(f"Analyzed feature length  {len(analyzed_features['features'])} ")
                         except Exception as error:
                             return {"success": False, "error": str(error)}
                         # otherwise loop over substeps
@@ -457,6 +456,7 @@ def create_feature_file(feature, steps, featureFilePathWithName, save_steps=True
             # update all the variables
             # get all the variable with this name and from same department as the current feature
             vars = Variable.objects.filter(department_id=feature.department_id, variable_name__in=variables_used)
+            closure.update(sub_feature_versions)
             # reset variables used in the feature
             logger.debug("Setting used variable in feature")
             feature.variable_in_use.set(vars)
@@ -464,7 +464,7 @@ def create_feature_file(feature, steps, featureFilePathWithName, save_steps=True
         #move feature lock file to the feature file
         logger.debug(f"Feature file {feature_file_lock_path} created successfully")
         os.rename(feature_file_lock_path, feature_file_path)
-        return {"success": True, 'feature_file_path': feature_file_path, 'steps': stepsToAdd}
+        return {"success": True, 'feature_file_path': feature_file_path, 'steps': stepsToAdd, 'closure': closure}
     except Exception as e:
         logger.debug(f"Exception while saving steps with transactions | Feature ID : {feature.feature_id}")
         logger.exception(e)
@@ -553,10 +553,7 @@ def create_json_file(feature, steps, featureFileName, feature_result_id):
     # it will to reduce the saving of steps in the Step table and keeps record of the steps executed for perticular feature result
     # refer issue #6639 for more details
     if feature_result_id:
-        logger.debug(f"Saving steps to feature result {feature_result_id}")
-        feature_result = Feature_result.objects.get(feature_result_id=feature_result_id)
-        feature_result.feature_json_steps = steps_to_save
-        feature_result.save()
+        save_feature_result_json_steps(feature_result_id, steps_to_save)
 
     # save the steps to the json file
     json_file_path = featureFileName+'.json'
@@ -565,6 +562,13 @@ def create_json_file(feature, steps, featureFileName, feature_result_id):
     logger.debug(f"Saved steps json file at path {json_file_path}")
     return json_file_path
 
+# save_feature_result_json_steps
+# Saves the steps of the .json file in the feature result
+def save_feature_result_json_steps(feature_result_id, steps):
+    logger.debug(f"Saving steps to feature result {feature_result_id}")
+    # other fields of the feature result are set when it is created
+    Feature_result.objects.filter(feature_result_id=feature_result_id).update(feature_json_steps=steps)
+
 # create_meta_file
 # Creates the _meta.json file
 # @param featureFileName: string - Contains file of the feature
@@ -967,10 +971,18 @@ class Feature(models.Model):
 
         # Save feature except in FeatureResultSerializer
         if not kwargs.get('dontSaveSteps', False):
+            # features using or used by this feature before the steps are replaced, their "Uses" / "Used By" are in the tree
+            related_feature_ids = self.get_related_feature_ids()
 
             response = generate_feature_test_file_and_save_steps(self, kwargs, new_feature=new_feature)
             if not response['success']:
                 return response
+            # expanded steps of the features running this feature
+            invalidate_feature_steps(self.feature_id)
+
+            invalidate_department_trees(*get_features_tree_departments(
+                related_feature_ids | self.get_related_feature_ids() | {self.feature_id}
+            ))
             
         if self.feature_id is not None:
             # We don't want to backup feature info if feature is being updated by backend api calls
@@ -979,6 +991,12 @@ class Feature(models.Model):
                 backup_feature_info(self)
 
         return {"success": True}
+
+    def get_related_feature_ids(self):
+        # features used by this feature and features using this feature in their steps
+        uses = Step.objects.filter(feature_id=self.feature_id, belongs_to__isnull=False).values_list('belongs_to', flat=True)
+        used_by = Step.objects.filter(belongs_to=self.feature_id).values_list('feature_id', flat=True)
+        return (set(uses) | set(used_by)) - {self.feature_id}
     
     def delete(self, *args, **kwargs):
         logger.debug(f"Deleting feature {self.feature_id}")
@@ -1017,6 +1035,41 @@ def generate_feature_test_file_and_save_steps(feature, kwargs, new_feature=False
     # get featureFileName
     feature_dir_info = get_feature_path(feature, feature_result_id)
     featureFilePathWithName = feature_dir_info['fullPath']
+    # files generated before running the feature are cached, see feature_files_cache.py
+    use_files_cache = bool(feature_result_id) and not kwargs.get('save_steps', True) and 'steps' not in kwargs
+    files_key, cached_closure = get_feature_files_key(feature) if use_files_cache else (None, None)
+    if files_key and link_cached_feature_files(feature_dir_info['path'], feature.feature_id, files_key, featureFilePathWithName):
+        logger.debug(f"Using cached feature files {files_key}")
+        files_path = {
+            'success': True,
+            'feature_file_path': featureFilePathWithName + '.feature',
+            'json_file_path': featureFilePathWithName + '.json',
+        }
+        with open(files_path['json_file_path']) as file:
+            save_feature_result_json_steps(feature_result_id, json.load(file))
+    else:
+        files_path = create_feature_files(feature, kwargs, featureFilePathWithName, new_feature, feature_result_id)
+        if not files_path['success']:
+            return files_path
+        closure = files_path.pop('closure')
+        if use_files_cache:
+            if files_key and sorted(closure) == cached_closure:
+                store_feature_files(feature_dir_info['path'], feature.feature_id, files_key, featureFilePathWithName)
+            else:
+                # the hash is known from the next execution
+                save_feature_files_closure(feature.feature_id, closure)
+
+    # Create _meta.json
+    logger.debug(f"Creating meta file : {featureFilePathWithName}")
+    files_path['meta_file_path'] = create_meta_file(feature, featureFilePathWithName)
+    logger.debug(f"meta file Created")
+    files_path['feature_name'] = feature_dir_info['featureFileName']
+    files_path['feature_folder_path'] = feature_dir_info['path']
+    # The feature_file_path is already set by create_feature_file function
+    return files_path
+
+
+def create_feature_files(feature, kwargs, featureFilePathWithName, new_feature=False, feature_result_id=""):
     # Create / Update .feature and jsons whenever feature info is updated / created
     steps = kwargs.get('steps', list(Step.objects.filter(feature_id=feature.feature_id).order_by('id').values()))
     logger.debug(f"Saving steps received from Front: {steps}")
@@ -1031,7 +1084,7 @@ def generate_feature_test_file_and_save_steps(feature, kwargs, new_feature=False
         del step_data_and_files['steps'] 
     
     # once steps are removed from the step_data_and_files dictionary, 
-    # the remaining dictionary will contain only the files_path and success=True
+    # the remaining dictionary will contain only the files_path, closure and success=True
     files_path = step_data_and_files
 
     # If while creating new feature step validation error occurred then do not save the feature
@@ -1045,13 +1098,6 @@ def generate_feature_test_file_and_save_steps(feature, kwargs, new_feature=False
     # Create .json
     logger.debug(f"Creating Json file : {featureFilePathWithName}")
     files_path['json_file_path'] = create_json_file(feature, steps, featureFilePathWithName, feature_result_id)
-    # Create _meta.json
-    logger.debug(f"Creating meta file : {featureFilePathWithName}")
-    files_path['meta_file_path'] = create_meta_file(feature, featureFilePathWithName)
-    logger.debug(f"meta file Created")
-    files_path['feature_name'] = feature_dir_info['featureFileName']
-    files_path['feature_folder_path'] = feature_dir_info['path']
-    # The feature_file_path is already set by create_feature_file function
     return files_path
 
 
@@ -1182,10 +1228,14 @@ class Step_result(models.Model):
     screenshot_style = models.CharField(max_length=255, default='', null=True, blank=True)
     screenshot_difference = models.CharField(max_length=255, default='', null=True, blank=True)
     screenshot_template = models.CharField(max_length=255, default='', null=True, blank=True)
+    # changed tiles of the screenshot compared with its template {"phash_distance", "tile_size", "tiles": [{"row", "column", "pixel_diff"}, ...]}
+    diff_map = models.JSONField(default=dict, null=True, blank=True)
     belongs_to = models.IntegerField(null=True) # feature that step belongs to
     rest_api = models.ForeignKey("REST_API", on_delete=models.CASCADE, null=True, default=None)
     notes = models.JSONField(default=dict)
     healing_data = models.JSONField(default=dict, null=True, blank=True)
+    # selector -> selector type that found the element, used to try that type first in the next executions
+    selector_strategies = models.JSONField(default=dict, null=True, blank=True)
     database_query_result = models.JSONField(default=list, null=True)
     current_step_variables_value = models.JSONField(default=dict, null=True)
     error = models.TextField(null=True, blank=True)
@@ -1194,6 +1244,10 @@ class Step_result(models.Model):
     class Meta:
         ordering = ['step_result_id']
         verbose_name_plural = "Step Results"
+        # step results are always read by feature result, ordered by execution sequence
+        indexes = [
+            models.Index(fields=['feature_result_id', 'step_execution_sequence']),
+        ]
     
     def delete(self, *args, **kwargs):
         # delete actual, style and diff images from the storage
@@ -1388,6 +1442,8 @@ class Folder(models.Model):
             self.department = self.parent_id.department
         
         if old_instance is not None and (old_instance.department != self.department):
+            # queryset updates do not send signals, the folder is removed from the tree of the previous department
+            invalidate_department_trees(old_instance.department_id)
             # change all sub folders and features department to self department
             updated_features = Feature.objects.filter(feature_id__in=self.getAllSubFeatures()).update(department_id=self.department.department_id, department_name=self.department.department_name)
             print("Updated Features: %d" % updated_features)
@@ -1404,6 +1460,13 @@ class Folder_Feature(models.Model):
         ordering = ['folder_feature_id']
         verbose_name_plural = "Features in Folder"
         
+# Departments whose home page tree shows the features, the feature department or the department of its folder
+def get_features_tree_departments(feature_ids):
+    feature_ids = list(feature_ids)
+    departments = set(Feature.objects.filter(feature_id__in=feature_ids).values_list('department_id', flat=True))
+    departments.update(Folder_Feature.objects.filter(feature_id__in=feature_ids).values_list('folder__department_id', flat=True))
+    return departments
+
 class Feature_Runs(SoftDeletableModel):
     run_id = models.AutoField(primary_key=True)
     feature = models.ForeignKey(Feature, on_delete=models.SET_NULL, null=True, related_name="feature_runs")
@@ -1589,20 +1652,45 @@ class Schedule(models.Model):
             tomorrow = tomorrow.strftime("%d")
             self.schedule = self.schedule.replace("<tomorrow>", tomorrow)
 
-        # save the object to get the jobId
+        # save the object to get the jobId, the scheduler is notified by backend/signals.py
         super(Schedule, self).save(*args, **kwargs)
-
-        # make the request to crontab
-        requests.get(f'{get_cometa_crontab_url()}/')
         return True
 
     def delete(self, *args, **kwargs):
-        # delete the object and send request to crontab to update
+        # the scheduler is notified by backend/signals.py
         super(Schedule, self).delete()
-        # make the request to crontab
-        requests.get(f'{get_cometa_crontab_url()}/')
         return True
 
+    def get_job(self):
+        """
+        Job executed by the scheduler (backend/scheduler), the request of the command as structured data
+        so the scheduler sends it without parsing the curl command every time the job fires.
+        Schedules not linked to a feature or a file keep their command.
+        """
+        job = {
+            "id": self.id,
+            "schedule": self.schedule,
+            "feature_id": self.feature_id,
+            "file_id": None,
+        }
+        if self.feature_id is not None:
+            job["url"] = f"{get_cometa_backend_url()}/exectest/"
+            job["body"] = {"feature_id": self.feature_id, "jobId": self.id}
+        elif self.parameters and isinstance(self.parameters, dict) and self.parameters.get('file_id'):
+            job["file_id"] = int(self.parameters['file_id'])
+            job["url"] = f"{get_cometa_backend_url()}/exec_data_driven/"
+            job["body"] = {"file_id": job["file_id"], "jobId": self.id}
+        else:
+            job["command"] = (self.command or "").replace("<jobId>", str(self.id))
+            return job
+        job["method"] = "POST"
+        job["headers"] = {
+            "Content-Type": "application/json",
+            "COMETA-ORIGIN": "CRONTAB",
+            "COMETA-USER": str(self.owner_id),
+        }
+        return job
+
 IntegrationApplications = (
     ('Discord', 'Discord'),
     ('Mattermost', 'Mattermost'),
@@ -20,6 +20,7 @@ from sentry_sdk import capture_exception
 from math import ceil
 from backend.utility.functions import get_model, get_nested_dict_property, getLogger
 from backend.utility.configurations import ConfigurationManager
+from backend.utility.principal_cache import invalidate_user_principal
 # logger information
 logger = getLogger()
 
@@ -911,6 +912,8 @@ def customer_subscription_created_or_updated(webhook):
             else:
                 logger.debug('Renewal NOT detected, updating UserSubscription with webhook data ...')
                 UserSubscription.objects.filter(stripe_subscription_id = sub_id).update(**data_update)
+                # queryset updates do not send signals
+                invalidate_user_principal(user_subscription.user_id)
                 return 'Correctly updated UserSubscription with ID %s with data comming from webhook' % str(sub_id)
         except UserSubscription.DoesNotExist:
             # Create User Subscription with webhook data
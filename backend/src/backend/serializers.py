@@ -159,6 +159,25 @@ class FeatureResultSerializer(serializers.ModelSerializer):
         feature_run.feature_results.add(feature_result)
         return feature_result
 
+# Used in the results page of a feature, expects the queryset annotated by FeatureResultByFeatureIdViewSet
+# mobile comes from mobile_summary, the mobile devices without container_service_details
+class FeatureResultListSerializer(FeatureResultSerializer):
+    mobile = serializers.JSONField(source='mobile_summary', read_only=True)
+    network_response_count = serializers.IntegerField(read_only=True)
+    vulnerable_response_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Feature_result
+        exclude = ('log',)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # network counts are only sent for results with network logging
+        for field in ('network_response_count', 'vulnerable_response_count'):
+            if data[field] is None:
+                del data[field]
+        return data
+
 class FeatureResultInfoSerializer(serializers.ModelSerializer):
     result_date = serializers.DateTimeField(format=datetimeTZFormat)
     executed_by = BasicOIDCAccountSerializer(many=False, read_only=True)
@@ -414,6 +433,13 @@ class StepResultSerializer(serializers.ModelSerializer):
 
     def get_belongs_to(self, instance):
         # logger.debug(f"StepResultSerializer: Getting belongs to for step result {instance.step_result_id}")
+        # features prefetched by the caller, see serialize_step_results
+        features = self.context.get('features', None)
+        if features is not None:
+            return features.get(instance.belongs_to, {
+                "feature_id": 0,
+                "feature_name": "Unknown"
+            })
         feature = None
         try:
             feature = BasicFeatureInfoSerializer(Feature.objects.get(feature_id=instance.belongs_to), many=False).data
@@ -577,13 +603,20 @@ class FolderSerializer(serializers.ModelSerializer, FolderMixin):
         fields = '__all__'
 
     def get_folders(self, obj):
-        results = Folder.objects.filter(parent_id=obj.folder_id).order_by('-name')
+        # sub folders loaded by the caller in a single query {parent_id: [folders ordered by -name]}
+        subfolders = self.context.get("subfolders", None)
+        if subfolders is not None:
+            results = subfolders.get(obj.folder_id, [])
+        else:
+            results = Folder.objects.filter(parent_id=obj.folder_id).order_by('-name')
         ret = FolderSerializer(results, context=self.context, many=True).data
         return ret
 
     def get_features(self, obj):
         # get the features list from the context
         features = self.context.get("features_list", [])
+        if not features:
+            return []
         # get all the features inside the folder
         results = Folder_Feature.objects.filter(folder_id=obj.folder_id)
         ids = [x.feature.feature_id for x in results if x.feature.feature_id in features]
@@ -0,0 +1,162 @@
+"""
+Signals invalidating cached documents
+    * session user, see backend/utility/principal_cache.py
+    * home page tree of the departments, see backend/utility/folder_tree.py
+    * expanded steps of the sub features, see backend/utility/feature_steps_cache.py
+and notifying the scheduler about changed schedules, see backend/utility/schedule_notifications.py
+"""
+from django.db.models.signals import post_init, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from backend.models import (
+    OIDCAccount, Account_role, Department, Cloud, Permissions, Subscription, UserSubscription,
+    Feature, Folder, Folder_Feature, Variable, Schedule, File, get_features_tree_departments
+)
+from backend.utility.principal_cache import invalidate_user_principal, invalidate_all_principals
+from backend.utility.folder_tree import invalidate_department_trees
+from backend.utility.feature_steps_cache import invalidate_feature_steps
+from backend.utility.schedule_notifications import notify_schedules_changed
+
+
+@receiver(post_save, sender=OIDCAccount)
+@receiver(post_delete, sender=OIDCAccount)
+def invalidate_account_principal(sender, instance, **kwargs):
+    invalidate_user_principal(instance.user_id)
+
+
+# user added to or removed from a department
+@receiver(post_save, sender=Account_role)
+@receiver(post_delete, sender=Account_role)
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def invalidate_related_user_principal(sender, instance, **kwargs):
+    invalidate_user_principal(instance.user_id)
+
+
+# shared by every user, i.e. department settings, available clouds or permission names
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Cloud)
+@receiver(post_delete, sender=Cloud)
+@receiver(post_save, sender=Permissions)
+@receiver(post_delete, sender=Permissions)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+# files are serialized with the departments of the user
+@receiver(post_save, sender=File)
+@receiver(post_delete, sender=File)
+def invalidate_shared_principals(sender, instance, **kwargs):
+    invalidate_all_principals()
+
+
+# -----------
+# Home page tree, steps are saved in bulk by Feature.save which invalidates the trees itself
+# -----------
+
+# fields of the feature shown in the tree
+FEATURE_TREE_FIELDS = ('feature_name', 'depends_on_others', 'department_id')
+# fields of the feature used when it is expanded as a sub feature
+FEATURE_STEPS_FIELDS = ('feature_name', 'department_id', 'continue_on_failure')
+
+
+@receiver(post_init, sender=Feature)
+def remember_feature_tree_fields(sender, instance, **kwargs):
+    # __dict__ is used so deferred fields are not loaded
+    instance._tree_fields = tuple(instance.__dict__.get(field) for field in FEATURE_TREE_FIELDS)
+    instance._steps_fields = tuple(instance.__dict__.get(field) for field in FEATURE_STEPS_FIELDS)
+
+
+@receiver(post_save, sender=Feature)
+def invalidate_feature_trees(sender, instance, created, **kwargs):
+    current = tuple(instance.__dict__.get(field) for field in FEATURE_TREE_FIELDS)
+    previous = getattr(instance, '_tree_fields', None)
+    # i.e. feature info updated after every execution
+    if not created and previous == current:
+        return
+    feature_ids = {instance.feature_id}
+    # renamed features are shown in "Uses" / "Used By" of other features
+    if previous is None or previous[0] != current[0]:
+        feature_ids |= instance.get_related_feature_ids()
+    departments = get_features_tree_departments(feature_ids)
+    if previous is not None:
+        departments.add(previous[2])
+    invalidate_department_trees(*departments)
+    instance._tree_fields = current
+
+
+# -----------
+# Expanded sub feature steps, steps are saved by Feature.save which invalidates the expansions itself
+# -----------
+
+@receiver(post_save, sender=Feature)
+def invalidate_feature_expanded_steps(sender, instance, created, **kwargs):
+    current = tuple(instance.__dict__.get(field) for field in FEATURE_STEPS_FIELDS)
+    previous = getattr(instance, '_steps_fields', None)
+    if not created and previous == current:
+        return
+    # a feature with the same name makes "Run feature with name" of the existing features ambiguous
+    feature_ids = set(Feature.objects.filter(
+        feature_name=instance.feature_name, department_id=instance.department_id
+    ).values_list('feature_id', flat=True))
+    invalidate_feature_steps(instance.feature_id, *feature_ids)
+    instance._steps_fields = current
+
+
+@receiver(pre_delete, sender=Feature)
+def invalidate_deleted_feature_expanded_steps(sender, instance, **kwargs):
+    invalidate_feature_steps(instance.feature_id)
+
+
+@receiver(pre_delete, sender=Feature)
+def invalidate_deleted_feature_trees(sender, instance, **kwargs):
+    # before the folder relations are deleted
+    invalidate_department_trees(*get_features_tree_departments(instance.get_related_feature_ids() | {instance.feature_id}))
+
+
+@receiver(post_save, sender=Folder)
+@receiver(post_delete, sender=Folder)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+def invalidate_department_tree(sender, instance, **kwargs):
+    invalidate_department_trees(instance.department_id)
+
+
+# feature moved to or out of a folder
+@receiver(post_save, sender=Folder_Feature)
+@receiver(post_delete, sender=Folder_Feature)
+def invalidate_folder_feature_trees(sender, instance, **kwargs):
+    departments = set(Feature.objects.filter(feature_id=instance.feature_id).values_list('department_id', flat=True))
+    departments.update(Folder.objects.filter(folder_id=instance.folder_id).values_list('department_id', flat=True))
+    invalidate_department_trees(*departments)
+
+
+@receiver(post_save, sender=Variable)
+@receiver(pre_delete, sender=Variable)
+def invalidate_variable_trees(sender, instance, **kwargs):
+    # variables are shown in the department and in the features using them
+    feature_ids = instance.in_use.values_list('feature_id', flat=True) if instance.pk else []
+    invalidate_department_trees(instance.department_id, *get_features_tree_departments(feature_ids))
+
+
+@receiver(m2m_changed, sender=Variable.in_use.through)
+def invalidate_variable_in_use_trees(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # feature.variable_in_use.set(...)
+        variable_ids = pk_set if action != 'pre_clear' else instance.variable_in_use.values_list('id', flat=True)
+        departments = set(Variable.objects.filter(id__in=list(variable_ids)).values_list('department_id', flat=True))
+        departments.update(get_features_tree_departments([instance.feature_id]))
+    else:
+        feature_ids = pk_set if action != 'pre_clear' else instance.in_use.values_list('feature_id', flat=True)
+        departments = {instance.department_id} | get_features_tree_departments(feature_ids)
+    invalidate_department_trees(*departments)
+
+
+# -----------
+# Scheduler jobs, also sent for schedules deleted in bulk (i.e. schedules of a data driven file)
+# -----------
+
+@receiver(post_save, sender=Schedule)
+@receiver(post_delete, sender=Schedule)
+def notify_schedule_changed(sender, instance, **kwargs):
+    notify_schedules_changed(instance.id)
@@ -91,6 +91,23 @@ default_cometa_configurations = {
     "COMETA_FEATURE_AI_ENABLED": False, 
     "COMETA_FEATURE_DATABASE_ENABLED": False, 
     "COMETA_FEATURE_MOBILE_TEST_ENABLED": False,
+    # Run features in the pre-imported behave executor instead of a new bash + behave process
+    "COMETA_BEHAVE_WARM_EXECUTOR_ENABLED": False,
+    # Screenshot processing in behave: number of worker threads, maximum screenshots waiting
+    # to be processed before the step waits and seconds to wait for pending screenshots in after_all
+    "COMETA_SCREENSHOT_WORKERS": 4,
+    "COMETA_SCREENSHOT_QUEUE_SIZE": 8,
+    "COMETA_SCREENSHOT_DRAIN_TIMEOUT": 120,
+    # Seconds the serialized session user is cached by the authentication middleware when nothing changes
+    "COMETA_PRINCIPAL_CACHE_TIMEOUT": 300,
+    # Seconds the home page tree of a department is cached when nothing changes in the department
+    "COMETA_FOLDER_TREE_CACHE_TIMEOUT": 600,
+    # Seconds the expanded steps of a feature used with "Run feature with id/name" are cached when its sub features do not change
+    "COMETA_EXPANDED_STEPS_CACHE_TIMEOUT": 3600,
+    # Threads posting the queued feature runs to behave in every backend worker, attempts and seconds per attempt
+    "COMETA_RUN_DISPATCH_CONCURRENCY": 4,
+    "COMETA_RUN_DISPATCH_MAX_ATTEMPTS": 5,
+    "COMETA_RUN_DISPATCH_TIMEOUT": 30,
     "COMETA_TELEGRAM_BOT_TOKEN": "",
     "COMETA_TELEGRAM_ENABLED": False,
     "COMETA_TELEGRAM_WEBHOOK_SECRET": "",
@@ -1,10 +1,12 @@
 from itertools import islice
 import pandas as pd
+import openpyxl
+import datetime
 import json
 import os
 import tempfile
 import subprocess
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Iterator, BinaryIO
 from backend.utility.functions import getLogger
 
 logger = getLogger()
@@ -320,6 +322,147 @@ class ExcelGridHandler:
         
         return result
     
+    def iter_processed_chunks(self, result: Dict[str, Any], sheet_name: Optional[str] = None,
+                              chunk_size: int = 5000, stream: Optional[BinaryIO] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Same processing as process_file without loading the whole file, yields the records chunk by chunk.
+
+        Args:
+            result (Dict[str, Any]): Filled with 'metadata' before the first chunk, 'ddr_status' and
+                                     'row_count' are complete once every chunk was consumed
+            sheet_name (Optional[str]): Specific sheet to process
+            chunk_size (int): Number of records of every chunk
+            stream (Optional[BinaryIO]): Content of a CSV file, i.e. the output of gpg, self.file_path is read otherwise
+
+        Yields:
+            List[Dict[str, Any]]: Records with normalized column names, values as strings or None
+        """
+        file_lower = self.file_path.lower()
+        if not file_lower.endswith(('.csv', '.xls', '.xlsx')):
+            raise Exception(f"Unsupported file type. Only .csv, .xls, and .xlsx files are supported for data-driven testing.")
+
+        metadata = {
+            'sheet_names': [],
+            'selected_sheet': None,
+            'column_order': [],
+            'original_column_order': [],
+            'file_type': 'csv' if file_lower.endswith('.csv') else 'excel'
+        }
+        result.update({'metadata': metadata, 'ddr_status': None, 'row_count': 0})
+        ddr_check = {'invalid_rows': 0, 'first_invalid_rows': []}
+        is_ddr_file = False
+
+        for position, chunk in enumerate(self._iter_dataframe_chunks(metadata, sheet_name, chunk_size, stream)):
+            if position == 0:
+                metadata['original_column_order'] = list(chunk.columns)
+                self.column_order = metadata['original_column_order']
+                chunk = self.normalize_column_names(chunk)
+                metadata['column_order'] = list(chunk.columns)
+                is_ddr_file = 'feature_id' in metadata['column_order'] or 'feature_name' in metadata['column_order']
+            else:
+                chunk.columns = metadata['column_order']
+            if is_ddr_file and 'feature_id' in chunk.columns:
+                self._check_feature_ids(chunk['feature_id'], result['row_count'], ddr_check)
+            result['row_count'] += len(chunk)
+            yield DataFrameUtils.dataframe_to_records(chunk)
+
+        if not is_ddr_file:
+            result['ddr_status'] = {
+                'data-driven-ready': False,
+                'reason': 'Missing \'feature_id\' or \'feature_name\' columns. This file can be viewed but not used for data-driven testing.'
+            }
+        elif ddr_check['invalid_rows'] == 0:
+            result['ddr_status'] = {'data-driven-ready': True}
+        elif ddr_check['invalid_rows'] <= 5:
+            rows_text = ', '.join(map(str, ddr_check['first_invalid_rows']))
+            result['ddr_status'] = {
+                'data-driven-ready': False,
+                'reason': f'Invalid feature_id values in rows: {rows_text}. Feature IDs must be numeric (stored as text).'
+            }
+        else:
+            result['ddr_status'] = {
+                'data-driven-ready': False,
+                'reason': f'Invalid feature_id values in {ddr_check["invalid_rows"]} rows. Feature IDs must be numeric (stored as text).'
+            }
+
+    def _check_feature_ids(self, feature_ids: pd.Series, offset: int, ddr_check: Dict[str, Any]) -> None:
+        """Counts the non empty feature_id values which are not numeric, same rules as check_data_driven_ready"""
+        stripped = feature_ids.str.strip()
+        candidates = stripped[feature_ids.notna() & (stripped != '') & pd.to_numeric(stripped, errors='coerce').isna()]
+        for index, value in candidates.items():
+            # to_numeric does not accept everything float() accepts, i.e. "nan"
+            try:
+                float(value)
+            except (ValueError, TypeError):
+                ddr_check['invalid_rows'] += 1
+                if len(ddr_check['first_invalid_rows']) < 5:
+                    ddr_check['first_invalid_rows'].append(offset + index + 1)  # 1-based row numbering
+
+    def _iter_dataframe_chunks(self, metadata: Dict[str, Any], sheet_name: Optional[str],
+                               chunk_size: int, stream: Optional[BinaryIO]) -> Iterator[pd.DataFrame]:
+        """Yields DataFrames of chunk_size rows with every value as string or NaN, same values as read_file_data"""
+        file_lower = self.file_path.lower()
+        if file_lower.endswith('.csv'):
+            try:
+                with pd.read_csv(stream if stream is not None else self.file_path, header=0, skipinitialspace=True,
+                                 skip_blank_lines=True, dtype=str, keep_default_na=False, na_values=[''],
+                                 chunksize=chunk_size) as reader:
+                    for chunk in reader:
+                        yield chunk.reset_index(drop=True)
+            except ValueError as e_csv:
+                logger.error(f"Error parsing file as CSV: {e_csv}")
+                raise Exception("Unable to parse excel or csv file.")
+            return
+
+        if file_lower.endswith('.xls'):
+            # xls files are not supported by openpyxl, the sheet is read at once
+            df, read_metadata = self.read_file_data(sheet_name)
+            metadata.update({key: read_metadata[key] for key in ('sheet_names', 'selected_sheet')})
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size].reset_index(drop=True)
+            if len(df) == 0:
+                yield df
+            return
+
+        try:
+            workbook = openpyxl.load_workbook(self.file_path, read_only=True, data_only=True)
+        except Exception as e_excel:
+            logger.error(f"Error parsing Excel file: {e_excel}")
+            raise Exception(f"Unable to parse Excel file: {str(e_excel)}")
+        try:
+            metadata['sheet_names'] = workbook.sheetnames
+            self.sheet_names = metadata['sheet_names']
+            selected_sheet = sheet_name if sheet_name and sheet_name in workbook.sheetnames else workbook.sheetnames[0]
+            logger.info(f"Reading Excel file with sheet: {selected_sheet}")
+            metadata['selected_sheet'] = selected_sheet
+            self.selected_sheet = selected_sheet
+
+            rows = workbook[selected_sheet].iter_rows(values_only=True)
+            columns = DataFrameUtils.unique_column_names(DataFrameUtils.trim_row(next(rows, ())))
+            width = len(columns)
+            chunk = []
+            yielded = False
+            # empty rows are kept between rows with values, trailing empty rows are ignored as in pandas
+            empty_rows = []
+            for row in rows:
+                values = [DataFrameUtils.excel_cell_to_string(value) for value in row[:width]]
+                values.extend([None] * (width - len(values)))
+                if not any(value is not None for value in values):
+                    empty_rows.append(values)
+                    continue
+                chunk.extend(empty_rows)
+                empty_rows = []
+                chunk.append(values)
+                if len(chunk) >= chunk_size:
+                    yield pd.DataFrame(chunk[:chunk_size], columns=columns, dtype=object)
+                    chunk = chunk[chunk_size:]
+                    yielded = True
+            # a sheet without rows still has its columns
+            if chunk or not yielded:
+                yield pd.DataFrame(chunk, columns=columns, dtype=object)
+        finally:
+            workbook.close()
+
     def check_all_sheets_ddr_status(self) -> Dict[str, Any]:
         """
         Check DDR readiness across all sheets in a file.
@@ -344,15 +487,21 @@ class ExcelGridHandler:
         
         try:
             if file_lower.endswith('.csv'):
-                # CSV handling
-                df, metadata = self.read_file_data()
-                cols_normalized = [DataFrameUtils.normalize_column_name(col) for col in df.columns]
+                # CSV handling, rows are counted chunk by chunk instead of loading the file
+                columns = None
+                row_count = 0
+                for chunk in self._iter_dataframe_chunks({}, None, 5000, None):
+                    if columns is None:
+                        columns = list(chunk.columns)
+                    row_count += len(chunk)
+                columns = columns or []
+                cols_normalized = [DataFrameUtils.normalize_column_name(col) for col in columns]
                 is_ddr = 'feature_id' in cols_normalized or 'feature_name' in cols_normalized
                 
                 sheet_details['CSV'] = {
                     'is_ddr': is_ddr,
-                    'row_count': len(df),
-                    'columns': list(df.columns)
+                    'row_count': row_count,
+                    'columns': columns
                 }
                 if is_ddr:
                     ddr_sheets.append('CSV')
@@ -516,6 +665,71 @@ class DataFrameUtils:
         
         return normalized
     
+    @staticmethod
+    def dataframe_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """
+        Convert a DataFrame read with dtype=str to records, same values as dataframe_to_json_records
+        without serializing every row to JSON and back.
+
+        Args:
+            df: DataFrame with string or missing values
+
+        Returns:
+            List of records with missing and 'nan' values as None
+        """
+        if df.empty:
+            return []
+        df = df.astype(object)
+        df = df.where(df.notna() & (df != 'nan'), None)
+        return df.to_dict('records')
+
+    @staticmethod
+    def trim_row(row: Tuple[Any, ...]) -> List[Any]:
+        """Removes the empty cells at the end of an Excel row"""
+        row = list(row)
+        while row and (row[-1] is None or row[-1] == ''):
+            row.pop()
+        return row
+
+    @staticmethod
+    def unique_column_names(header: List[Any]) -> List[str]:
+        """
+        Column names of an Excel header row as pandas names them:
+        empty cells are "Unnamed: n" and duplicated names get a ".n" suffix.
+        """
+        columns = []
+        seen = {}
+        for index, value in enumerate(header):
+            name = f"Unnamed: {index}" if value is None or value == '' else str(DataFrameUtils.excel_cell_to_string(value))
+            if name in seen:
+                counter = seen[name]
+                while f"{name}.{counter}" in seen:
+                    counter += 1
+                seen[name] = counter + 1
+                name = f"{name}.{counter}"
+            seen[name] = seen.get(name, 1)
+            columns.append(name)
+        return columns
+
+    @staticmethod
+    def excel_cell_to_string(value: Any) -> Optional[str]:
+        """
+        Excel cell value as read by pandas with dtype=str, integral numbers without decimals.
+
+        Args:
+            value: Value returned by openpyxl
+
+        Returns:
+            String value or None for empty cells
+        """
+        if value is None or value == '':
+            return None
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        elif isinstance(value, datetime.time) and not isinstance(value, datetime.datetime):
+            return value.isoformat()
+        return str(value)
+
     @staticmethod
     def clean_header_for_display(header: str) -> str:
         """
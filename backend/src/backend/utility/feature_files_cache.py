@@ -0,0 +1,95 @@
+"""
+Cache of the .feature and .json files generated before every execution of a feature
+
+Both files only depend on the name of the feature and on its expanded steps, they are stored once in
+<feature folder>/features/cache/<feature_id>_<hash> and linked to the files of every feature result.
+The hash is computed from the feature id and name, the features used by its steps (closure, saved in Redis
+after the files are generated) and their versions (see feature_steps_cache.py), saving any of the features
+creates a new hash. The _meta.json file contains run information and is still written for every feature result.
+If Redis is not reachable or the cached files are missing, the files are generated as before.
+"""
+import os
+import json
+import glob
+import hashlib
+import threading
+
+import redis
+
+from backend.utility.functions import getLogger
+from backend.utility.versioned_cache import get_redis_client
+from backend.utility.feature_steps_cache import FEATURE_STEPS_VERSION_KEY, get_expanded_steps_timeout
+
+logger = getLogger()
+
+FEATURE_FILES_CLOSURE_KEY = "cometa_feature_files_closure_%s"
+# cached files, _meta.json is generated for every feature result
+CACHED_FILE_EXTENSIONS = ('.feature', '.json')
+
+
+def get_cache_folder(feature_folder_path):
+    return os.path.join(feature_folder_path, 'features', 'cache')
+
+
+def get_feature_files_key(feature):
+    """Returns (hash, closure) of the feature files or (None, None) if the features used by the feature are unknown"""
+    try:
+        client = get_redis_client()
+        closure = client.get(FEATURE_FILES_CLOSURE_KEY % feature.feature_id)
+        if closure is None:
+            return None, None
+        closure = json.loads(closure)
+        versions = client.mget(*[FEATURE_STEPS_VERSION_KEY % feature_id for feature_id in closure])
+    except redis.RedisError as exception:
+        logger.debug(f"Feature files cache not available for feature {feature.feature_id}: {str(exception)}")
+        return None, None
+    content = json.dumps([feature.feature_id, feature.feature_name, closure, versions])
+    return hashlib.sha256(content.encode()).hexdigest(), closure
+
+
+def save_feature_files_closure(feature_id, closure):
+    try:
+        get_redis_client().set(FEATURE_FILES_CLOSURE_KEY % feature_id, json.dumps(sorted(closure)), ex=get_expanded_steps_timeout())
+    except redis.RedisError as exception:
+        logger.debug(f"Unable to save the closure of feature {feature_id}: {str(exception)}")
+
+
+def link_cached_feature_files(feature_folder_path, feature_id, files_key, featureFilePathWithName):
+    """Links the cached files to featureFilePathWithName.feature / .json, returns False if they are not cached"""
+    cached_file_path = os.path.join(get_cache_folder(feature_folder_path), f"{feature_id}_{files_key}")
+    try:
+        for extension in CACHED_FILE_EXTENSIONS:
+            _replace_with_link(cached_file_path + extension, featureFilePathWithName + extension)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def store_feature_files(feature_folder_path, feature_id, files_key, featureFilePathWithName):
+    """Stores the generated files in the cache and removes the files cached for previous versions of the feature"""
+    cache_folder = get_cache_folder(feature_folder_path)
+    cached_file_path = os.path.join(cache_folder, f"{feature_id}_{files_key}")
+    try:
+        os.makedirs(cache_folder, exist_ok=True)
+        for extension in CACHED_FILE_EXTENSIONS:
+            _replace_with_link(featureFilePathWithName + extension, cached_file_path + extension)
+        for old_file_path in glob.glob(os.path.join(cache_folder, f"{feature_id}_*")):
+            if not old_file_path.startswith(cached_file_path):
+                os.remove(old_file_path)
+    except OSError as exception:
+        logger.debug(f"Unable to cache the files of feature {feature_id}: {str(exception)}")
+
+
+def remove_cached_feature_files(feature_folder_path, feature_id):
+    for cached_file_path in glob.glob(os.path.join(get_cache_folder(feature_folder_path), f"{feature_id}_*")):
+        try:
+            os.remove(cached_file_path)
+        except OSError:
+            pass
+
+
+def _replace_with_link(source, destination):
+    # the link is created next to the destination and renamed, readers never see a missing or partial file
+    temporary_destination = f"{destination}.{os.getpid()}_{threading.get_ident()}.link"
+    os.link(source, temporary_destination)
+    os.replace(temporary_destination, destination)
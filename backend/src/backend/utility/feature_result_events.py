@@ -0,0 +1,122 @@
+"""
+Notifications of finished feature results (running set to False)
+
+Feature results are finished by behave (PATCH /api/feature_results/ in after_all) or when an execution is stopped,
+both paths publish the feature result ids to a Redis channel once the transaction is committed.
+Every backend worker has a single listener thread waking the threads waiting for those feature results,
+i.e. the rows of the data driven runs. Waiting threads re-check the database every FALLBACK_CHECK_INTERVAL
+seconds, feature results finished without a notification (Redis not reachable) are found with some delay.
+"""
+import json
+import time
+import threading
+
+import redis
+from django.db import transaction
+
+from backend.utility.functions import getLogger
+from backend.utility.versioned_cache import get_redis_client
+
+logger = getLogger()
+
+FEATURE_RESULT_FINISHED_CHANNEL = "cometa_feature_result_finished"
+FALLBACK_CHECK_INTERVAL = 30
+
+
+def _publish(feature_result_ids):
+    try:
+        get_redis_client().publish(FEATURE_RESULT_FINISHED_CHANNEL, json.dumps(feature_result_ids))
+    except redis.RedisError as exception:
+        logger.warning(f"Unable to notify finished feature results {feature_result_ids}: {str(exception)}")
+
+
+def publish_feature_results_finished(*feature_result_ids):
+    """Notifies the waiting threads once the current transaction is committed"""
+    feature_result_ids = [int(feature_result_id) for feature_result_id in feature_result_ids if feature_result_id is not None]
+    if feature_result_ids:
+        transaction.on_commit(lambda: _publish(feature_result_ids))
+
+
+class FeatureResultWatch:
+    """Event set every time one of the watched feature results is notified as finished"""
+
+    def __init__(self, listener, feature_result_ids):
+        self.listener = listener
+        self.feature_result_ids = {int(feature_result_id) for feature_result_id in feature_result_ids}
+        self.event = threading.Event()
+
+    def wait(self, timeout=FALLBACK_CHECK_INTERVAL):
+        """Returns True if a feature result was notified, the event is cleared for the next wait"""
+        notified = self.event.wait(timeout)
+        self.event.clear()
+        return notified
+
+    def __enter__(self):
+        self.listener.add(self)
+        return self
+
+    def __exit__(self, *args):
+        self.listener.remove(self)
+
+
+class FeatureResultListener:
+    """Listener thread of the current process, started with the first watch"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watches = {}
+        self._thread = None
+
+    def watch(self, feature_result_ids):
+        """
+        Returns a FeatureResultWatch to be used as a context manager, the watch is registered before
+        checking the database so a feature result finished in between is not missed
+        """
+        return FeatureResultWatch(self, feature_result_ids)
+
+    def add(self, watch):
+        with self._lock:
+            for feature_result_id in watch.feature_result_ids:
+                self._watches.setdefault(feature_result_id, set()).add(watch)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name="feature-result-listener", daemon=True)
+                self._thread.start()
+
+    def remove(self, watch):
+        with self._lock:
+            for feature_result_id in watch.feature_result_ids:
+                watches = self._watches.get(feature_result_id, set())
+                watches.discard(watch)
+                if not watches:
+                    self._watches.pop(feature_result_id, None)
+
+    def _notify(self, feature_result_ids):
+        with self._lock:
+            for feature_result_id in feature_result_ids:
+                for watch in self._watches.get(feature_result_id, ()):
+                    watch.event.set()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(FEATURE_RESULT_FINISHED_CHANNEL)
+                while True:
+                    # returns None after 0.5 seconds without messages, below the socket timeout of the client
+                    message = pubsub.get_message(timeout=0.5)
+                    if message and message['type'] == 'message':
+                        self._notify(json.loads(message['data']))
+            except redis.RedisError as exception:
+                logger.warning(f"Feature result notifications not available: {str(exception)}")
+                # waiting threads re-check the database, results finished meanwhile are found
+                time.sleep(5)
+            except Exception as exception:
+                logger.exception(exception)
+                time.sleep(1)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+
+feature_result_listener = FeatureResultListener()
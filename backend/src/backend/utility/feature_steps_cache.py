@@ -0,0 +1,80 @@
+"""
+Cache of the expanded steps of the features used with "Run feature with id/name"
+
+The expanded steps of a feature (its enabled steps with every sub feature replaced by its own expanded steps)
+are cached in Redis with the closure of the expansion, the ids of every feature used while expanding it, and
+the version of each of them. Versions are bumped when a feature, its steps or its name change (see Feature.save
+and backend/signals.py), a cached expansion is only used if none of the features in its closure changed.
+If Redis is not reachable the steps are expanded from the database as before.
+"""
+import json
+
+import redis
+
+from backend.utility.functions import getLogger
+from backend.utility.configurations import ConfigurationManager
+from backend.utility.versioned_cache import get_redis_client, bump_versions
+
+logger = getLogger()
+
+FEATURE_STEPS_VERSION_KEY = "cometa_feature_steps_version_%s"
+EXPANDED_STEPS_KEY = "cometa_expanded_steps_%s"
+# version of a feature which could not be read, expansions using it are not cached
+VERSION_UNAVAILABLE = "unavailable"
+
+
+def get_expanded_steps_timeout():
+    return int(ConfigurationManager.get_configuration("COMETA_EXPANDED_STEPS_CACHE_TIMEOUT", 3600))
+
+
+def get_feature_steps_version(feature_id):
+    """
+    Returns the current version of the feature, read before its steps are read so a feature saved while
+    expanding it makes the cached expansion outdated right away
+    """
+    try:
+        return get_redis_client().get(FEATURE_STEPS_VERSION_KEY % feature_id)
+    except redis.RedisError as exception:
+        logger.debug(f"Version of feature {feature_id} not available: {str(exception)}")
+        return VERSION_UNAVAILABLE
+
+
+def get_expanded_steps(feature_id):
+    """
+    Returns {"steps", "closure", "versions"} if the expansion is cached and no feature in its closure changed,
+    otherwise None, versions is {feature_id: version}
+    """
+    try:
+        client = get_redis_client()
+        document = client.get(EXPANDED_STEPS_KEY % feature_id)
+        if document is None:
+            return None
+        document = json.loads(document)
+        versions = client.mget(*[FEATURE_STEPS_VERSION_KEY % closure_id for closure_id in document["closure"]])
+    except redis.RedisError as exception:
+        logger.debug(f"Expanded steps cache not available for feature {feature_id}: {str(exception)}")
+        return None
+    if versions != document["versions"]:
+        return None
+    document["versions"] = dict(zip(document["closure"], versions))
+    return document
+
+
+def save_expanded_steps(feature_id, steps, versions):
+    """Caches the expansion, versions are the versions of the closure read before reading their steps"""
+    if VERSION_UNAVAILABLE in versions.values():
+        return
+    closure = sorted(versions)
+    try:
+        get_redis_client().set(
+            EXPANDED_STEPS_KEY % feature_id,
+            json.dumps({"steps": steps, "closure": closure, "versions": [versions[closure_id] for closure_id in closure]}),
+            ex=get_expanded_steps_timeout(),
+        )
+    except (redis.RedisError, TypeError) as exception:
+        logger.debug(f"Unable to cache expanded steps of feature {feature_id}: {str(exception)}")
+
+
+def invalidate_feature_steps(*feature_ids):
+    """Invalidates every cached expansion using the features once the current transaction is committed"""
+    bump_versions(*[FEATURE_STEPS_VERSION_KEY % feature_id for feature_id in set(feature_ids) if feature_id is not None])
@@ -0,0 +1,30 @@
+"""
+Cache of the home page tree (FolderViewset ?tree) per department
+
+The tree of a department (variables, features and folders) is built once and cached in Redis (see versioned_cache.py),
+every department has its own version, bumped by the signals in backend/signals.py when folders, features,
+steps or variables of the department change, so a change only rebuilds the tree of the affected departments.
+"""
+from backend.utility.configurations import ConfigurationManager
+from backend.utility.versioned_cache import get_versioned, bump_versions
+
+DEPARTMENT_TREE_VERSION_KEY = "cometa_folder_tree_version_%s"
+
+
+def get_folder_tree_timeout():
+    return int(ConfigurationManager.get_configuration("COMETA_FOLDER_TREE_CACHE_TIMEOUT", 600))
+
+
+def get_department_tree(department_id, max_level, build):
+    """Returns the cached tree of the department, calls build() and caches the result when the department changed"""
+    return get_versioned(
+        "cometa_folder_tree_%s_%s" % (department_id, max_level),
+        [DEPARTMENT_TREE_VERSION_KEY % department_id],
+        build,
+        get_folder_tree_timeout(),
+    )
+
+
+def invalidate_department_trees(*department_ids):
+    """Invalidates the cached trees of the departments once the current transaction is committed"""
+    bump_versions(*[DEPARTMENT_TREE_VERSION_KEY % department_id for department_id in set(department_ids) if department_id is not None])
@@ -6,7 +6,8 @@ import subprocess
 import requests
 from PIL import Image
 from backend.common import *
-from django.db.models import Sum, Value
+from django.db import transaction
+from django.db.models import Sum, Value, F
 from django.db.models.functions import Coalesce
 import asyncio
 import io
@@ -101,12 +102,51 @@ def set_test_schedule(feature_id, schedule, user_id):
     }
     return requests.post(f'{get_cometa_behave_url()}/set_test_schedule/', data=post_data)
 
+# Feature_result fields summed in Feature_Runs
+RUN_TOTAL_FIELDS = ['total', 'fails', 'ok', 'skipped', 'execution_time', 'pixel_diff']
+
 # Calculates the total values of OK, NOK, Skipped, etc for the given run
 def calculate_run_totals(run):
-    fields = ['total', 'fails', 'ok', 'skipped', 'execution_time', 'pixel_diff']
-    for field in fields:
-        setattr(run, field, run.feature_results.all().aggregate(total=Coalesce(Sum(field), Value(0)))['total'])
-    run.save()
+    with transaction.atomic():
+        # lock the run, deltas of concurrent patches are applied after the recalculation
+        list(type(run).all_objects.select_for_update().filter(pk=run.pk).values_list('pk', flat=True))
+        # all the totals in a single query, removed feature results are not counted
+        totals = run.feature_results.all().aggregate(**{field: Coalesce(Sum(field), Value(0)) for field in RUN_TOTAL_FIELDS})
+        for field in RUN_TOTAL_FIELDS:
+            setattr(run, field, totals[field])
+        run.save(update_fields=RUN_TOTAL_FIELDS)
+
+# Recalculates the totals of the runs of the feature result, fixes any drift left by the deltas
+# i.e. feature results created with totals or removed from the run
+def recalculate_feature_result_runs(feature_result):
+    for run in feature_result.feature_runs_set.all():
+        calculate_run_totals(run)
+
+# Returns the total sent in a payload as int, raises ValueError if it is not an integer instead of truncating it
+def parse_run_total(field, value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        value = int(value)
+    # bool is an int subclass
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('%s must be an integer, got %r' % (field, value))
+    return value
+
+# Applies the difference between the previous and current totals of a feature result to its runs
+# previous and current are dicts with RUN_TOTAL_FIELDS as keys, must be called inside a transaction
+def apply_run_totals_delta(feature_result, previous, current):
+    delta = {}
+    for field in RUN_TOTAL_FIELDS:
+        difference = (current.get(field) or 0) - (previous.get(field) or 0)
+        if difference:
+            delta[field] = F(field) + difference
+    if not delta:
+        return 0
+    runs = feature_result.feature_runs_set.select_for_update()
+    # lock the runs before updating, concurrent patches of other feature results of the run wait here
+    list(runs.values_list('run_id', flat=True))
+    return runs.update(**delta)
 
 # Returns a dot notation property of a given Dict
 def get_nested_dict_property(obj, properties):
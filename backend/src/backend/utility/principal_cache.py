@@ -0,0 +1,41 @@
+"""
+Cache of the serialized session user (OIDCAccountLoginSerializer) used by AuthenticationMiddleware
+
+The serializer queries permissions, clouds, departments, subscriptions ... and was executed on every request.
+The serialized user is cached in Redis (see versioned_cache.py) under a key containing two versions:
+    * user version: bumped when the account, its departments (Account_role) or subscriptions change
+    * global version: bumped when data shared by every user changes (permissions, clouds, departments, subscriptions)
+Versions are bumped by the signals in backend/signals.py.
+If Redis is not reachable the user is serialized on every request as before.
+"""
+from backend.utility.configurations import ConfigurationManager
+from backend.utility.versioned_cache import get_versioned, bump_versions
+
+GLOBAL_VERSION_KEY = "cometa_principal_version_global"
+USER_VERSION_KEY = "cometa_principal_version_user_%s"
+
+
+def get_principal_timeout():
+    # subscriptions start and end with time, the timeout limits how long an expired subscription is cached
+    return int(ConfigurationManager.get_configuration("COMETA_PRINCIPAL_CACHE_TIMEOUT", 300))
+
+
+def get_cached_principal(user_id, build):
+    """Returns the cached serialized user, calls build() and caches the result when the cache is outdated"""
+    return get_versioned(
+        "cometa_principal_%s" % user_id,
+        [GLOBAL_VERSION_KEY, USER_VERSION_KEY % user_id],
+        build,
+        get_principal_timeout(),
+    )
+
+
+def invalidate_user_principal(user_id):
+    """Invalidates the cached principal of the user once the current transaction is committed"""
+    if user_id is not None:
+        bump_versions(USER_VERSION_KEY % user_id)
+
+
+def invalidate_all_principals():
+    """Invalidates the cached principal of every user once the current transaction is committed"""
+    bump_versions(GLOBAL_VERSION_KEY)
@@ -0,0 +1,211 @@
+"""
+Queue of the feature runs sent to the behave container (/run_test/)
+
+runFeature used to start a thread per run posting to behave, the run was lost if the backend worker restarted
+or the request failed. Runs are now stored in Redis and sent by dispatcher threads:
+    * queue: runs waiting to be dispatched
+    * processing: runs being dispatched, with a lease in a hash, runs with an expired lease (worker restarted
+      while dispatching) are moved back to the queue, a run whose post was already started is not posted again
+    * delayed: sorted set of runs waiting to be retried, scored by the time of the next attempt
+    * every feature_run is queued once, a run already received by behave is not posted again
+    * only runs that could not reach behave are retried, /run_test/ enqueues the browsers before answering
+      so a run that timed out or failed in behave may have been started and is not posted again
+Every backend worker starts COMETA_RUN_DISPATCH_CONCURRENCY dispatcher threads (see cometa_pj/wsgi.py).
+Dispatch latency, retries and failures are counted in the metrics hash, see "python manage.py run_dispatch_status".
+If Redis is not reachable the run is posted from a thread as before.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+
+import redis
+import requests
+
+from backend.utility.functions import getLogger
+from backend.utility.configurations import ConfigurationManager
+from backend.utility.config_handler import get_cometa_behave_url
+from backend.utility.versioned_cache import get_redis_client
+
+logger = getLogger()
+
+QUEUE_KEY = "cometa_run_dispatch_queue"
+PROCESSING_KEY = "cometa_run_dispatch_processing"
+LEASES_KEY = "cometa_run_dispatch_leases"
+DELAYED_KEY = "cometa_run_dispatch_delayed"
+METRICS_KEY = "cometa_run_dispatch_metrics"
+FEATURE_RUN_KEY = "cometa_run_dispatch_run_%s"
+
+# moves the oldest run to processing and sets its lease in a single step
+TAKE_SCRIPT = """
+local job = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+if job then
+    redis.call('HSET', KEYS[3], job, ARGV[1])
+end
+return job
+"""
+# moves the runs to retry and the runs with an expired lease back to the queue
+REQUEUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[4], job)
+    redis.call('LPUSH', KEYS[1], job)
+end
+local expired = 0
+for _, job in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+    local lease = redis.call('HGET', KEYS[3], job)
+    if (not lease or tonumber(lease) < tonumber(ARGV[1])) and redis.call('LREM', KEYS[2], 1, job) == 1 then
+        redis.call('HDEL', KEYS[3], job)
+        redis.call('RPUSH', KEYS[1], job)
+        expired = expired + 1
+    end
+end
+return {#due, expired}
+"""
+
+_dispatcher_lock = threading.Lock()
+_dispatcher_pid = None
+
+
+def get_dispatch_settings():
+    return {
+        "concurrency": int(ConfigurationManager.get_configuration("COMETA_RUN_DISPATCH_CONCURRENCY", 4)),
+        "max_attempts": int(ConfigurationManager.get_configuration("COMETA_RUN_DISPATCH_MAX_ATTEMPTS", 5)),
+        "timeout": int(ConfigurationManager.get_configuration("COMETA_RUN_DISPATCH_TIMEOUT", 30)),
+    }
+
+
+def post_feature_run(data, timeout=None):
+    response = requests.post(f'{get_cometa_behave_url()}/run_test/', data=data, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+def dispatch_feature_run(data):
+    """Queues the run to be posted to behave, returns False if the feature_run was already queued"""
+    job = {
+        "id": uuid.uuid4().hex,
+        "feature_run": data['feature_run'],
+        "data": data,
+        "attempt": 0,
+        "queued_at": time.time(),
+    }
+    try:
+        client = get_redis_client()
+        # idempotency, a feature_run is queued once
+        if not client.set(FEATURE_RUN_KEY % data['feature_run'], "queued", nx=True, ex=86400):
+            logger.warning(f"Feature run {data['feature_run']} is already queued, ignoring it")
+            return False
+        client.lpush(QUEUE_KEY, json.dumps(job))
+    except redis.RedisError as exception:
+        logger.warning(f"Run dispatch queue not available, posting feature run {data['feature_run']} directly: {str(exception)}")
+        threading.Thread(target=post_feature_run, args=(data,), daemon=True).start()
+        return True
+    start_dispatcher()
+    return True
+
+
+def start_dispatcher():
+    """Starts the dispatcher threads of the current process, once"""
+    global _dispatcher_pid
+    with _dispatcher_lock:
+        # threads are not copied when the process is forked
+        if _dispatcher_pid == os.getpid():
+            return
+        _dispatcher_pid = os.getpid()
+        concurrency = get_dispatch_settings()["concurrency"]
+        for index in range(concurrency):
+            threading.Thread(target=_dispatcher_loop, name=f"run-dispatcher-{index}", daemon=True).start()
+    logger.debug(f"Started {concurrency} run dispatcher threads in process {_dispatcher_pid}")
+
+
+def get_dispatch_metrics():
+    client = get_redis_client()
+    metrics = client.hgetall(METRICS_KEY)
+    metrics.update({
+        "queued": client.llen(QUEUE_KEY),
+        "processing": client.llen(PROCESSING_KEY),
+        "delayed": client.zcard(DELAYED_KEY),
+    })
+    return metrics
+
+
+def _dispatcher_loop():
+    client = get_redis_client()
+    take = client.register_script(TAKE_SCRIPT)
+    requeue = client.register_script(REQUEUE_SCRIPT)
+    last_requeue = 0
+    while True:
+        try:
+            settings = get_dispatch_settings()
+            now = time.time()
+            if now - last_requeue > 1:
+                last_requeue = now
+                due, expired = requeue(keys=[QUEUE_KEY, PROCESSING_KEY, LEASES_KEY, DELAYED_KEY], args=[now])
+                if expired:
+                    logger.warning(f"Moved {expired} feature runs with an expired lease back to the run dispatch queue")
+            # lease covers the request and the bookkeeping after it
+            raw_job = take(keys=[QUEUE_KEY, PROCESSING_KEY, LEASES_KEY], args=[now + settings["timeout"] * 2])
+            if raw_job is None:
+                time.sleep(0.2)
+                continue
+            _dispatch(client, raw_job, settings)
+        except redis.RedisError as exception:
+            logger.warning(f"Run dispatch queue not available: {str(exception)}")
+            time.sleep(5)
+        except Exception as exception:
+            logger.exception(exception)
+            time.sleep(1)
+
+
+def _acknowledge(pipeline, raw_job):
+    pipeline.lrem(PROCESSING_KEY, 1, raw_job)
+    pipeline.hdel(LEASES_KEY, raw_job)
+
+
+def _dispatch(client, raw_job, settings):
+    job = json.loads(raw_job)
+    feature_run_key = FEATURE_RUN_KEY % job["feature_run"]
+    # the worker posting the run was restarted before acknowledging it
+    state = client.get(feature_run_key)
+    if state in ("dispatched", "posting"):
+        with client.pipeline() as pipeline:
+            _acknowledge(pipeline, raw_job)
+            # behave may have started the run before the worker was restarted
+            if state == "posting":
+                logger.error(f"Feature run {job['feature_run']} was being posted when its worker was restarted, not posting it again")
+                pipeline.hincrby(METRICS_KEY, "failed", 1)
+            pipeline.execute()
+        return
+
+    client.set(feature_run_key, "posting", ex=86400)
+    try:
+        post_feature_run(job["data"], timeout=settings["timeout"])
+    except requests.RequestException as exception:
+        job["attempt"] += 1
+        # the connection could not be established, behave never received the run (ConnectTimeout is a ConnectionError)
+        unreached = isinstance(exception, requests.ConnectionError)
+        with client.pipeline() as pipeline:
+            _acknowledge(pipeline, raw_job)
+            if unreached and job["attempt"] < settings["max_attempts"]:
+                pipeline.set(feature_run_key, "queued", ex=86400)
+                backoff = min(2 ** job["attempt"], 60)
+                logger.warning(f"Unable to dispatch feature run {job['feature_run']} (attempt {job['attempt']}), retrying in {backoff}s: {str(exception)}")
+                pipeline.zadd(DELAYED_KEY, {json.dumps(job): time.time() + backoff})
+                pipeline.hincrby(METRICS_KEY, "retried", 1)
+            else:
+                logger.error(f"Unable to dispatch feature run {job['feature_run']} after {job['attempt']} attempts, not retrying: {str(exception)}")
+                pipeline.hincrby(METRICS_KEY, "failed", 1)
+            pipeline.execute()
+        return
+
+    latency = time.time() - job["queued_at"]
+    with client.pipeline() as pipeline:
+        pipeline.set(feature_run_key, "dispatched", ex=86400)
+        _acknowledge(pipeline, raw_job)
+        pipeline.hincrby(METRICS_KEY, "dispatched", 1)
+        pipeline.hincrbyfloat(METRICS_KEY, "latency_total_seconds", latency)
+        pipeline.hset(METRICS_KEY, "last_latency_seconds", latency)
+        pipeline.execute()
+    logger.info(f"Feature run {job['feature_run']} dispatched {latency:.3f}s after being queued (attempt {job['attempt'] + 1})")
@@ -0,0 +1,30 @@
+"""
+Notifications sent to the scheduler (backend/scheduler) when a Schedule changes
+
+The scheduler keeps a fingerprint of every schedule and only updates the jobs which changed,
+a notification makes it fetch /api/schedule/ right away instead of waiting for its minute poll.
+Notifications are sent once the transaction is committed and from a thread, a scheduler
+not reachable does not fail the change, the minute poll picks it up.
+"""
+import threading
+
+import requests
+from django.db import transaction
+
+from backend.utility.functions import getLogger
+from backend.utility.config_handler import get_cometa_crontab_url
+
+logger = getLogger()
+
+
+def _notify(schedule_ids):
+    try:
+        requests.get(f'{get_cometa_crontab_url()}/', params={"schedule_id": schedule_ids}, timeout=5)
+    except requests.RequestException as exception:
+        logger.warning(f"Unable to notify the scheduler about schedules {schedule_ids}: {str(exception)}")
+
+
+def notify_schedules_changed(*schedule_ids):
+    """Notifies the scheduler once the current transaction is committed"""
+    schedule_ids = [schedule_id for schedule_id in schedule_ids if schedule_id is not None]
+    transaction.on_commit(lambda: threading.Thread(target=_notify, args=(schedule_ids,), daemon=True).start())
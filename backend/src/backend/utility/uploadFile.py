@@ -1,9 +1,10 @@
-from itertools import islice
+from contextlib import contextmanager
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from django.core.files.uploadedfile import UploadedFile
 from django.core.files import temp as tempfile
 from django.conf import settings
+from django.db import transaction
 import subprocess, magic, os, sys, requests, re, json
 from backend.common import UPLOADS_FOLDER
 from backend.models import File, FileData
@@ -80,25 +81,122 @@ def decryptFile(source):
     except Exception as err:
         raise Exception(str(err))
 
+@contextmanager
+def decryptedFileStream(source):
+    """
+    Yields the decrypted content of the file as a stream, nothing is written to disk.
+    Only usable for files read sequentially (CSV), Excel files are zip archives and need decryptFile.
+    """
+    COMETA_UPLOAD_ENCRYPTION_PASSPHRASE = ConfigurationManager.get_configuration('COMETA_UPLOAD_ENCRYPTION_PASSPHRASE','')
+
+    logger.debug(f"Decrypting source {source} as a stream")
+
+    process = subprocess.Popen(
+        ["gpg", "--batch", "--passphrase", COMETA_UPLOAD_ENCRYPTION_PASSPHRASE, "--output", "-", "-d", source],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+    def checkDecryption():
+        # read whatever the reader left, gpg checks the integrity of the file at the end
+        while process.stdout.read(65536):
+            pass
+        errOutput = process.stderr.read().decode('utf-8')
+        if process.wait() > 0:
+            logger.error(errOutput)
+            raise Exception('Failed to decrypt the file, please contact an administrator.')
+
+    try:
+        try:
+            yield process.stdout
+        except Exception:
+            # a failed decryption leaves the output empty or truncated and the parser fails first,
+            # the decryption error is raised instead of the parsing error
+            checkDecryption()
+            raise
+        checkDecryption()
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+
+# rows inserted per query when saving the content of a file
+FILE_DATA_BATCH_SIZE = 5000
+
 def getFileContent(file: File, sheet_name=None):
-    # decrypt file
-    targetPath = decryptFile(file.path)
+    """
+    Parses the file and saves its rows as FileData, returns the queryset of the saved rows.
+    Rows are read and inserted chunk by chunk, the whole file is never held in memory.
+    """
+    is_csv = file.name.lower().endswith('.csv')
+    # CSV files are parsed directly from the output of gpg, Excel files need a decrypted copy
+    targetPath = None if is_csv else decryptFile(file.path)
 
     try:
-        # Use the new excel handler
-        excel_handler = create_excel_handler(targetPath)
-        
-        # Check all sheets for DDR status if not already done
-        if 'ddr_sheets' not in file.extras:
-            ddr_check = excel_handler.check_all_sheets_ddr_status()
-            file.extras['ddr_sheets'] = ddr_check.get('ddr_sheets', [])
-            file.extras['sheet_details'] = ddr_check.get('sheet_details', {})
-        
-        result = excel_handler.process_file(sheet_name=sheet_name)
+        if is_csv:
+            # the name is only used to detect the file type
+            excel_handler = create_excel_handler(file.name)
+            with decryptedFileStream(file.path) as stream:
+                result = saveFileContent(file, excel_handler, sheet_name, stream)
+        else:
+            excel_handler = create_excel_handler(targetPath)
+            # Check all sheets for DDR status if not already done
+            if 'ddr_sheets' not in file.extras:
+                ddr_check = excel_handler.check_all_sheets_ddr_status()
+                file.extras['ddr_sheets'] = ddr_check.get('ddr_sheets', [])
+                file.extras['sheet_details'] = ddr_check.get('sheet_details', {})
+            result = saveFileContent(file, excel_handler, sheet_name)
+
+        logger.info(f"Saved {result['row_count']} rows of file {file.name}")
+        file_sheet_name = None if is_csv else result['metadata']['selected_sheet']
+        return FileData.objects.filter(file=file, sheet=file_sheet_name).order_by('id')
         
+    except Exception as e:
+        logger.error(f"Error processing file {file.name}: {str(e)}")
+        file.extras['ddr'] = {
+            'data-driven-ready': False,
+            'reason': str(e)
+        }
+        file.file_type = 'normal'
+        file.save()
+        raise Exception(str(e))
+    finally:
+        if targetPath is not None and os.path.exists(targetPath):
+            os.remove(targetPath)
+
+def saveFileContent(file: File, excel_handler, sheet_name=None, stream=None):
+    """
+    Inserts the rows of the file chunk by chunk and updates the file metadata in a single transaction,
+    a file failing half way does not keep part of its rows.
+    """
+    is_csv = file.name.lower().endswith('.csv')
+    result = {}
+    with transaction.atomic():
+        for records in excel_handler.iter_processed_chunks(result, sheet_name=sheet_name, chunk_size=FILE_DATA_BATCH_SIZE, stream=stream):
+            # Determine the sheet name to use for FileData objects
+            file_sheet_name = None if is_csv else result['metadata']['selected_sheet']
+            FileData.objects.bulk_create(
+                [FileData(file=file, data=data, sheet=file_sheet_name) for data in records],
+                FILE_DATA_BATCH_SIZE
+            )
+
+        metadata = result['metadata']
+        # same result as check_all_sheets_ddr_status, CSV files are not read a second time
+        if is_csv and 'ddr_sheets' not in file.extras:
+            is_ddr = 'feature_id' in metadata['column_order'] or 'feature_name' in metadata['column_order']
+            file.extras['ddr_sheets'] = ['CSV'] if is_ddr else []
+            file.extras['sheet_details'] = {
+                'CSV': {
+                    'is_ddr': is_ddr,
+                    'row_count': result['row_count'],
+                    'columns': metadata['original_column_order']
+                }
+            }
+
         # Update file metadata
-        file.column_order = result['metadata']['column_order']
-        file.sheet_names = result['metadata']['sheet_names']
+        file.column_order = metadata['column_order']
+        file.sheet_names = metadata['sheet_names']
         
         # Set the data-driven ready status in the file extras
         file.extras['ddr'] = result['ddr_status']
@@ -112,41 +210,10 @@ def getFileContent(file: File, sheet_name=None):
             logger.debug(f"File {file.name} marked as normal file (file_type='normal')")
         
         # Store original column order for display purposes
-        if 'original_column_order' in result['metadata']:
-            file.extras['original_column_order'] = result['metadata']['original_column_order']
-        
-        file.save()
-
-        # Determine the sheet name to use for FileData objects
-        if file.name.lower().endswith('.csv'):
-            file_sheet_name = None
-        else:
-            file_sheet_name = result['metadata']['selected_sheet']
-
-        # Create FileData objects from processed data
-        file_data = []
-        if result['data']:
-            rows = (FileData(file=file, data=data, sheet=file_sheet_name) for data in result['data'])
-            
-            # Batch create FileData objects
-            batch_size = 100
-            while True:
-                batch = list(islice(rows, batch_size))
-                if not batch:
-                    break
-                file_data.extend(FileData.objects.bulk_create(batch, batch_size))
-
-        return file_data
+        file.extras['original_column_order'] = metadata['original_column_order']
         
-    except Exception as e:
-        logger.error(f"Error processing file {file.name}: {str(e)}")
-        file.extras['ddr'] = {
-            'data-driven-ready': False,
-            'reason': str(e)
-        }
-        file.file_type = 'normal'
         file.save()
-        raise Exception(str(e))
+    return result
 
 """
 
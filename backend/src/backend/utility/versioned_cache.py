@@ -0,0 +1,72 @@
+"""
+JSON documents cached in Redis under keys containing version counters
+
+A document is cached as <name>_<version 1>_<version 2>... where every version is a Redis counter,
+bumping a counter makes every document built with the previous value unreachable, old keys expire with their timeout.
+If Redis is not reachable the document is built on every call.
+"""
+import json
+import threading
+
+import redis
+from django.db import transaction
+
+from backend.utility.functions import getLogger
+from backend.utility.config_handler import get_cometa_redis_host, get_cometa_redis_port
+
+logger = getLogger()
+
+_redis_client = None
+_redis_client_lock = threading.Lock()
+
+
+def get_redis_client():
+    global _redis_client
+    with _redis_client_lock:
+        if _redis_client is None:
+            _redis_client = redis.Redis(
+                host=get_cometa_redis_host(),
+                port=int(get_cometa_redis_port()),
+                db=0,
+                socket_keepalive=True,
+                socket_timeout=1,
+                decode_responses=True,
+            )
+    return _redis_client
+
+
+def get_versioned(name, version_keys, build, timeout):
+    """Returns the document cached for the current versions, calls build() and caches the result when outdated"""
+    try:
+        client = get_redis_client()
+        versions = client.mget(*version_keys)
+        key = "_".join([name] + [str(version or 0) for version in versions])
+        document = client.get(key)
+        if document is not None:
+            return json.loads(document)
+    except redis.RedisError as exception:
+        logger.debug(f"Versioned cache not available, building {name}: {str(exception)}")
+        return build()
+
+    document = build()
+    try:
+        client.set(key, json.dumps(document), ex=timeout)
+    except (redis.RedisError, TypeError) as exception:
+        logger.debug(f"Unable to cache {name}: {str(exception)}")
+    return document
+
+
+def _bump(version_keys):
+    try:
+        pipeline = get_redis_client().pipeline(transaction=False)
+        for version_key in version_keys:
+            pipeline.incr(version_key)
+        pipeline.execute()
+    except redis.RedisError as exception:
+        logger.warning(f"Unable to invalidate cached documents {version_keys}: {str(exception)}")
+
+
+def bump_versions(*version_keys):
+    """Bumps the versions once the current transaction is committed, documents built before are not read anymore"""
+    if version_keys:
+        transaction.on_commit(lambda: _bump(version_keys))
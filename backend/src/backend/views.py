@@ -2,7 +2,6 @@
 from itertools import islice
 
 from backend.ee.modules.security.models import ResponseHeaders
-from backend.ee.modules.security.serializers import ResponseHeadersSerializer
 from backend.models import *
 # Import all serializers 
 from backend.serializers import *
@@ -54,7 +53,10 @@ from backend.common import *
 from slugify import slugify
 from django.db.models import Q
 from django.db.models import Avg, Sum  # needed for CometaUsage calcs
-from django.db import connection
+from django.db.models import Subquery, OuterRef, Window, F, JSONField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lag, Lead
+from django.db import connection, transaction
 import secrets, traceback
 from openpyxl import Workbook
 import base64
@@ -68,6 +70,13 @@ from backend.utility.config_handler import *
 # from silk.profiling.profiler import silk_profile
 from modules.container_service.service_manager import DockerServiceManager, ServiceManager, remove_running_containers
 from backend.utility.timezone_utils import convert_cron_to_utc, recalculate_schedule_if_needed
+from backend.utility.principal_cache import invalidate_user_principal, invalidate_all_principals
+from backend.utility.folder_tree import get_department_tree
+from backend.utility.feature_steps_cache import invalidate_feature_steps
+from backend.utility.feature_files_cache import remove_cached_feature_files
+from backend.utility.run_dispatch_queue import dispatch_feature_run
+from backend.utility.schedule_notifications import notify_schedules_changed
+from backend.utility.feature_result_events import publish_feature_results_finished
 import logging
 
 from backend.ee.modules.notification.models import FeatureTelegramOptions
@@ -77,6 +86,8 @@ BROWSERSTACK_USERNAME = ConfigurationManager.get_configuration('COMETA_BROWSERST
 BROWSERSTACK_PASSWORD = ConfigurationManager.get_configuration('COMETA_BROWSERSTACK_PASSWORD', '')
 DOMAIN = ConfigurationManager.get_configuration('COMETA_DOMAIN', '')
 ENCRYPTION_START = ConfigurationManager.get_configuration('COMETA_ENCRYPTION_START', '')
+# number of last feature results used to know which selector type found each selector
+SELECTOR_STRATEGIES_RESULTS = 5
 
 logger = getLogger()
 
@@ -851,6 +862,10 @@ def removeTemplate(request, *args, **kwargs):
     try:
         # Remove the PNG
         os.remove(file)
+        # Remove the template signature (perceptual hash and tile checksums) saved by behave next to it
+        signature_file = os.path.splitext(file)[0] + '.json'
+        if os.path.isfile(signature_file):
+            os.remove(signature_file)
         # Update database
         step_result.update(screenshot_template='')
         return JsonResponse({'success': True})
@@ -1019,11 +1034,6 @@ def downloadFeatureFiles(request, filepath, *args, **kwargs):
     raise Http404
 
 
-# Sends the request to behave without waiting
-def startFeatureRun(data):
-    result = requests.post(f'{get_cometa_behave_url()}/run_test/', data=data)
-
-
 @csrf_exempt
 def viewRunStatus(request, feature_id):
     # Verify feature id exists
@@ -1482,9 +1492,8 @@ def runFeature(request, feature_id, data={}, additional_variables=list):
     }
 
     try:
-        # Spawn thread to launch feature run
-        t = Thread(target=startFeatureRun, args=(datum,))
-        t.start()
+        # queue the feature run, it is posted to behave by the run dispatcher
+        dispatch_feature_run(datum)
 
         return {
             'success': True,
@@ -1617,6 +1626,124 @@ def GetStepsByName(request):
         return JsonResponse({'results': []})
 
 
+def save_step_results(feature_result_id, steps):
+    """
+    Saves step results of a feature result calculating the relative_execution_time of each one
+    relative times are calculated in a single pass ordered by step_execution_sequence,
+    starting from the last step already saved before the first received step
+    """
+    steps = sorted(steps, key=lambda step: step.get('step_execution_sequence', 0))
+    if not steps:
+        return []
+
+    # relative time of the step saved right before the received ones, 0 if this is the first step of the execution
+    last_step = Step_result.objects.filter(
+        feature_result_id=feature_result_id,
+        step_execution_sequence__lt=steps[0].get('step_execution_sequence', 0)
+    ).order_by('-step_execution_sequence').values_list('relative_execution_time', flat=True).first()
+    relative_execution_time = last_step or 0
+
+    step_results = []
+    for step in steps:
+        step['feature_result_id'] = feature_result_id
+        if not isinstance(step.get('files', []), list):
+            step['files'] = json.loads(step['files'])
+        relative_execution_time += step.get('execution_time', 0)
+        step['relative_execution_time'] = relative_execution_time
+        step_results.append(Step_result(**step))
+
+    return Step_result.objects.bulk_create(step_results)
+
+
+def serialize_step_results(step_results, feature_result_id, offset=0):
+    """
+    Serializes a page of step results of a feature result with the features they belong to and their network responses
+    features are loaded in a single query, offset is the position of the first step of the page in the feature result
+    """
+    feature_ids = {step_result.belongs_to for step_result in step_results}
+    features = {
+        feature['feature_id']: feature
+        for feature in BasicFeatureInfoSerializer(Feature.objects.filter(feature_id__in=feature_ids).only('feature_id', 'feature_name'), many=True).data
+    }
+    serialized = StepResultSerializer(step_results, many=True, context={'features': features}).data
+    # Checking if step has some response stored, responses are saved by behave in the order of the steps
+    responses = ResponseHeaders.objects.filter(result_id=feature_result_id).values_list('responses', flat=True).first()
+    if responses:
+        logger.debug("Adding network response to steps")
+        for step, response in zip(serialized, responses[offset:offset + len(serialized)]):
+            step['network_response'] = response.get('responses_and_vulnerable_header')
+            step['vulnerability_headers_count'] = response.get('vulnerability_headers_count')
+    return serialized
+
+
+def get_step_result_neighbours(step_result):
+    """
+    Returns the ids of the previous and next step results of the same feature result ordered by step_execution_sequence,
+    calculated in the database with LAG / LEAD instead of loading every step result
+    """
+    execution_order = [F('step_execution_sequence').asc(), F('step_result_id').asc()]
+    steps = Step_result.objects.filter(feature_result_id=step_result.feature_result_id).annotate(
+        previous=Window(expression=Lag('step_result_id'), order_by=execution_order),
+        next=Window(expression=Lead('step_result_id'), order_by=execution_order),
+    ).order_by().values('step_result_id', 'previous', 'next')
+    # window annotations can not be filtered by django, the window query is used as a subquery
+    sql, params = steps.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT previous, next FROM ({sql}) AS steps WHERE step_result_id = %s", [*params, step_result.step_result_id])
+        row = cursor.fetchone()
+    return row if row else (None, None)
+
+
+@csrf_exempt
+def bulkCreateStepResults(request, feature_result_id):
+    """
+    Saves all step results sent in a single request, used by behave to avoid one request per step
+    body: {"step_results": [{...step result...}, ...]}
+    If the batch can not be saved the step results are saved one by one, the invalid ones are returned in "failed"
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+    data = json.loads(request.body)
+    step_results = data.get('step_results', [])
+    try:
+        with transaction.atomic():
+            saved = len(save_step_results(int(feature_result_id), step_results))
+        failed = []
+    except Exception as err:
+        logger.warning(f"Unable to save {len(step_results)} step results for feature result {feature_result_id} at once, saving them one by one: {str(err)}")
+        saved = 0
+        failed = []
+        for step_result in sorted(step_results, key=lambda step: step.get('step_execution_sequence', 0)):
+            try:
+                with transaction.atomic():
+                    save_step_results(int(feature_result_id), [dict(step_result)])
+                saved += 1
+            except Exception as step_err:
+                logger.exception(f"Unable to save step result {step_result.get('step_execution_sequence')} for feature result {feature_result_id}")
+                failed.append({'step_execution_sequence': step_result.get('step_execution_sequence'), 'error': str(step_err)})
+        if not saved and failed:
+            return JsonResponse({'success': False, 'saved': 0, 'failed': failed}, status=400)
+    logger.debug(f"Saved {saved} step results for feature result {feature_result_id}")
+    return JsonResponse({'success': True, 'saved': saved, 'failed': failed}, status=201)
+
+
+@csrf_exempt
+def getSelectorStrategies(request, feature_id):
+    """
+    Returns the selector types that found the elements in the last executions of a feature
+    {"<belongs_to feature id>": {"<selector>": "<selector type>", ...}, ...}, newer executions win
+    """
+    last_feature_results = Feature_result.objects.filter(feature_id=feature_id).order_by('-feature_result_id').values('feature_result_id')[:SELECTOR_STRATEGIES_RESULTS]
+    step_results = Step_result.objects.filter(
+        feature_result_id__in=Subquery(last_feature_results)
+    ).exclude(selector_strategies={}).exclude(selector_strategies__isnull=True).order_by('feature_result_id', 'step_execution_sequence').values_list('belongs_to', 'selector_strategies')
+
+    selector_strategies = {}
+    for belongs_to, strategies in step_results:
+        selector_strategies.setdefault(str(belongs_to), {}).update(strategies)
+    return JsonResponse({'success': True, 'selector_strategies': selector_strategies})
+
+
 @csrf_exempt
 def updateStepScreenShotDetails(request, feature_result_id, step_execution_sequence):
     data = json.loads(request.body)
@@ -2302,6 +2429,8 @@ class AccountViewset(viewsets.ModelViewSet):
                         user_permissions=user_permission[0]
                     )
                 else:
+                    # name and email were already updated
+                    invalidate_user_principal(user_id)
                     return JsonResponse({'success': False,
                                          'error': 'You do not have permissions to set higher role than your current role.'},
                                         status=403)
@@ -2314,6 +2443,8 @@ class AccountViewset(viewsets.ModelViewSet):
                         department=department
                     )
 
+            # queryset updates do not send signals
+            invalidate_user_principal(user_id)
             # get user thats been updated
             user = OIDCAccount.objects.filter(user_id=user_id)[0]
             # send a websocket to front about the creation
@@ -2427,6 +2558,15 @@ class ActionViewSet(viewsets.ModelViewSet):
 #         return JsonResponse({'success': False, 'error': 'No feature_result_id nor feature_id specified...'}, status=400)
 
 
+# mobile devices of a feature result without container_service_details
+FEATURE_RESULT_MOBILE_SUMMARY_SQL = """
+    CASE WHEN jsonb_typeof({table}.mobile) = 'array' THEN (
+        SELECT COALESCE(jsonb_agg(device.value - 'container_service_details' ORDER BY device.position), '[]'::jsonb)
+        FROM jsonb_array_elements({table}.mobile) WITH ORDINALITY AS device(value, position)
+    ) ELSE '[]'::jsonb END
+""".format(table=Feature_result._meta.db_table)
+
+
 # FeatureResultByFeatureIdViewSet
 # ... takes parameter FeatureId and returns all results for that ID from featureResults
 # ... this enables showing all results without grouping them by featureRun
@@ -2452,28 +2592,18 @@ class FeatureResultByFeatureIdViewSet(viewsets.ModelViewSet):
             # get all the feature runs for specific run
             feature_result = self.queryset.filter(feature_id=feature_id, archived=archived).order_by('-result_date',
                                                                                                      '-feature_result_id')
+            # network counts and mobile devices are calculated in the same query as the results
+            response_headers = ResponseHeaders.objects.filter(result_id=OuterRef('pk'))
+            feature_result = feature_result.defer('log', 'mobile').annotate(
+                network_response_count=Subquery(response_headers.values('network_response_count')[:1]),
+                vulnerable_response_count=Subquery(response_headers.values('vulnerable_response_count')[:1]),
+                # Remove container_service_details from the mobile devices as it is not needed in the result page,
+                # holds container details with volume mounts information, for security reasons should be send in the frontend
+                mobile_summary=RawSQL(FEATURE_RESULT_MOBILE_SUMMARY_SQL, [], output_field=JSONField()),
+            )
             # get the amount of data per page using the queryset
             page = self.paginate_queryset(feature_result)
-            serializer = self.get_serializer(page, many=True)
-            feature_results = serializer.data
-            for result in feature_results:
-                new_mobile_results = []
-                # Remove container_service_details from the result object as it is not needed in the result page,
-                # holds container details with volume mounts information, for security reasons should be send in the frontend
-                for mobile in result["mobile"]:
-                    del mobile['container_service_details'] 
-                    new_mobile_results.append(mobile)
-                result["mobile"] = new_mobile_results
-                
-                try:
-                    response_headers = ResponseHeaders.objects.values('network_response_count',
-                                                                      'vulnerable_response_count').get(
-                        result_id=result["feature_result_id"])
-                    result["network_response_count"] = response_headers["network_response_count"]
-                    result["vulnerable_response_count"] = response_headers["vulnerable_response_count"]
-      
-                except Exception as e:
-                    pass
+            feature_results = FeatureResultListSerializer(page, many=True).data
 
             # return the data with count, next and previous pages.
             return self.get_paginated_response(feature_results)
@@ -2501,17 +2631,38 @@ class FeatureResultViewSet(viewsets.ModelViewSet):
             
         if feature_result_id:
             data = request.data
-            self.queryset.filter(feature_result_id=feature_result_id).update(**data)
-            # Update total values of run
+            # only totals sent in the payload can change the totals of the run
+            total_fields = [field for field in RUN_TOTAL_FIELDS if field in data]
             try:
-                run = self.queryset.get(feature_result_id=feature_result_id).feature_runs_set.first()
-                calculate_run_totals(run)
-            except Exception as err:
-                logger.debug('Unable to find feature run for the feature result id:', str(feature_result_id))
-                logger.error(str(err))
+                current = {field: parse_run_total(field, data[field]) for field in total_fields}
+            except ValueError as err:
+                return JsonResponse({'success': False, 'error': str(err)}, status=400)
+            if not total_fields:
+                self.queryset.filter(feature_result_id=feature_result_id).update(**data)
+            else:
+                # Update total values of run applying only the difference, the feature result row is locked
+                # so concurrent patches of the same feature result do not apply the same difference twice
+                with transaction.atomic():
+                    previous = self.queryset.select_for_update().filter(feature_result_id=feature_result_id).values(*total_fields).first()
+                    self.queryset.filter(feature_result_id=feature_result_id).update(**data)
+                    try:
+                        # savepoint, a failure updating the run must not rollback the feature result update
+                        with transaction.atomic():
+                            apply_run_totals_delta(self.queryset.get(feature_result_id=feature_result_id), previous or {}, current)
+                    except Exception as err:
+                        logger.debug('Unable to update feature run totals for the feature result id: %s' % str(feature_result_id))
+                        logger.error(str(err))
             if data.get('running', None) == False:  # check if running is set to False from data not featureResult
+                # wake up the data driven runs waiting for the feature result
+                publish_feature_results_finished(feature_result_id)
                 # get the feature_result
                 fr = self.queryset.get(feature_result_id=feature_result_id)
+                # full recalculation of the run totals once the feature result finishes, deltas only cover patched totals
+                try:
+                    recalculate_feature_result_runs(fr)
+                except Exception as err:
+                    logger.debug('Unable to recalculate feature run totals for the feature result id: %s' % str(feature_result_id))
+                    logger.error(str(err))
                 # get integrations if any
                 integrations = Integration.objects.filter(department__department_id=fr.department_id, active=True)
                 if data['success']:  # get only the after_test_execution
@@ -2626,6 +2777,8 @@ class FeatureResultViewSet(viewsets.ModelViewSet):
                     feature_run.delete()
             # finally delete the object from the database
             feature_result.delete()
+            # removed feature results are not counted in the totals of their runs
+            recalculate_feature_result_runs(feature_result)
             # return success response if all went OK
             return JsonResponse({"success": True})
         except Exception as e:
@@ -2642,26 +2795,8 @@ class StepResultViewSet(viewsets.ModelViewSet):
 
     def create(self, request, *args, **kwargs):
         # get data from request
-        # logger.debug(f"Create method started")
         data = json.loads(request.body)
-        if not isinstance(data['files'], list):
-            data['files'] = json.loads(data['files'])
-        
-        # logger.debug(f"Saving Step {data['step_name']}")
-        # logger.debug("Checking for last step")
-        last_step = Step_result.objects.filter(feature_result_id = data['feature_result_id']).order_by('-step_result_id')
-        # logger.debug("Last step result checked")
-        if last_step:
-            # This will execute if it is not the report of the execution
-            # logger.debug("Found last step relative calculating time")
-            data['relative_execution_time'] = last_step[0].relative_execution_time + data['execution_time']
-        else:
-            # This will execute if it is a first step report of the execution
-            logger.debug("Relative time Initated")
-            data['relative_execution_time'] = data['execution_time']
-        # logger.debug("Starting to save data to Step_result")
-        step_result = Step_result.objects.create(**data)
-        # logger.debug("Data saved to Step_result")
+        step_result = save_step_results(data['feature_result_id'], [data])[0]
         response = StepResultSerializer(step_result, many=False).data
         return JsonResponse(response)
     
@@ -2682,17 +2817,15 @@ class StepResultViewSet(viewsets.ModelViewSet):
             # featureRun is not necessary because is calculated in front based on featureResult
             # --------------------------
             # Get feature result id of patched step
-            feature_result_id = step_result[0].feature_result_id
-            # Get all step results in current feature result
-            step_results = Step_result.objects.filter(feature_result_id=feature_result_id)
-            # Filter successed steps
-            failed_steps = [step for step in step_results if
-                            (step.status and step.status == 'Failed') or (not step.status and not step.success)]
-            success = len(failed_steps) == 0
+            feature_result_id = step_result.values_list('feature_result_id', flat=True)[0]
+            # Check in the database if any step failed, a step fails if status was overridden to Failed
+            # or status was not overridden and the step was not successful
+            success = not Step_result.objects.filter(feature_result_id=feature_result_id).filter(
+                Q(status='Failed') | ((Q(status='') | Q(status__isnull=True)) & Q(success=False))
+            ).exists()
             
             # Get current feature result to preserve status
-            current_feature_result = self.queryset.get(feature_result_id=feature_result_id)
-            current_status = current_feature_result.status
+            current_status = Feature_result.objects.filter(feature_result_id=feature_result_id).values_list('status', flat=True).first()
             
             # Only update success field, preserve the status
             update_data = {'success': success}
@@ -2702,7 +2835,7 @@ class StepResultViewSet(viewsets.ModelViewSet):
                 update_data['success'] = False
             
             # Update feature result
-            self.queryset.filter(feature_result_id=feature_result_id).update(**update_data)
+            Feature_result.objects.filter(feature_result_id=feature_result_id).update(**update_data)
             return JsonResponse({'success': True}, status=202)
         return JsonResponse({'success': False, 'error': 'No step_result_id specified'}, status=406)
 
@@ -2721,20 +2854,10 @@ class StepResultViewSet(viewsets.ModelViewSet):
 
             # get the amount of data per page using the queryset
             page = self.paginate_queryset(queryset)
-            # serialize the data
-            serializer = StepResultSerializer(page, many=True)
-            step_result = serializer.data
-            # Checking if step has some response stored
-            try:
-                response_headers = ResponseHeaders.objects.get(result_id=feature_result_id)
-                response_headers = ResponseHeadersSerializer(response_headers)
-                logger.debug("Adding network response to steps")
-                for i, step in enumerate(response_headers.data['responses']):
-                    step_result[i]['network_response'] = step.get('responses_and_vulnerable_header')
-                    step_result[i]['vulnerability_headers_count'] = step.get('vulnerability_headers_count')
-                    # logger.debug(step_result)
-            except Exception as e:
-                pass
+            # position of the first step of the page, network responses of the page start there
+            offset = self.paginator.page.start_index() - 1 if page else 0
+            # serialize the data with the features and network responses of the steps
+            step_result = serialize_step_results(page, feature_result_id, offset)
             # return the data with count, next and previous pages.
             return self.get_paginated_response(step_result)
 
@@ -2745,29 +2868,15 @@ class StepResultViewSet(viewsets.ModelViewSet):
             logger.debug(f"StepResultViewSet: Getting details for step result {step_result_id}")
             # if step_result_id was found in the url
             # find the step_result that related to specified step_result_id
-            step_result = Step_result.objects.filter(step_result_id=step_result_id)
+            step_result = Step_result.objects.filter(step_result_id=step_result_id).first()
             # if specified step_result_id does not exists throw an error
-            if not step_result.exists():
+            if step_result is None:
                 return JsonResponse(
                     {"success": False, "error": "Unable to find step_result_id %s..." % (str(step_result_id))})
-            # get the first index from the step_results found and save it as step_result
-            step_result = step_result[0]
             # all screenshots related to step_result into queryset
             step_result.screenshots = Screenshots(step_result_id)
-            # get all steps for specific feature_result and find next step_result and previous step_result
-            steps = Step_result.objects.filter(feature_result_id=step_result.feature_result_id)
-            # get the current step_result from the steps list
-            current = list(steps).index(step_result)
-            # try to get the previous step if it throws an error means there is an index issue and can't go back and should be set to None
-            try:
-                step_result.previous = steps[current - 1].step_result_id
-            except:
-                step_result.previous = None
-            # try to get the next step if it throws an error means there is an index issue and can't go forward and should be set to None
-            try:
-                step_result.next = steps[current + 1].step_result_id
-            except:
-                step_result.next = None
+            # find previous and next step_result in the same order as the step results list, None at the edges
+            step_result.previous, step_result.next = get_step_result_neighbours(step_result)
 
             # finally build the response
             data = {
@@ -2934,11 +3043,13 @@ def UpdateStepTimeout(request, department_id, *args, **kwargs):
         features = Feature.objects.filter(department_id=department_id).values_list('feature_id', flat=True)
         # get all the steps in these features
         steps = Step.objects.filter(feature_id__in=features, timeout=step_timeout_from)
+        updated_feature_ids = list(steps.order_by('feature_id').distinct('feature_id').values_list('feature_id', flat=True))
         # get total features that will be updated
-        total_features_updated = len(
-            steps.order_by('feature_id').distinct('feature_id').values_list('feature_id', flat=True))
+        total_features_updated = len(updated_feature_ids)
         # update steps to their new timeout
         steps_updated = steps.update(timeout=step_timeout_to)
+        # steps are also cached in the expanded steps of the features running them
+        invalidate_feature_steps(*updated_feature_ids)
         return JsonResponse({
             "success": True,
             "total_features_updated": total_features_updated,
@@ -3050,6 +3161,8 @@ class DepartmentViewSet(viewsets.ModelViewSet):
         try:
             # update department with data recieved from payload
             departments.update(**data)
+            # queryset updates do not send signals
+            invalidate_all_principals()
             # send a websocket to front about the creation
             response = requests.post(f'{get_cometa_socket_url()}/sendAction', json={
                 'type': '[Departments] Update Department Info',
@@ -3368,13 +3481,15 @@ class FeatureViewSet(viewsets.ModelViewSet):
         # remove feature steps
         Step.objects.filter(feature_id=feature_id).delete()
         # Delete files in disk (not backups!)
-        featureFileName = get_feature_path(features[0])['fullPath']
+        feature_dir_info = get_feature_path(features[0])
+        featureFileName = feature_dir_info['fullPath']
         try:
             os.remove(featureFileName + '.feature')
             os.remove(featureFileName + '.json')
             os.remove(featureFileName + '_meta.json')
         except OSError:
             pass
+        remove_cached_feature_files(feature_dir_info['path'], feature_id)
         # Delete feature if feature_runs count is == 0 else don't since it contains archived data
         if len(feature.feature_runs.all()) == 0:
             feature.delete()
@@ -3492,128 +3607,150 @@ class FolderViewset(viewsets.ModelViewSet):
     serializer_class = FolderSerializer
     renderer_classes = (JSONRenderer,)
 
-    '''
-    Function find_in_dict
-        Finds key with specified value inside dictionaries
-
-    Parameters:
-        @objects    Dictionaries on which @key, @value pair are searched
-        @key        Key name that will be searched in @objects
-        @value      If @key name is found then match the value.
-
-    Return:
-        @result     Dict that contains the @key, @value pair.
-    '''
-
-    def find_in_dict(self, objects, key, value):
-        for obj in objects.values() if isinstance(objects, dict) else objects:
-            if obj[key] == value: return obj
-            result = self.find_in_dict(obj['folders'], key, value)
-            if result is not None:
-                return result
-
-    def find_in_dict_for_tree(self, objects, key, value):
-        for obj in objects.values() if isinstance(objects, dict) else objects:
-            if obj['type'] != 'folder': continue
-            if obj[key] == value: return obj
-            result = self.find_in_dict_for_tree(obj['children'], key, value)
-            if result is not None:
-                return result
-
-    def serializeResultsFromRawQueryForTree(self, departments, max_lvl):
-        logger.debug("Preparing query for recursive folder, feature lookup for tree visualisation.")
-        query = """
-            WITH RECURSIVE recursive_folders AS (
-                SELECT bf.*, 1 AS LVL
-                FROM backend_folder bf
-                WHERE bf.parent_id_id is null
-
-                UNION
-
-                SELECT bf.*, rf.LVL + 1
-                FROM backend_folder bf
-
-                    JOIN recursive_folders rf ON bf.parent_id_id = rf.folder_id and rf.LVL < %s
-            )
-            SELECT rf.*, bf.feature_id, bf.feature_name, bd.department_id as d_id, bd.department_name
-            FROM (recursive_folders rf
-                LEFT JOIN backend_folder_feature bff
-                    ON rf.folder_id = bff.folder_id)
-                FULL OUTER JOIN backend_feature bf
-                    ON bf.feature_id = bff.feature_id
-                JOIN backend_department bd
-                    ON bf.department_id = bd.department_id or rf.department_id = bd.department_id
-            WHERE
-                (
-                        ( rf.department_id IN %s and ( bf.department_id IN %s or bf.department_id is null) )
-                or
-                    ( rf.department_id is null and bf.department_id IN %s )
-                ) 
-            ORDER BY bd.department_name, bf.depends_on_others, bf.feature_name
+    def buildDepartmentTree(self, department_id, max_lvl):
+        """
+        Builds the tree of a single department with a fixed number of queries, cached by get_department_tree
+        Returns {"tree": department node, "foreign_features": {feature_id: department_id}} or None if the department is empty
+        foreign_features are features inside the folders of the department that belong to another department,
+        they are only shown to users with access to their department
         """
+        logger.debug("Building folder tree for department %s" % department_id)
+        department = Department.objects.filter(department_id=department_id).values('department_id', 'department_name').first()
+        if department is None:
+            return None
 
-        # make a raw query to folders table
-        results = Folder.objects.raw(query, [max_lvl, departments, departments, departments])
-        objectsCreated = {
-            "departments": {},
-            "folders": {}
-        }
+        # folders of the department up to max_lvl, parents are always in the same department (see Folder.save)
+        folders = {folder['folder_id']: folder for folder in Folder.objects.filter(department_id=department_id).values('folder_id', 'name', 'parent_id_id')}
+        def folder_level(folder_id, level=1):
+            parent_id = folders[folder_id]['parent_id_id']
+            if parent_id is None:
+                return level
+            if parent_id not in folders or level > max_lvl:
+                return max_lvl + 1
+            return folder_level(parent_id, level + 1)
+        folders = {folder_id: folder for folder_id, folder in folders.items() if folder_level(folder_id) <= max_lvl}
+
+        folder_features = list(Folder_Feature.objects.filter(folder_id__in=list(folders)).values_list('folder_id', 'feature_id'))
+        # features of the department in any folder, including folders of other departments, are not shown at the top level
+        features_in_folders = set(Folder_Feature.objects.filter(feature__department_id=department_id).values_list('feature_id', flat=True))
+        features = list(Feature.objects.filter(
+            Q(department_id=department_id) | Q(feature_id__in=[feature_id for _, feature_id in folder_features])
+        ).order_by('depends_on_others', 'feature_name').values('feature_id', 'feature_name', 'depends_on_others', 'department_id'))
+        if not folders and not features:
+            return None
+        feature_ids = [feature['feature_id'] for feature in features]
+
+        # "Uses" and "Used By" of every feature from a single query over the steps
+        uses, used_by = {}, {}
+        relations = Step.objects.filter(Q(feature_id__in=feature_ids) | Q(belongs_to__in=feature_ids)).filter(
+            belongs_to__isnull=False).exclude(feature_id=F('belongs_to')).values_list('feature_id', 'belongs_to').distinct()
+        for feature_id, belongs_to in relations:
+            uses.setdefault(feature_id, set()).add(belongs_to)
+            used_by.setdefault(belongs_to, set()).add(feature_id)
+        related_ids = set().union(*uses.values(), *used_by.values())
+        # same order and format as FeatureTreeSerializer
+        related = FeatureTreeSerializer(Feature.objects.filter(feature_id__in=related_ids).only('feature_id', 'feature_name'), many=True).data
+        related_order = {feature['id']: position for position, feature in enumerate(related)}
+        def related_children(ids):
+            return [related[related_order[feature_id]] for feature_id in sorted(ids & related_order.keys(), key=related_order.get)]
+
+        # variables used by every feature, same format as VariablesTreeNoFeatureSerializer
+        feature_variables = {}
+        for feature_id, variable_name, variable_value in Variable.in_use.through.objects.filter(feature_id__in=feature_ids).order_by(
+                'variable__variable_name').values_list('feature_id', 'variable__variable_name', 'variable__variable_value'):
+            feature_variables.setdefault(feature_id, []).append({"type": "variable", "name": variable_name, "value": variable_value})
+
+        feature_objects = {}
+        for feature in features:
+            feature_objects[feature['feature_id']] = {
+                "type": "feature",
+                "name": feature['feature_name'],
+                "id": feature['feature_id'],
+                "depends_on_others": feature['depends_on_others'],
+                "children": [
+                    {"name": "Uses", "type": "folder", "children": related_children(uses.get(feature['feature_id'], set()))},
+                    {"name": "Used By", "type": "folder", "children": related_children(used_by.get(feature['feature_id'], set()))},
+                    {"name": "Variables", "type": "variable", "children": feature_variables.get(feature['feature_id'], [])},
+                ]
+            }
 
-        # loop over table formatted data
-        for result in results:
-            # if folder does not already exist in folders variable add a new folder
-            if result.d_id not in objectsCreated["departments"]:
-                objectsCreated["departments"][result.d_id] = {
-                    'id': result.d_id,
-                    'name': result.department_name,
-                    'type': 'department',
-                    'children': [
-                        {
-                            "name": "Variables",
-                            "type": "variables",
-                            "children": VariablesTreeSerializer(Variable.objects.filter(department_id=result.d_id),
-                                                                many=True).data
-                        }
-                    ]
-                }
-            if result.folder_id is not None and result.folder_id not in objectsCreated["folders"]:
-                objectsCreated["folders"][result.folder_id] = {
-                    'id': result.folder_id,
-                    'parent_id': result.parent_id_id,
-                    'department': result.d_id,
-                    'name': result.name,
-                    'type': 'folder',
-                    'children': []
+        department_object = {
+            'id': department_id,
+            'name': department['department_name'],
+            'type': 'department',
+            'children': [
+                {
+                    "name": "Variables",
+                    "type": "variables",
+                    "children": VariablesTreeSerializer(Variable.objects.filter(department_id=department_id).prefetch_related('in_use'),
+                                                        many=True).data
                 }
-            # if feature_id exists that means feature belongs to folder_id
-            if result.feature_id is not None:
-                feature_object = FeatureHasSubFeatureSerializer(Feature.objects.get(feature_id=result.feature_id),
-                                                                many=False).data
-                if result.folder_id is not None:
-                    objectsCreated["folders"][result.folder_id]['children'].append(feature_object)
-                else:
-                    objectsCreated['departments'][result.d_id]['children'].append(feature_object)
+            ]
+        }
+        folder_objects = {
+            folder_id: {
+                'id': folder_id,
+                'parent_id': folder['parent_id_id'],
+                'department': department_id,
+                'name': folder['name'],
+                'type': 'folder',
+                'children': []
+            }
+            for folder_id, folder in folders.items()
+        }
 
-        # loop over all the folders with parent_id not None
-        not_none_folders = [v for k, v in objectsCreated["folders"].items() if v['parent_id'] is not None]
-        for folder in not_none_folders:
-            obj = self.find_in_dict_for_tree(objectsCreated["folders"], 'id', folder['parent_id'])
-            if obj is not None:
-                obj['children'].append(folder)
-                del objectsCreated["folders"][folder['id']]
+        # features first, then sub folders
+        foreign_features = {}
+        feature_order = {feature_id: position for position, feature_id in enumerate(feature_ids)}
+        for folder_id, feature_id in sorted(folder_features, key=lambda folder_feature: feature_order.get(folder_feature[1], -1)):
+            if feature_id not in feature_objects:
+                continue
+            folder_objects[folder_id]['children'].append(feature_objects[feature_id])
+            feature_department_id = features[feature_order[feature_id]]['department_id']
+            if feature_department_id != department_id:
+                # keys are strings so they are the same once the document is cached as JSON
+                foreign_features[str(feature_id)] = feature_department_id
+        for feature in features:
+            if feature['department_id'] == department_id and feature['feature_id'] not in features_in_folders:
+                department_object['children'].append(feature_objects[feature['feature_id']])
+        for folder_id, folder in folder_objects.items():
+            if folder['parent_id'] is None:
+                department_object['children'].append(folder)
+            else:
+                folder_objects[folder['parent_id']]['children'].append(folder)
 
-        # add all top level folders to the department childrens
-        folders = [v for k, v in objectsCreated["folders"].items() if v['parent_id'] is None]
-        for folder in folders:
-            objectsCreated['departments'][folder['department']]['children'].append(folder)
-            del objectsCreated["folders"][folder['id']]
+        return {"tree": department_object, "foreign_features": foreign_features}
+
+    def removeForeignFeatures(self, node, foreign_features, departments):
+        # removes features of departments the user has no access to from the folders
+        for child in node['children']:
+            # "Uses" / "Used By" nodes of the features are folders without id
+            if child['type'] != 'folder' or 'id' not in child:
+                continue
+            child['children'] = [
+                x for x in child['children']
+                if x['type'] != 'feature' or foreign_features.get(str(x['id'])) in (None, *departments)
+            ]
+            self.removeForeignFeatures(child, foreign_features, departments)
+
+    def serializeResultsFromRawQueryForTree(self, departments, max_lvl):
+        logger.debug("Preparing cached folder, feature tree for tree visualisation.")
+        departments_objects = []
+        # departments ordered by name as in the home page
+        for department_id in Department.objects.filter(department_id__in=departments).order_by('department_name').values_list('department_id', flat=True):
+            document = get_department_tree(department_id, max_lvl, lambda: self.buildDepartmentTree(department_id, max_lvl))
+            if document is None:
+                continue
+            if document['foreign_features']:
+                self.removeForeignFeatures(document['tree'], document['foreign_features'], departments)
+            departments_objects.append(document['tree'])
 
         logger.debug("Finished recursive lookup")
 
         return {
             "name": "Home",
             "type": "home",
-            "children": objectsCreated['departments'].values()
+            "children": departments_objects
         }
 
     '''
@@ -3647,10 +3784,11 @@ class FolderViewset(viewsets.ModelViewSet):
             # if feature_id exists that means feature belongs to folder_id
             if result.feature_id is not None:
                 folders[result.folder_id]['features'].append(result.feature_id)
-        # loop over all the folders with parent_id not None
+        # loop over all the folders with parent_id not None, parents are looked up by id
+        all_folders = dict(folders)
         not_none_folders = [v for k, v in folders.items() if v['parent_id'] is not None]
         for folder in not_none_folders:
-            obj = self.find_in_dict(folders, 'folder_id', folder['parent_id'])
+            obj = all_folders.get(folder['parent_id'])
             if obj is not None:
                 obj['folders'].append(folder)
                 del folders[folder['folder_id']]
@@ -3688,7 +3826,12 @@ class FolderViewset(viewsets.ModelViewSet):
         # get folder_id from the GET parameters
         if 'folder_id' in kwargs:
             folder_id = kwargs['folder_id']
-            return Response(FolderSerializer(Folder.objects.filter(folder_id=folder_id), many=True).data)
+            folders = Folder.objects.filter(folder_id=folder_id)
+            # sub folders share the department of the folder, all of them are loaded at once
+            subfolders = {}
+            for folder in Folder.objects.filter(department__in=folders.values('department')).order_by('-name'):
+                subfolders.setdefault(folder.parent_id_id, []).append(folder)
+            return Response(FolderSerializer(folders, many=True, context={"subfolders": subfolders}).data)
 
         # get the departments from the session user
         departments = tuple([x['department_id'] for x in request.session['user']['departments']])
@@ -4314,6 +4457,8 @@ class ScheduleViewSet(viewsets.ModelViewSet):
 
         # save all schedules here
         cronSchedules = []
+        # structured jobs executed by the scheduler, see Schedule.get_job
+        jobs = []
 
         # loop over all schedules and generate a line of crontab
         for schedule in schedules:
@@ -4323,9 +4468,10 @@ class ScheduleViewSet(viewsets.ModelViewSet):
             cronString = "%s %s %s" % (schedule.schedule, schedule.command, schedule.comment)
             cronString = cronString.replace("<jobId>", str(schedule.id))
             cronSchedules.append(cronString)
+            jobs.append(schedule.get_job())
 
         # Return reponse
-        return JsonResponse({"success": True, "schedules": cronSchedules})
+        return JsonResponse({"success": True, "schedules": cronSchedules, "jobs": jobs})
 
     def create(self, request, *args, **kwargs):
         # get request payload
@@ -4390,6 +4536,8 @@ class ScheduleViewSet(viewsets.ModelViewSet):
         try:
             # update data with object recieved as payload
             Schedule.objects.filter(id=kwargs['id']).update(**data)
+            # update() does not send post_save
+            notify_schedules_changed(kwargs['id'])
             # return success response if all went OK
             return JsonResponse({'success': True})
         except Exception as e:
@@ -94,6 +94,8 @@ urlpatterns = [
     url(r'^removeScreenshot/', views.removeScreenshot),
     url(r'^removeTemplate/', views.removeTemplate),
     url(r'^steps/(?P<feature_result_id>[0-9]+)/(?P<step_execution_sequence>[0-9]+)/update/', views.updateStepScreenShotDetails),
+    url(r'^step_results/(?P<feature_result_id>[0-9]+)/bulk/', views.bulkCreateStepResults),
+    url(r'^selector_strategies/(?P<feature_id>[0-9]+)/', views.getSelectorStrategies),
     # url(r'^setScreenshots/(?P<step_result_id>[0-9]+)/', views.UpdateScreenshots),
     url(r'^steps/(?P<feature_id>[0-9]+)/', views.GetSteps),
     url(r'^execution_steps/(?P<feature_id>[0-9]+)/', views.GetExecutionSteps),
@@ -17,3 +17,7 @@ load_configurations()
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cometa_pj.settings")
 
 application = get_wsgi_application()
+
+# post the queued feature runs to behave, including the runs queued before the worker was restarted
+from backend.utility.run_dispatch_queue import start_dispatcher
+start_dispatcher()
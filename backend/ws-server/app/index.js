@@ -6,7 +6,8 @@ var bodyParser = require('body-parser');
 var morgan = require('morgan');
 
 /* Setup POST parser */
-app.use(bodyParser.json());
+// Batches of step events sent by behave can be bigger than the default 100kb limit
+app.use(bodyParser.json({ limit: '10mb' }));
 app.use(bodyParser.urlencoded({ extended: false }));
 
 // Save past messages as FeatureID --> FeatureRunID --> Message[]
@@ -85,6 +86,20 @@ function retrieveMessages(featureId) {
   return messagesObj[featureId];
 }
 
+// Handlers of the feature events which can also be received in batches, see /events/batch
+const batchableEvents = {};
+
+/**
+ * Registers an endpoint handler so it can be replayed by /events/batch
+ * @param eventName Name of the event, same as the last part of the endpoint URL
+ * @param handler Express handler of the endpoint
+ * @returns handler
+ */
+function batchable(eventName, handler) {
+  batchableEvents[eventName] = handler;
+  return handler;
+}
+
 /* Setup Logger */
 app.use(morgan(':method :url :status :res[content-length] - :response-time ms'));
 
@@ -179,7 +194,7 @@ app.get('/feature/:feature_id/started', (req, res) => {
 })
 
 /* WS Endpoint: Step has been begin */
-app.post('/feature/:feature_id/stepBegin', (req, res) => {
+app.post('/feature/:feature_id/stepBegin', batchable('stepBegin', (req, res) => {
   /**
    * Required GET params:
    *  - feature_id: ID of the Feature
@@ -207,10 +222,10 @@ app.post('/feature/:feature_id/stepBegin', (req, res) => {
   const messages = constructRun(+req.params.feature_id, +req.body.run_id)
   messages.push(payload);
   res.status(200).json({ success: true })
-});
+}));
 
 /* WS Endpoint: Step has more detailed info */
-app.post('/feature/:feature_id/stepDetail', (req, res) => {
+app.post('/feature/:feature_id/stepDetail', batchable('stepDetail', (req, res) => {
   /**
    * Required GET params:
    *  - feature_id: ID of the Feature
@@ -241,10 +256,10 @@ app.post('/feature/:feature_id/stepDetail', (req, res) => {
   messages.push(payload);
   console.log('WS step detailed info', +req.params.feature_id, 'Run ID', +req.body.run_id, 'Payload', payload)
   res.status(200).json({ success: true })
-})
+}))
 
 /* WS Endpoint: Step has been finished */
-app.post('/feature/:feature_id/stepFinished', (req, res) => {
+app.post('/feature/:feature_id/stepFinished', batchable('stepFinished', (req, res) => {
   /**
    * Required GET params:
    *  - feature_id: ID of the Feature
@@ -307,6 +322,36 @@ app.post('/feature/:feature_id/stepFinished', (req, res) => {
   messages.push(payload);
   console.log('WS finished step', +req.params.feature_id, 'Run ID', +req.body.run_id, 'Payload', payload)
   res.status(200).json({ success: true })
+}))
+
+/* WS Endpoint: Several feature events in a single request, sent by behave */
+app.post('/events/batch', (req, res) => {
+  /**
+   * Required POST params:
+   *  - events: Array of { feature_id, event, sequence, data }
+   *    event is the name of a batchable endpoint (stepBegin, stepDetail, stepFinished)
+   *    data is the same body that endpoint expects, events are processed in the received order
+   */
+  const events = req.body.events || [];
+  // events responses are not sent to behave, only the result of the whole batch
+  const eventResponse = { status: () => eventResponse, json: () => eventResponse };
+  let processed = 0;
+  const failed = [];
+  for (const event of events) {
+    const handler = batchableEvents[event.event];
+    if (!handler) {
+      failed.push({ event: event.event, sequence: event.sequence, error: 'Unknown event' });
+      continue;
+    }
+    try {
+      handler({ params: { feature_id: event.feature_id }, body: event.data || {} }, eventResponse);
+      processed++;
+    } catch (err) {
+      console.log('Unable to process batched event', event.event, err);
+      failed.push({ event: event.event, sequence: event.sequence, error: err.message });
+    }
+  }
+  res.status(200).json({ success: failed.length === 0, processed, failed })
 })
 
 /* WS Endpoint: Feature has just finished and data is being processed */
@@ -1,5 +1,5 @@
 from rq import Queue
-from rq import Worker, Queue, Connection
+from rq import SimpleWorker, Queue, Connection
 from src.connections.redis_connection import (
     connect_redis,
     REDIS_IMAGE_ANALYSYS_QUEUE_NAME,
@@ -18,7 +18,9 @@ def start_worker():
             Queue(REDIS_IMAGE_ANALYSYS_QUEUE_NAME, connection=REDIS_CONNECTION, is_async=False),
             Queue(REDIS_CHATBOT_QUEUE_NAME, connection=REDIS_CONNECTION)
         ]
-        worker = Worker(queues)
+        # jobs run in the worker process instead of a forked process per job,
+        # the RAG engine of the chatbot is created once and reused by every job
+        worker = SimpleWorker(queues)
         worker.work()
 
 
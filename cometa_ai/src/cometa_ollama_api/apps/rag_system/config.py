@@ -15,6 +15,10 @@ MIN_RELEVANCE_THRESHOLD = 0.4  # Increased from 0.2 for better precision
 DEFAULT_NUM_RESULTS = 5  # Increased from 3 for more context
 INITIAL_K_MULTIPLIER = 3  # Increased for better initial retrieval
 MIN_INITIAL_K = 15  # Increased from 10
+# Seconds between the health checks of the RAG engine shared by the chatbot worker (see rag_context.py)
+RAG_HEALTH_CHECK_INTERVAL = 60
+# Seconds before creating the RAG engine again when the vector store was not available
+RAG_RECONNECT_INTERVAL = 30
 
 # Vector Store Configuration
 DEFAULT_CHROMA_PATH = "/app/data/chromadb"
@@ -0,0 +1,87 @@
+"""
+Process wide RAG engine used by the chatbot workers.
+
+Creating a RAGEngine opens the persistent ChromaDB client and collection, which took most of the
+time of every chat request. The engine is created on the first chat of the worker process and
+reused by every following job:
+1. The engine is checked every RAG_HEALTH_CHECK_INTERVAL seconds (the collection is replaced when
+   the documents are ingested again), an engine failing the check is created again
+2. An engine which could not be created is retried after RAG_RECONNECT_INTERVAL seconds, chats
+   are answered without RAG meanwhile
+3. Forked processes create their own engine, ChromaDB clients are not shared between processes
+"""
+import os
+import time
+import logging
+import threading
+from typing import Optional
+
+from apps.rag_system.rag_engine import RAGEngine
+from apps.rag_system.config import RAG_HEALTH_CHECK_INTERVAL, RAG_RECONNECT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class RAGContext:
+    """Lazily created RAG engine shared by the threads of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine = None
+        self._pid = None
+        self._last_check = 0.0
+        self._failed_at = None
+
+    def get_engine(self) -> Optional[RAGEngine]:
+        """
+        Get the RAG engine of the process, created on the first call.
+
+        Returns:
+            RAGEngine or None if the vector store is not available
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._pid != os.getpid():
+                self._engine = None
+                self._failed_at = None
+                self._pid = os.getpid()
+
+            if self._engine is not None and now - self._last_check >= RAG_HEALTH_CHECK_INTERVAL:
+                if self._is_healthy(self._engine):
+                    self._last_check = now
+                else:
+                    logger.warning("RAG engine failed the health check, reconnecting")
+                    self._engine = None
+
+            if self._engine is None:
+                if self._failed_at is not None and now - self._failed_at < RAG_RECONNECT_INTERVAL:
+                    return None
+                try:
+                    start = time.monotonic()
+                    self._engine = RAGEngine()
+                    self._last_check = now
+                    self._failed_at = None
+                    logger.info(f"RAG engine created for process {self._pid} in {time.monotonic() - start:.2f}s")
+                except Exception as e:
+                    logger.error(f"Could not create the RAG engine, retrying in {RAG_RECONNECT_INTERVAL}s: {e}")
+                    self._failed_at = now
+                    return None
+            return self._engine
+
+    def reset(self) -> None:
+        """Drop the current engine, the next call to get_engine creates a new one."""
+        with self._lock:
+            self._engine = None
+
+    @staticmethod
+    def _is_healthy(engine: RAGEngine) -> bool:
+        try:
+            # get_collection_count hides the errors, the collection is used directly
+            engine.vector_store.collection.count()
+            return True
+        except Exception as e:
+            logger.warning(f"RAG health check failed: {e}")
+            return False
+
+
+rag_context = RAGContext()
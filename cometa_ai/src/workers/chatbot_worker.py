@@ -14,10 +14,11 @@ from src.cometa_ollama_api.apps.rag_system.config import (
 logger = get_logger()
 
 # Optional RAG support (keeps worker functional if RAG stack is unavailable)
+# the engine is shared by every job of the worker process, see rag_context.py
 try:
-    from src.cometa_ollama_api.apps.rag_system.rag_engine import RAGEngine  # type: ignore
+    from src.cometa_ollama_api.apps.rag_system.rag_context import rag_context  # type: ignore
 except Exception:
-    RAGEngine = None  # type: ignore
+    rag_context = None  # type: ignore
 
 class ConversationMessage(TypedDict):
     role: str
@@ -76,10 +77,13 @@ def process_chat(
         messages.append({"role": "user", "content": message})
 
         # RAG context (HTML) to bias answers toward UI docs, if available
-        if RAGEngine:
+        rag = rag_context.get_engine() if rag_context else None
+        if rag:
             try:
-                rag = RAGEngine()
                 res = rag.query(f"Co.meta UI usage: {message}", num_results=4)
+                if res.get("error"):
+                    # i.e. collection replaced by a new ingestion, reconnect on the next chat
+                    rag_context.reset()
                 items = res.get("results", []) if res.get("rag_available") else []
                 keep = []
                 for it in items:
@@ -95,8 +99,9 @@ def process_chat(
                         f"<p>{(k.get('text') or '').strip()}</p>" for k in keep
                     )
                     messages.insert(1, {"role": "system", "content": ctx_html})
-            except Exception:
-                pass
+            except Exception as e:
+                logger.warning(f"RAG context not available: {e}")
+                rag_context.reset()
         
         logger.debug(f"Total messages being sent to model: {len(messages)}")
         
@@ -169,11 +169,23 @@ interface StepResult {
   screenshot_style: string;
   screenshot_difference: string;
   screenshot_template: string;
+  diff_map?: ScreenshotDiffMap;
   error: null | string;
   rest_api: number;
   healing_data?: HealeniumData;
 }
 
+// Changed tiles of the current screenshot compared with its template
+interface ScreenshotDiffMap {
+  phash_distance?: number;
+  tile_size?: number;
+  tiles?: {
+    row: number;
+    column: number;
+    pixel_diff: number;
+  }[];
+}
+
 interface BelongsTo {
   feature_id: number;
   feature_name: string;